@@ -1,35 +1,51 @@
 # agent.py
 import os
-import grpc
-import mangle_pb2
-import mangle_pb2_grpc
-from langchain.agents import Tool, initialize_agent, AgentType
+import asyncio
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import partial
+from langchain.agents import AgentExecutor, create_tool_calling_agent
+from langchain_core.tools import StructuredTool
 from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain.prompts import ChatPromptTemplate, SystemMessagePromptTemplate, HumanMessagePromptTemplate, MessagesPlaceholder
+from langchain.prompts import ChatPromptTemplate, MessagesPlaceholder
 from dotenv import load_dotenv
-from langchain.memory import ConversationBufferMemory
+from cache import buscar_respuesta, guardar_respuesta
+from cambios import abrir_registro, grabar_cambios, notificar
+from tracing import manejador_de_trazas, span
+from memoria import crear_memoria, obtener_memoria
+from router import resolver_comando
 from tts import TTS
 from tools import (
     rename_file, rename_folder, convert_image_format, search_files, 
     convert_pdf_to_word_cloudconvert, convert_pdf_to_word_local, get_datetime, 
     create_folder, delete_file, delete_folder, move_file, move_folder, 
-    create_backup, convert_word_to_pdf, read_file_content, search_in_file, 
+    create_backup, convert_word_to_pdf, read_file_content, search_in_file, search_text_in_files,
     create_zip_archive, extract_zip_archive, move_files_batch, rename_files_batch, 
-    convert_images_batch,
+    convert_images_batch, get_file_tree, fuzzy_search_files,
     # FUNCIONES MANGLE BÁSICAS:
-    consultar_base_de_conocimiento, agregar_contacto, 
+    consultar_base_de_conocimiento, registrar_contacto, 
     cargar_todos_los_contactos_desde_archivo, cargar_conocimiento_desde_archivo,
     inicializar_base_conocimiento_completa, limpiar_base_de_conocimiento,
     buscar_contactos_por_proyecto, buscar_contactos_prioritarios, 
     listar_todos_los_proyectos,
     # NUEVAS FUNCIONES DE MÉTRICAS:
-    agregar_metricas_proyecto, asignar_horas_persona_proyecto,
-    registrar_progreso_proyecto, calcular_metricas_proyecto,
+    guardar_metricas_proyecto, guardar_asignacion_proyecto,
+    guardar_progreso_proyecto, calcular_metricas_proyecto,
     detectar_proyectos_en_riesgo, calcular_carga_trabajo_equipo,
     generar_dashboard_metricas, buscar_proyectos_por_estado,
     buscar_equipo_proyecto
 )
-from schemas import ContactoInput
+from schemas import (
+    ContactoInput, SinArgumentosInput, RenombrarInput, ArchivoPdfInput, ConvertirImagenInput,
+    BuscarArchivosInput, BusquedaAproximadaInput, ArbolArchivosInput, CarpetaInput, ArchivoInput, MoverArchivoInput,
+    MoverCarpetaInput, BackupInput, ArchivoWordInput, LeerArchivoInput, BuscarEnArchivoInput, BuscarEnDocumentosInput,
+    CrearZipInput, ExtraerZipInput, MoverLoteInput, RenombrarLoteInput, ConvertirImagenesLoteInput,
+    ConsultaMangleInput, ArchivoContactosInput, ArchivoConocimientoInput, ProyectoInput,
+    EstadoProyectoInput, FechaLimiteInput, MetricasProyectoInput, AsignacionProyectoInput,
+    ProgresoProyectoInput
+)
 
 
 load_dotenv()
@@ -39,155 +55,207 @@ GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 if not GEMINI_API_KEY or GEMINI_API_KEY == "tu_api_key_de_google_gemini_aqui":
     raise ValueError("Por favor configura tu API key de Gemini en el archivo .env")
 
-# Definir las herramientas disponibles
+# Definir las herramientas disponibles. Cada herramienta declara sus argumentos
+# con un esquema de schemas.py: el modelo los envía por function calling y se
+# validan antes de ejecutar la función.
 
 tools = [
-    Tool(
+    StructuredTool.from_function(
         name="rename_file",
-        func=lambda x: rename_file(*x.split("|")),
-        description="Útil para renombrar archivos. Formato: nombre_actual|nuevo_nombre"
+        func=rename_file,
+        args_schema=RenombrarInput,
+        description="Útil para renombrar archivos."
     ),
-    Tool(
+    StructuredTool.from_function(
         name="rename_folder",
-        func=lambda x: rename_folder(*x.split("|")),
-        description="Útil para renombrar carpetas. Formato: nombre_actual|nuevo_nombre"
+        func=rename_folder,
+        args_schema=RenombrarInput,
+        description="Útil para renombrar carpetas."
     ),
-    Tool(
+    StructuredTool.from_function(
         name="convert_pdf_to_word_cloudconvert",
-        func=lambda x: convert_pdf_to_word_cloudconvert(x),
-        description="Útil para convertir archivos PDF a formato Word manteniendo formato y imágenes. La entrada debe ser la ruta al archivo PDF."
+        func=convert_pdf_to_word_cloudconvert,
+        args_schema=ArchivoPdfInput,
+        description="Útil para convertir archivos PDF a formato Word manteniendo formato y imágenes."
     ),
-    Tool(
+    StructuredTool.from_function(
         name="convert_image_format",
-        func=lambda x: convert_image_format(*x.split("|")),
-        description="Útil para convertir una imagen a otro formato (ej. jpg a png). Formato: ruta_de_la_imagen|nuevo_formato"
+        func=convert_image_format,
+        args_schema=ConvertirImagenInput,
+        description="Útil para convertir una imagen a otro formato (ej. jpg a png)."
     ),
-    Tool(
+    StructuredTool.from_function(
         name="search_files",
         func=search_files,
-        description="Útil para buscar archivos. Formato: patrón_de_búsqueda"
-    ),
-    Tool(
+        args_schema=BuscarArchivosInput,
+        description="Útil para buscar archivos por nombre."
+    ),
+    StructuredTool.from_function(
+        name="fuzzy_search_files",
+        func=fuzzy_search_files,
+        args_schema=BusquedaAproximadaInput,
+        description="Útil cuando un archivo o carpeta no aparece o el nombre parece mal escrito: devuelve los nombres más parecidos, ordenados por similitud."
+    ),
+    StructuredTool.from_function(
+        name="get_file_tree",
+        func=get_file_tree,
+        args_schema=ArbolArchivosInput,
+        description="Útil para ver el árbol completo de archivos cuando el contexto de archivos está resumido, o el de una sola carpeta."
+    ),
+    StructuredTool.from_function(
         name="get_datetime",
         func=get_datetime,
+        args_schema=SinArgumentosInput,
         description="Útil para obtener la fecha y hora actual."
     ),
-    Tool(
+    StructuredTool.from_function(
         name="convert_pdf_to_word_local",
-        func=lambda x: convert_pdf_to_word_local(x),
-        description="Convierte un PDF a Word localmente. Úsalo como alternativa si la conversión con CloudConvert falla. La entrada debe ser la ruta al archivo PDF."
+        func=convert_pdf_to_word_local,
+        args_schema=ArchivoPdfInput,
+        description="Convierte un PDF a Word localmente. Úsalo como alternativa si la conversión con CloudConvert falla."
     ),
-    Tool(
+    StructuredTool.from_function(
         name="create_folder",
         func=create_folder,
-        description="Útil para crear una nueva carpeta. La entrada debe ser el nombre de la carpeta a crear."
+        args_schema=CarpetaInput,
+        description="Útil para crear una nueva carpeta."
     ),
-    Tool(
+    StructuredTool.from_function(
         name="delete_file",
         func=delete_file,
-        description="Útil para eliminar un archivo. La entrada debe ser el nombre del archivo a eliminar."
+        args_schema=ArchivoInput,
+        description="Útil para eliminar un archivo."
     ),
-    Tool(
+    StructuredTool.from_function(
         name="delete_folder",
         func=delete_folder,
-        description="Útil para eliminar una carpeta y todo su contenido. La entrada debe ser el nombre de la carpeta a eliminar."
+        args_schema=CarpetaInput,
+        description="Útil para eliminar una carpeta y todo su contenido."
     ),
-    Tool(
+    StructuredTool.from_function(
         name="move_file",
-        func=lambda x: move_file(*x.split("|")),
-        description="Mueve un archivo a una carpeta. Formato: 'ruta_origen_completa|ruta_destino'. El origen DEBE ser la ruta completa desde el directorio de trabajo. Ejemplo: si el usuario dice 'mueve mi_archivo.txt que está en la carpeta borradores a la carpeta final', la entrada para la herramienta debe ser 'borradores/mi_archivo.txt|final'."
+        func=move_file,
+        args_schema=MoverArchivoInput,
+        description=(
+            "Mueve un archivo a una carpeta. El origen DEBE ser la ruta completa desde el directorio de trabajo. "
+            "Ejemplo: si el usuario dice 'mueve mi_archivo.txt que está en la carpeta borradores a la carpeta final', "
+            "los argumentos son file_name='borradores/mi_archivo.txt' y dest_folder='final'."
+        )
     ),
-    Tool(
+    StructuredTool.from_function(
         name="move_folder",
-        func=lambda x: move_folder(*x.split("|")),
-        description="Mueve una carpeta a otra. Formato: 'ruta_origen_completa|ruta_destino'. El origen DEBE ser la ruta completa desde el directorio de trabajo. Ejemplo: si el usuario dice 'mueve la carpeta imagenes que está dentro de prueba a la carpeta de pruebas', la entrada para la herramienta debe ser 'prueba/imagenes|carpeta de pruebas'."
+        func=move_folder,
+        args_schema=MoverCarpetaInput,
+        description=(
+            "Mueve una carpeta a otra. El origen DEBE ser la ruta completa desde el directorio de trabajo. "
+            "Ejemplo: si el usuario dice 'mueve la carpeta imagenes que está dentro de prueba a la carpeta de pruebas', "
+            "los argumentos son folder_name='prueba/imagenes' y dest_folder='pruebas'."
+        )
     ),
-    Tool(
+    StructuredTool.from_function(
         name="create_backup",
         func=create_backup,
-        description="Útil para crear un backup de un archivo o carpeta. La entrada debe ser el nombre del archivo o carpeta."
+        args_schema=BackupInput,
+        description="Útil para crear un backup de un archivo o carpeta."
     ),
-    Tool(
+    StructuredTool.from_function(
         name="convert_word_to_pdf",
         func=convert_word_to_pdf,
-        description="Útil para convertir un archivo de Word (.docx) a PDF. La entrada debe ser el nombre del archivo de Word."
+        args_schema=ArchivoWordInput,
+        description="Útil para convertir un archivo de Word (.docx) a PDF."
     ),
-    Tool(
+    StructuredTool.from_function(
         name="read_file_content",
         func=read_file_content,
-        description="Útil para leer y obtener el contenido de un archivo. Funciona con texto, código, PDFs o Word."
+        args_schema=LeerArchivoInput,
+        description="Útil para leer y obtener el contenido de un archivo. Funciona con texto, código, PDFs o Word. Si el archivo es grande devuelve solo una parte e indica desde dónde seguir; también se puede pedir un rango de líneas, páginas (PDF) o bytes."
     ),
-    Tool(
+    StructuredTool.from_function(
         name="search_in_file",
-        func=lambda x: search_in_file(x.split("|")[1], x.split("|")[0]),
-        description="Útil para buscar palabras o frases dentro de un archivo. Formato: palabra|archivo."
+        func=search_in_file,
+        args_schema=BuscarEnArchivoInput,
+        description="Útil para buscar palabras o frases dentro de un archivo."
     ),
-    Tool(
+    StructuredTool.from_function(
+        name="search_text_in_files",
+        func=search_text_in_files,
+        args_schema=BuscarEnDocumentosInput,
+        description="Útil para encontrar en qué documentos (y en qué página y línea) aparecen ciertas palabras cuando no se sabe en qué archivo están. Devuelve las líneas más relevantes de todo el espacio de trabajo."
+    ),
+    StructuredTool.from_function(
         name="create_zip_archive",
-        func=lambda x: create_zip_archive(*x.split("|")),
-        description="Útil para comprimir archivos o carpetas en un ZIP. Solo indicá qué querés comprimir y cómo querés llamar al ZIP."
+        func=create_zip_archive,
+        args_schema=CrearZipInput,
+        description="Útil para comprimir archivos o carpetas en un ZIP."
     ),
-    Tool(
+    StructuredTool.from_function(
         name="extract_zip_archive",
-        func=lambda x: extract_zip_archive(*x.split("|")),
-        description="Útil para descomprimir un archivo ZIP. Indicá el nombre del ZIP y la carpeta donde querés extraerlo."
+        func=extract_zip_archive,
+        args_schema=ExtraerZipInput,
+        description="Útil para descomprimir un archivo ZIP en una carpeta."
     ),
-    Tool(
+    StructuredTool.from_function(
         name="move_files_batch",
-        func=lambda x: move_files_batch(*x.split("|")),
-        description="Útil para mover múltiples archivos a una carpeta. Formato: 'archivo1,archivo2,...|carpeta_destino'."
+        func=move_files_batch,
+        args_schema=MoverLoteInput,
+        description="Útil para mover a otra carpeta todos los archivos de una carpeta que coincidan con un patrón (ej. '*.pdf')."
     ),
-    Tool(
+    StructuredTool.from_function(
         name="rename_files_batch",
-        func=lambda x: rename_files_batch(*x.split("|")),
-        description="Útil para renombrar múltiples archivos siguiendo un patrón. Formato: 'archivo1,archivo2,...|nuevo_nombre_base'. Los archivos serán renombrados como nuevo_nombre_base_1, nuevo_nombre_base_2, etc."
+        func=rename_files_batch,
+        args_schema=RenombrarLoteInput,
+        description="Útil para renombrar en lote los archivos de una carpeta que coincidan con un patrón, agregando un prefijo o sufijo al nombre."
     ),
-    Tool(
+    StructuredTool.from_function(
         name="convert_images_batch",
-        func=lambda x: convert_images_batch(*x.split("|")),
-        description="Útil para convertir múltiples imágenes a otro formato. Formato: 'imagen1,imagen2,...|nuevo_formato'."
+        func=convert_images_batch,
+        args_schema=ConvertirImagenesLoteInput,
+        description="Útil para convertir todas las imágenes de una carpeta de un formato a otro."
     ),
-    Tool(
+    StructuredTool.from_function(
         name="consultar_base_de_conocimiento",
         func=consultar_base_de_conocimiento,
+        args_schema=ConsultaMangleInput,
         description=(
             "Realiza consultas a la base de conocimiento Mangle. "
             "Útil para preguntas como '¿quién trabaja en Proyecto Alpha?', '¿cuáles son los contactos prioritarios?', etc. "
-            "La entrada debe ser una consulta Mangle válida, por ejemplo: 'trabaja_en(Persona, \"Proyecto Alpha\").' "
-            "o 'contacto_prioritario(X).'"
+            "La consulta debe ser Mangle válida, por ejemplo: 'trabaja_en(Persona, \"Proyecto Alpha\").' "
+            "o 'contacto_prioritario(X).' Devuelve como máximo 50 filas; si la respuesta indica que hay más, "
+            "pide la página siguiente con el argumento desde (ej. desde=50)."
         )
     ),
-    Tool(
+    StructuredTool.from_function(
         name="agregar_contacto",
-        func=agregar_contacto,
+        func=lambda **datos: registrar_contacto(ContactoInput(**datos)),
+        args_schema=ContactoInput,
         description=(
             "Agrega un nuevo contacto al archivo de contactos y a la base de conocimiento Mangle usando el esquema unificado. "
-            "Esta es la herramienta principal para añadir contactos individuales. "
-            "Formato de entrada: 'nombre, puesto, email, proyecto[, archivo_opcional]' "
-            "Ejemplo: 'Juan Pérez, Desarrollador, juan.perez@email.com, Proyecto Alpha'"
+            "Esta es la herramienta principal para añadir contactos individuales."
         )
     ),
-    Tool(
+    StructuredTool.from_function(
         name="cargar_todos_los_contactos_desde_archivo",
         func=cargar_todos_los_contactos_desde_archivo,
+        args_schema=ArchivoContactosInput,
         description=(
             "Carga TODOS los contactos desde el archivo de contactos a la base de conocimiento Mangle. "
             "Útil cuando necesitas sincronizar completamente el archivo con la base de datos. "
-            "Entrada opcional: nombre del archivo (por defecto 'contactos.txt')"
+            "Admite archivos CSV grandes (nombre, puesto, email, proyecto) e informa las filas rechazadas."
         )
     ),
-    Tool(
+    StructuredTool.from_function(
         name="cargar_conocimiento_desde_archivo",
         func=cargar_conocimiento_desde_archivo,
+        args_schema=ArchivoConocimientoInput,
         description=(
             "Carga reglas y hechos base desde un archivo .mgl a la base de conocimiento Mangle. "
-            "Útil para cargar el esquema inicial, reglas de negocio, etc. "
-            "Entrada: ruta al archivo .mgl (ej: 'conocimiento.mangle')"
+            "Útil para cargar el esquema inicial, reglas de negocio, etc."
         )
     ),
-    Tool(
+    StructuredTool.from_function(
         name="inicializar_base_conocimiento_completa",
-        func=lambda x: inicializar_base_conocimiento_completa(),  # Ignora el parámetro x
+        func=inicializar_base_conocimiento_completa,
+        args_schema=SinArgumentosInput,
         description=(
             "Inicializa completamente la base de conocimiento Mangle: "
             "1) Carga las reglas base desde conocimiento.mangle "
@@ -195,219 +263,528 @@ tools = [
             "Úsalo cuando necesites 'resetear' o 'sincronizar' todo el sistema de conocimiento."
         )
     ),
-    Tool(
+    StructuredTool.from_function(
         name="limpiar_base_de_conocimiento",
         func=limpiar_base_de_conocimiento,
+        args_schema=SinArgumentosInput,
         description=(
             "Limpia completamente la base de conocimiento Mangle (elimina todos los hechos y reglas). "
             "¡CUIDADO! Esta operación es irreversible. Úsala solo cuando el usuario lo pida explícitamente."
         )
     ),
-    Tool(
+    StructuredTool.from_function(
         name="buscar_contactos_por_proyecto",
         func=buscar_contactos_por_proyecto,
-        description=(
-            "Busca todos los contactos que trabajan en un proyecto específico. "
-            "Entrada: nombre del proyecto (ej: 'Proyecto Alpha')"
-        )
+        args_schema=ProyectoInput,
+        description="Busca todos los contactos que trabajan en un proyecto específico."
     ),
-    Tool(
-    name="buscar_contactos_prioritarios", 
-    func=lambda x: buscar_contactos_prioritarios(),  # Ignora el parámetro x
-    description=(
-        "Encuentra contactos prioritarios basado en las reglas de negocio definidas. "
-        "No requiere entrada específica."
-        )
+    StructuredTool.from_function(
+        name="buscar_contactos_prioritarios",
+        func=buscar_contactos_prioritarios,
+        args_schema=SinArgumentosInput,
+        description="Encuentra contactos prioritarios basado en las reglas de negocio definidas."
     ),
-    Tool(
-    name="listar_todos_los_proyectos",
-    func=lambda x: listar_todos_los_proyectos(),  # Ignora el parámetro x
-    description=(
-        "Lista todos los proyectos únicos en la base de conocimiento. "
-        "No requiere entrada específica."
-        )
+    StructuredTool.from_function(
+        name="listar_todos_los_proyectos",
+        func=listar_todos_los_proyectos,
+        args_schema=SinArgumentosInput,
+        description="Lista todos los proyectos únicos en la base de conocimiento."
     ),
      # ===== HERRAMIENTAS DE MÉTRICAS Y GESTIÓN DE PROYECTOS =====
-    Tool(
+    StructuredTool.from_function(
         name="agregar_metricas_proyecto",
-        func=agregar_metricas_proyecto,
-        description=(
-            "Configura métricas completas de un proyecto (fechas, presupuesto, prioridad, etc.). "
-            "Formato: 'proyecto, estado, fecha_inicio, fecha_fin, presupuesto, prioridad, horas_estimadas' "
-            "Ejemplo: 'Proyecto Gamma, activo, 2025-01-15, 2025-06-30, 75000, alta, 500'"
-        )
+        func=guardar_metricas_proyecto,
+        args_schema=MetricasProyectoInput,
+        description="Configura métricas completas de un proyecto (fechas, presupuesto, prioridad, horas estimadas)."
     ),
-    Tool(
+    StructuredTool.from_function(
         name="asignar_horas_persona_proyecto",
-        func=asignar_horas_persona_proyecto,
-        description=(
-            "Asigna una persona a un proyecto con métricas de tiempo y rol. "
-            "Formato: 'persona, proyecto, horas_semanales, porcentaje_dedicacion, rol_en_proyecto' "
-            "Ejemplo: 'Juan Pérez, Proyecto Gamma, 25, 60, desarrollador_senior'"
-        )
+        func=guardar_asignacion_proyecto,
+        args_schema=AsignacionProyectoInput,
+        description="Asigna una persona a un proyecto con métricas de tiempo y rol."
     ),
-    Tool(
+    StructuredTool.from_function(
         name="registrar_progreso_proyecto",
-        func=registrar_progreso_proyecto,
-        description=(
-            "Actualiza el progreso de un proyecto. "
-            "Formato: 'proyecto, porcentaje_completado, horas_trabajadas[, fecha_reporte]' "
-            "Ejemplo: 'Proyecto Gamma, 45, 180'"
-        )
+        func=guardar_progreso_proyecto,
+        args_schema=ProgresoProyectoInput,
+        description="Actualiza el progreso de un proyecto."
     ),
-    Tool(
+    StructuredTool.from_function(
         name="calcular_metricas_proyecto",
         func=calcular_metricas_proyecto,
-        description=(
-            "Genera un reporte completo de métricas para un proyecto específico. "
-            "Entrada: nombre del proyecto"
-        )
+        args_schema=ProyectoInput,
+        description="Genera un reporte completo de métricas para un proyecto específico."
     ),
-    Tool(
+    StructuredTool.from_function(
         name="generar_dashboard_metricas",
-        func=lambda x: generar_dashboard_metricas(),
+        func=generar_dashboard_metricas,
+        args_schema=SinArgumentosInput,
         description=(
             "Genera un dashboard completo con todas las métricas del equipo y proyectos. "
-            "Incluye alertas, estados, y resúmenes ejecutivos. No requiere entrada."
+            "Incluye alertas, estados, y resúmenes ejecutivos."
         )
     ),
-    Tool(
+    StructuredTool.from_function(
         name="detectar_proyectos_en_riesgo",
-        func=lambda x: detectar_proyectos_en_riesgo(),
-        description=(
-            "Identifica proyectos que están en riesgo basado en progreso y fechas límite. "
-            "No requiere entrada."
-        )
+        func=detectar_proyectos_en_riesgo,
+        args_schema=FechaLimiteInput,
+        description="Identifica proyectos que están en riesgo basado en progreso y fechas límite."
     ),
-    Tool(
+    StructuredTool.from_function(
         name="buscar_proyectos_por_estado",
         func=buscar_proyectos_por_estado,
-        description=(
-            "Busca proyectos filtrados por estado específico. "
-            "Entrada: estado (ej: 'activo', 'completado', 'pausado')"
-        )
+        args_schema=EstadoProyectoInput,
+        description="Busca proyectos filtrados por estado específico."
     ),
-    Tool(
+    StructuredTool.from_function(
         name="buscar_equipo_proyecto",
         func=buscar_equipo_proyecto,
-        description=(
-            "Muestra todo el equipo asignado a un proyecto específico. "
-            "Entrada: nombre del proyecto"
-        )
+        args_schema=ProyectoInput,
+        description="Muestra todo el equipo asignado a un proyecto específico."
     )
 ]
 
+
+def _error_de_validacion(error) -> str:
+    """Mensaje que recibe el modelo cuando los argumentos no pasan el esquema."""
+    detalles = "; ".join(
+        f"{'.'.join(str(c) for c in e['loc'])}: {e['msg']}" for e in getattr(error, "errors", lambda: [])()
+    )
+    return f"Error: argumentos inválidos ({detalles or error}). Corrígelos y vuelve a intentarlo."
+
+
+# ===== EJECUCIÓN EN PARALELO =====
+# Cuando el modelo pide varias herramientas en una misma respuesta, el ejecutor
+# las lanza a la vez; cada una corre en este pool. Las que tocan la misma ruta
+# de primer nivel (p. ej. 'informes' e 'informes/a.pdf') se esperan entre sí.
+HERRAMIENTAS_EN_PARALELO = 4
+_herramientas_executor = ThreadPoolExecutor(max_workers=HERRAMIENTAS_EN_PARALELO, thread_name_prefix="herramienta")
+
+# Argumentos de las herramientas que son rutas dentro del directorio de trabajo.
+_CAMPOS_RUTA = {
+    "current_name", "new_name", "pdf_path", "image_path", "carpeta", "folder_name", "file_name",
+    "dest_folder", "item_name", "word_file", "file_path", "source_list", "zip_path",
+    "destination_folder", "source_folder", "folder",
+}
+
+
+def _claves_de_ruta(nombre_herramienta: str, argumentos: dict) -> set:
+    """
+    Primer componente de cada ruta que usa la herramienta. '' representa la
+    raíz del directorio de trabajo entero (p. ej. un lote sobre la raíz).
+    """
+    claves = set()
+    for campo, valor in argumentos.items():
+        if campo not in _CAMPOS_RUTA or not isinstance(valor, str):
+            continue
+        rutas = valor.split(",") if campo == "source_list" else [valor]
+        for ruta in rutas:
+            ruta = ruta.strip().replace("\\", "/").strip("/")
+            claves.add(ruta.split("/")[0].lower() if ruta else "")
+    if nombre_herramienta == "create_backup":
+        claves.add("backups")
+    return claves
+
+
+class _ReservaDeRutas:
+    """Deja correr a la vez solo las herramientas que no comparten rutas."""
+
+    def __init__(self):
+        self._condicion = threading.Condition()
+        self._ocupadas = set()
+
+    def _choca(self, claves: set) -> bool:
+        if not self._ocupadas:
+            return False
+        if "" in claves or "" in self._ocupadas:
+            return True
+        return not claves.isdisjoint(self._ocupadas)
+
+    @contextmanager
+    def reservar(self, claves: set):
+        if not claves:
+            yield
+            return
+        with self._condicion:
+            while self._choca(claves):
+                self._condicion.wait()
+            self._ocupadas |= claves
+        try:
+            yield
+        finally:
+            with self._condicion:
+                self._ocupadas -= claves
+                self._condicion.notify_all()
+
+
+_reserva_de_rutas = _ReservaDeRutas()
+
+
+def _preparar_herramienta(herramienta: StructuredTool):
+    """
+    Valida con el esquema, reserva sus rutas, avisa de sus cambios a las cachés
+    y al índice de archivos y, en modo asíncrono, corre en el pool.
+    """
+    func = herramienta.func
+    nombre = herramienta.name
+
+    def con_reserva(**argumentos):
+        with span(f"herramienta.{nombre}", "herramienta"), \
+                _reserva_de_rutas.reservar(_claves_de_ruta(nombre, argumentos)):
+            with grabar_cambios() as cambios:
+                try:
+                    return func(**argumentos)
+                finally:
+                    # Aunque falle a mitad de camino, puede haber cambiado algo.
+                    # Las que modifican archivos avisan siempre: sin cambios
+                    # anotados, las cachés descartan todo lo que depende de los
+                    # archivos (los índices no hacen nada).
+                    if cambios or nombre in modifying_tools:
+                        notificar(cambios)
+
+    async def en_el_pool(**argumentos):
+        loop = asyncio.get_running_loop()
+        # El hilo del pool recibe una copia del contexto para que los cambios
+        # lleguen al registro del comando (ver cambios.py).
+        contexto = contextvars.copy_context()
+        return await loop.run_in_executor(
+            _herramientas_executor, partial(contexto.run, con_reserva, **argumentos))
+
+    herramienta.func = con_reserva
+    herramienta.coroutine = en_el_pool
+    herramienta.handle_validation_error = _error_de_validacion
+
+
+for herramienta in tools:
+    _preparar_herramienta(herramienta)
+
+# Instrucciones del agente. {file_structure} se completa en cada comando con el
+# contexto de archivos (ver tools.build_file_context); el resto del prompt se
+# arma una sola vez. Las herramientas no se describen aquí: se envían al modelo
+# como funciones, con sus esquemas de argumentos.
+SYSTEM_PROMPT = """Eres FileMate AI, un asistente de gestión de archivos. Tu única función es interpretar las instrucciones del usuario y ejecutar las herramientas correspondientes con los parámetros correctos. Sigue estas reglas de forma estricta.
+
+**CONTEXTO DE ARCHIVOS ACTUAL:**
+Aquí está la estructura de archivos y carpetas con la que estás trabajando. Úsala como referencia principal para localizar archivos y entender dónde están las cosas. No tienes que pedirle al usuario esta información, ya la tienes aquí. Si el espacio de trabajo es grande, verás una vista resumida (carpetas, archivos relacionados con el pedido y recientes); en ese caso usa `get_file_tree` o `search_files` para ver lo que falte:
+```
+{file_structure}
+```
+
+**REGLAS GENERALES:**
+
+1.  **Usa el Contexto:** El **CONTEXTO DE ARCHIVOS ACTUAL** es tu referencia principal para saber qué archivos existen y dónde están. Úsalo para informar tus decisiones.
+
+2.  **Mover Archivos es Sencillo:** Para mover un archivo, solo necesitas su nombre y el destino. La herramienta `move_file` es inteligente y lo buscará por ti si no está en la raíz.
+    -   **Ejemplo:** Si el usuario dice "mueve `doc.txt` a `prueba`", la acción correcta es `move_file` con `file_name="doc.txt"` y `dest_folder="prueba"`.
+
+3.  **Verificación de Nombres:**
+    -   Los nombres de archivos y carpetas deben ser **EXACTOS**.
+    -   Si sospechas de un error tipográfico (ej. "prueva" en lugar de "prueba"), **DEBES** usar la herramienta `fuzzy_search_files` para encontrar el nombre correcto antes de intentar mover nada. Con una sola llamada obtienes los nombres parecidos ordenados por similitud; no pruebes variantes con `search_files`.
+    -   Si una herramienta responde "¿Quisiste decir ...?", usa esa sugerencia solo si coincide claramente con lo que pidió el usuario; si hay dudas, pregúntale.
+    -   **NO CREES CARPETAS NUEVAS** a menos que el usuario lo pida explícitamente. Si la carpeta de destino no existe, informa al usuario.
+
+4.  **UN SOLO ORIGEN, UN SOLO DESTINO:** Cada instrucción de movimiento debe resolverse a un único origen y un único destino.
+
+5.  **VARIAS ACCIONES A LA VEZ:** Si el pedido incluye varias acciones independientes entre sí (por ejemplo, convertir `a.pdf`, `b.pdf` y `c.pdf`), pide todas las herramientas en una misma respuesta: se ejecutan en paralelo. Si una acción necesita el resultado de otra (por ejemplo, comprimir una carpeta después de convertir los archivos que van dentro), pide primero todas las que no dependen de nada y las demás cuando tengas sus resultados.
+
+**Funciones generales:**
+- Renombrar, crear, mover y eliminar archivos/carpetas.
+- Crear backups.
+- Convertir documentos e imágenes.
+- Buscar archivos.
+- Buscar texto dentro de los documentos (`search_text_in_files` para todo el espacio de trabajo, `search_in_file` para uno solo).
+- Obtener fecha y hora.
+
+Responde en español. Tu nombre es FileMate AI."""
+
+# Herramientas que modifican el sistema de archivos
+modifying_tools = [
+    "rename_file", "rename_folder", "convert_pdf_to_word_cloudconvert", 
+    "convert_image_format", "convert_pdf_to_word_local", "create_folder", 
+    "delete_file", "delete_folder", "move_file", "move_folder", 
+    "create_backup", "convert_word_to_pdf", "create_zip_archive", 
+    "extract_zip_archive", "move_files_batch", "rename_files_batch", 
+    "convert_images_batch", "agregar_contacto"
+]
+
+# El cliente del LLM y el agente (prompt + herramientas) se crean una sola vez
+# por proceso y se reutilizan en todos los comandos.
+_llm = None
+_agent = None
+_runtime_lock = threading.Lock()
+
 def initialize_llm():
-    return ChatGoogleGenerativeAI(
-        model="gemini-2.5-flash",
-        google_api_key=GEMINI_API_KEY,
-        temperature=0.7,
-        max_output_tokens=256
+    global _llm
+    if _llm is None:
+        with _runtime_lock:
+            if _llm is None:
+                _llm = ChatGoogleGenerativeAI(
+                    model="gemini-2.5-flash",
+                    google_api_key=GEMINI_API_KEY,
+                    temperature=0.7,
+                    max_output_tokens=256
+                )
+    return _llm
+
+def get_agent():
+    """Devuelve el agente (con llamadas a funciones nativas), construyéndolo la primera vez que se usa."""
+    global _agent
+    if _agent is None:
+        llm = initialize_llm()
+        with _runtime_lock:
+            if _agent is None:
+                prompt = ChatPromptTemplate.from_messages([
+                    ("system", SYSTEM_PROMPT),
+                    MessagesPlaceholder("chat_history", optional=True),
+                    ("human", "{input}"),
+                    MessagesPlaceholder("agent_scratchpad"),
+                ])
+                _agent = create_tool_calling_agent(llm, tools, prompt)
+    return _agent
+
+def _obtener_memoria(chat_history: list = None, session_id: str = None):
+    """
+    Con session_id la memoria es la de la sesión (resumida y con presupuesto
+    de tokens). Sin sesión se usa una memoria de un solo comando con la parte
+    más reciente de chat_history.
+    """
+    if session_id:
+        return obtener_memoria(session_id, initialize_llm(), chat_history)
+    return crear_memoria(initialize_llm(), chat_history, resumir=False)
+
+
+def _config_de_trazas() -> dict:
+    """Config para el ejecutor: si hay un turno de trazas abierto, registra las llamadas al LLM."""
+    manejador = manejador_de_trazas()
+    return {"callbacks": [manejador]} if manejador else {}
+
+
+def _crear_ejecutor(memory):
+    """Ejecutor para un comando; el LLM y el agente se reutilizan."""
+    return AgentExecutor(
+        agent=get_agent(),
+        tools=tools,
+        verbose=True,
+        memory=memory,
+        handle_parsing_errors=True,
+        return_intermediate_steps=True,
     )
 
-def process_command(command: str, chat_history: list = None, modo_voz: str = "Voz y texto", file_structure: str = ""):
+
+def _armar_respuesta(respuesta: str, herramientas_usadas: list, memory, cambios: list = None) -> dict:
+    """
+    Arma el diccionario que usa la interfaz a partir del texto de respuesta.
+    "changes" son los cambios anotados por todas las herramientas del comando
+    (ver cambios.py), para que la interfaz actualice solo esas rutas.
+    """
+    # Determinar si la respuesta es un mensaje de éxito o de error
+    # basado en el contenido del string que devuelven las herramientas.
+    is_success = not respuesta.lower().startswith(("error", "no pude", "no se pudo"))
+    cambios = list(cambios or [])
+
+    return {
+        "success": is_success,
+        "message": respuesta,
+        "memory": memory.load_memory_variables({}),
+        "audio_path": None,
+        "changes": cambios,
+        "files_changed": bool(cambios) or (is_success and any(h in modifying_tools for h in herramientas_usadas))
+    }
+
+
+def _respuesta_del_agente(result: dict, memory, cambios: list = None) -> dict:
+    """Convierte la salida del ejecutor en el diccionario que usa la interfaz."""
+    # Herramientas usadas según la traza del agente (pueden ser varias por paso)
+    herramientas_usadas = [accion.tool for accion, _ in result.get("intermediate_steps", [])]
+    return _armar_respuesta(str(result["output"]), herramientas_usadas, memory, cambios)
+
+
+def _guardar_en_cache(command: str, result: dict, file_structure: str) -> None:
+    """Guarda la respuesta del agente si el pedido fue de solo lectura (ver cache.py)."""
+    pasos = [(accion.tool, accion.tool_input) for accion, _ in result.get("intermediate_steps", [])]
+    guardar_respuesta(command, str(result["output"]), pasos, file_structure)
+
+
+def _respuesta_de_cache(command: str, entrada: dict, memory) -> dict:
+    """Respuesta repetida sin llamar al LLM; el turno queda igualmente en la memoria."""
+    memory.save_context({"input": command}, {"output": entrada["message"]})
+    return _armar_respuesta(entrada["message"], entrada["herramientas"], memory)
+
+
+def _respuesta_del_atajo(command: str, atajo: dict, memory, cambios: list = None) -> dict:
+    """Respuesta de un pedido resuelto por router.py; queda en la memoria como cualquier otro turno."""
+    memory.save_context({"input": command}, {"output": atajo["message"]})
+    return _armar_respuesta(atajo["message"], [atajo["tool"]], memory, cambios)
+
+
+def _mensaje_error_general(e: Exception) -> str:
+    return f"Oops, ocurrió un error general al procesar tu comando. Error: {str(e)}. ¿Podrías intentarlo de nuevo de otra manera?"
+
+
+def _respuesta_de_error(e: Exception, cambios: list) -> dict:
+    # Lo que alcanzó a cambiar antes del error también se informa.
+    cambios = list(cambios)
+    return {"success": False, "message": _mensaje_error_general(e), "changes": cambios, "files_changed": bool(cambios)}
+
+
+def process_command(command: str, chat_history: list = None, modo_voz: str = "Voz y texto", file_structure: str = "",
+                    session_id: str = None):
 
 
     """
     Procesa un comando de lenguaje natural utilizando un agente de IA para seleccionar
     y ejecutar la herramienta adecuada.
     """
+    with grabar_cambios() as cambios:
+        try:
+            respuesta = _procesar(command, chat_history, file_structure, session_id, cambios)
+        except Exception as e:
+            return _respuesta_de_error(e, cambios)
+
+    if modo_voz == "Voz y texto" and respuesta["success"]:
+        try:
+            tts = TTS()
+            respuesta["audio_path"] = tts.process(respuesta["message"])
+        except Exception as e:
+            print(f"Error al generar audio TTS: {e}")
+            # No detenemos la ejecución, solo no habrá audio.
+
+    return respuesta
+
+
+def _procesar(command: str, chat_history: list, file_structure: str, session_id: str, cambios: list) -> dict:
+    """Resuelve el comando (atajo, caché o agente) sin generar audio."""
+    memory = _obtener_memoria(chat_history, session_id)
+    # Los pedidos simples se resuelven sin pasar por el LLM.
+    atajo = resolver_comando(command)
+    if atajo:
+        return _respuesta_del_atajo(command, atajo, memory, cambios)
+    cacheada = buscar_respuesta(command, file_structure)
+    if cacheada:
+        return _respuesta_de_cache(command, cacheada, memory)
+    # Se usa el ejecutor asíncrono para que las herramientas pedidas en
+    # una misma respuesta del modelo corran en paralelo.
+    loop = asyncio.new_event_loop()
     try:
-        llm = initialize_llm()
+        result = loop.run_until_complete(
+            _crear_ejecutor(memory).ainvoke({"input": command, "file_structure": file_structure},
+                                            config=_config_de_trazas()))
+    finally:
+        loop.close()
+    _guardar_en_cache(command, result, file_structure)
+    return _respuesta_del_agente(result, memory, cambios)
 
-        memory = ConversationBufferMemory(memory_key="chat_history", return_messages=True)
-        if chat_history:
-            for message in chat_history:
-                if message['type'] == 'human':
-                    memory.chat_memory.add_user_message(message['content'])
-                else:
-                    memory.chat_memory.add_ai_message(message['content'])
-
-        # Contexto inicial del sistema
-        system_prompt = f"""Eres FileMate AI, un asistente de gestión de archivos. Tu única función es interpretar las instrucciones del usuario y ejecutar las herramientas correspondientes con los parámetros correctos. Sigue estas reglas de forma estricta.
-
-        **CONTEXTO DE ARCHIVOS ACTUAL:**
-        Aquí está la estructura de archivos y carpetas con la que estás trabajando. Úsala como referencia principal para localizar archivos y entender dónde están las cosas. No tienes que pedirle al usuario esta información, ya la tienes aquí:
-        ```
-        {file_structure}
-        ```
-
-        **REGLAS GENERALES:**
-
-        1.  **Usa el Contexto:** El **CONTEXTO DE ARCHIVOS ACTUAL** es tu referencia principal para saber qué archivos existen y dónde están. Úsalo para informar tus decisiones.
-
-        2.  **Mover Archivos es Sencillo:** Para mover un archivo, solo necesitas su nombre y el destino. La herramienta `move_file` es inteligente y lo buscará por ti si no está en la raíz.
-            -   **Ejemplo:** Si el usuario dice "mueve `doc.txt` a `prueba`", la acción correcta es `move_file` con el input `doc.txt|prueba`.
-
-        3.  **Verificación de Nombres:**
-            -   Los nombres de archivos y carpetas deben ser **EXACTOS**.
-            -   Si sospechas de un error tipográfico en el nombre de la carpeta de destino (ej. "prueva" en lugar de "prueba"), **DEBES** usar la herramienta `search_files` para buscar el nombre correcto antes de intentar mover nada.
-            -   **NO CREES CARPETAS NUEVAS** a menos que el usuario lo pida explícitamente. Si la carpeta de destino no existe, informa al usuario.
-
-        4.  **UN SOLO ORIGEN, UN SOLO DESTINO:** Cada instrucción de movimiento debe resolverse a un único origen y un único destino.
-
-        **Funciones generales:**
-        - Renombrar, crear, mover y eliminar archivos/carpetas.
-        - Crear backups.
-        - Convertir documentos e imágenes.
-        - Buscar archivos.
-        - Obtener fecha y hora.
-
-        Responde en español. Tu nombre es FileMate AI."""
-
-        agent_executor = initialize_agent(
-            tools,
-            llm,
-            agent=AgentType.CONVERSATIONAL_REACT_DESCRIPTION,
-            verbose=True,
-            memory=memory,
-            handle_parsing_errors=True,
-            agent_kwargs={
-                "system_message": system_prompt
-            }
-        )
 
-        result = agent_executor.invoke({"input": command})
-        respuesta = str(result["output"])
-
-        # Determinar si la respuesta es un mensaje de éxito o de error
-        # basado en el contenido del string que devuelven las herramientas.
-        is_success = not respuesta.lower().startswith(("error", "no pude", "no se pudo"))
-
-        # Determinar si la operación modificó el sistema de archivos
-        modifying_tools = [
-            "rename_file", "rename_folder", "convert_pdf_to_word_cloudconvert", 
-            "convert_image_format", "convert_pdf_to_word_local", "create_folder", 
-            "delete_file", "delete_folder", "move_file", "move_folder", 
-            "create_backup", "convert_word_to_pdf", "create_zip_archive", 
-            "extract_zip_archive", "move_files_batch", "rename_files_batch", 
-            "convert_images_batch"
-        ]
-        
-        # Extraer la herramienta utilizada de la traza del agente si está disponible
-        tool_used = ""
-        if "intermediate_steps" in result and result["intermediate_steps"]:
-            tool_used = result["intermediate_steps"][0][0].tool
-
-        files_changed = is_success and tool_used in modifying_tools
-
-        audio_path = None
-        if modo_voz == "Voz y texto" and is_success:
-            try:
-                tts = TTS()
-                audio_path = tts.process(respuesta)
-            except Exception as e:
-                print(f"Error al generar audio TTS: {e}")
-                # No detenemos la ejecución, solo no habrá audio.
-        
-        return {
-            "success": is_success,
-            "message": respuesta,
-            "memory": memory.load_memory_variables({}),
-            "audio_path": audio_path,
-            "files_changed": files_changed
-        }
+def _texto_entrada(entrada) -> str:
+    """Argumentos de una herramienta para mostrar en los pasos ("clave='valor', ...")."""
+    if isinstance(entrada, dict):
+        return ", ".join(f"{clave}={valor!r}" for clave, valor in entrada.items())
+    return str(entrada or "")
+
+
+def _texto_fragmento(chunk) -> str:
+    """Texto de un fragmento (o mensaje) emitido por el modelo de chat."""
+    if chunk is None:
+        return ""
+    contenido = getattr(chunk, "content", None)
+    if contenido is None:
+        contenido = getattr(chunk, "text", "")
+    if isinstance(contenido, list):
+        contenido = "".join(p.get("text", "") if isinstance(p, dict) else str(p) for p in contenido)
+    return contenido or ""
+
+
+async def aprocess_command(command: str, chat_history: list = None, file_structure: str = "",
+                           session_id: str = None):
+    """
+    Versión asíncrona de process_command que va entregando la respuesta a medida
+    que se genera. Es un generador asíncrono de eventos (diccionarios):
+
+    - {"type": "tool_start", "tool": nombre, "input": entrada}
+    - {"type": "tool_end", "tool": nombre, "output": resultado}
+    - {"type": "token", "text": fragmento}  (solo de la respuesta final)
+    - {"type": "final", "response": mismo diccionario que process_command}
+
+    El audio no se genera aquí: quien consume los tokens puede ir sintetizando
+    cada frase en cuanto se completa.
+    """
+    # Se abre antes de lanzar el agente para que sus tareas hereden el registro.
+    cambios = abrir_registro()
+    try:
+        memory = _obtener_memoria(chat_history, session_id)
+        atajo = resolver_comando(command)
+        if atajo:
+            yield {"type": "tool_start", "tool": atajo["tool"], "input": _texto_entrada(atajo["input"])}
+            yield {"type": "tool_end", "tool": atajo["tool"], "output": atajo["message"]}
+            yield {"type": "token", "text": atajo["message"]}
+            yield {"type": "final", "response": _respuesta_del_atajo(command, atajo, memory, cambios)}
+            return
+
+        cacheada = buscar_respuesta(command, file_structure)
+        if cacheada:
+            yield {"type": "token", "text": cacheada["message"]}
+            yield {"type": "final", "response": _respuesta_de_cache(command, cacheada, memory)}
+            return
+
+        agent_executor = _crear_ejecutor(memory)
+        entradas = {"input": command, "file_structure": file_structure}
+
+        raiz = None
+        result = None
+        # Llamadas al modelo que piden herramientas: su texto no es la respuesta final.
+        con_herramientas = set()
+        herramientas = {}
+
+        async for evento in agent_executor.astream_events(entradas, config=_config_de_trazas(), version="v2"):
+            tipo = evento["event"]
+            if raiz is None:
+                raiz = evento["run_id"]
+
+            if tipo == "on_chat_model_stream":
+                chunk = evento["data"].get("chunk")
+                if getattr(chunk, "tool_call_chunks", None):
+                    con_herramientas.add(evento["run_id"])
+                if evento["run_id"] in con_herramientas:
+                    continue
+                texto = _texto_fragmento(chunk)
+                if texto:
+                    yield {"type": "token", "text": texto}
+
+            elif tipo == "on_tool_start":
+                herramientas[evento["run_id"]] = evento["name"]
+                yield {"type": "tool_start", "tool": evento["name"], "input": _texto_entrada(evento["data"].get("input"))}
+
+            elif tipo == "on_tool_end":
+                salida = evento["data"].get("output")
+                yield {"type": "tool_end", "tool": herramientas.pop(evento["run_id"], evento["name"]),
+                       "output": str(_texto_fragmento(salida) if hasattr(salida, "content") else salida)}
+
+            elif tipo == "on_chain_end" and evento["run_id"] == raiz:
+                result = evento["data"].get("output")
+
+        if not isinstance(result, dict) or "output" not in result:
+            raise RuntimeError("el agente terminó sin respuesta")
+        _guardar_en_cache(command, result, file_structure)
+        yield {"type": "final", "response": _respuesta_del_agente(result, memory, cambios)}
 
     except Exception as e:
-        error_message = f"Oops, ocurrió un error general al procesar tu comando. Error: {str(e)}. ¿Podrías intentarlo de nuevo de otra manera?"
-        return {"success": False, "message": error_message, "files_changed": False}
+        yield {"type": "final", "response": _respuesta_de_error(e, cambios)}
+
+
+def iter_command_events(command: str, chat_history: list = None, file_structure: str = "",
+                        session_id: str = None):
+    """
+    Recorre aprocess_command desde código síncrono (por ejemplo, un script de
+    Streamlit), entregando cada evento en cuanto llega.
+    """
+    loop = asyncio.new_event_loop()
+    eventos = aprocess_command(command, chat_history, file_structure, session_id)
+    try:
+        while True:
+            try:
+                yield loop.run_until_complete(eventos.__anext__())
+            except StopAsyncIteration:
+                break
+    finally:
+        loop.run_until_complete(eventos.aclose())
+        loop.close()
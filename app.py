@@ -1,12 +1,20 @@
 # app.py - FileMate AI (versión final y funcional)
 import streamlit as st
 import os
+import uuid
 import speech_recognition as sr
-from agent import process_command
-from tools import get_file_structure, convert_pdf_to_word_cloudconvert, rename_file, rename_folder, convert_image_format, list_files, search_files
+from agent import iter_command_events
+from cache import cache_respuestas
+from cambios import notificar
+from indice_archivos import indice_archivos
+from indice_contenido import indice_contenido
+from memoria import reiniciar_memoria
+from router import metricas_router
+from tracing import turno, resumen as resumen_trazas, TRAZAS_ARCHIVO
+from tools import scan_file_entries, aplicar_cambios, build_file_context, convert_pdf_to_word_cloudconvert, rename_file, rename_folder, convert_image_format, list_files, search_files
 from dotenv import load_dotenv
 
-from voice_handler import speak_response
+from voice_handler import LectorPorFrases
 
 # ----------------- CARGA DE VARIABLES -----------------
 load_dotenv()
@@ -65,8 +73,10 @@ with st.sidebar:
         st.subheader("📁 Archivos de Trabajo")
 
         if st.button("🔄 Refrescar vista de archivos"):
-            if 'file_structure' in st.session_state:
-                del st.session_state['file_structure']
+            if 'file_entries' in st.session_state:
+                del st.session_state['file_entries']
+            # Los archivos pueden haber cambiado fuera de FileMate.
+            notificar()
             st.rerun()
 
         def display_files(directory, level=0):
@@ -89,15 +99,55 @@ with st.sidebar:
         if st.button("Limpiar chat", use_container_width=True):
             st.session_state.messages = []
             st.session_state.chat_history = []
+            reiniciar_memoria(st.session_state.get("session_id", ""))
             st.rerun()
 
+        estadisticas_atajos = metricas_router.estadisticas()
+        if estadisticas_atajos["pedidos"]:
+            st.caption(f"⚡ Atajos locales: {estadisticas_atajos['aciertos']} de {estadisticas_atajos['pedidos']} pedidos "
+                       f"({estadisticas_atajos['tasa_aciertos']:.0%}) resueltos sin el modelo.")
+
+        estadisticas_cache = cache_respuestas.estadisticas()
+        if estadisticas_cache["aciertos"]:
+            st.caption(f"💾 Respuestas repetidas desde la caché: {estadisticas_cache['aciertos']}.")
+
+    st.markdown("---")
+
+    with st.container():
+        st.subheader("⏱️ Rendimiento")
+        tiempos = resumen_trazas()
+        if tiempos["turnos"]:
+            ultimo = tiempos["ultimo"]
+            st.caption(f"Últimos {tiempos['turnos']} pedidos: p50 {tiempos['p50_ms'] / 1000:.1f} s · "
+                       f"p95 {tiempos['p95_ms'] / 1000:.1f} s")
+            st.markdown(f"**Último pedido:** {ultimo['total_ms'] / 1000:.1f} s, "
+                        f"{ultimo['llamadas_llm']} llamada(s) al modelo "
+                        f"({ultimo['tokens_entrada']} tokens de entrada, {ultimo['tokens_salida']} de salida)")
+            etiquetas = {"contexto": "Contexto de archivos", "llm": "Modelo", "herramienta": "Herramientas",
+                         "mangle": "Mangle", "tts": "Audio"}
+            st.markdown("\n".join(
+                f"- {etiquetas[categoria]}: {ms:.0f} ms (media {tiempos['promedio_por_categoria_ms'][categoria]:.0f} ms)"
+                for categoria, ms in ultimo["por_categoria"].items()
+            ))
+            if TRAZAS_ARCHIVO:
+                st.caption(f"Detalle de cada pedido en `{TRAZAS_ARCHIVO}`.")
+        else:
+            st.caption("Todavía no hay pedidos medidos.")
+
 # ----------------- ESTADOS -----------------
 if "messages" not in st.session_state:
     st.session_state.messages = []
 if "chat_history" not in st.session_state:
     st.session_state.chat_history = []
-if 'file_structure' not in st.session_state:
-    st.session_state.file_structure = None
+# Identifica la memoria de la conversación de esta sesión en el agente.
+if "session_id" not in st.session_state:
+    st.session_state.session_id = uuid.uuid4().hex
+if 'file_entries' not in st.session_state:
+    st.session_state.file_entries = None
+# Los índices de nombres (búsquedas, move_file) y de contenido
+# (search_text_in_files) se arman en segundo plano.
+indice_archivos.precargar()
+indice_contenido.precargar()
 # Se remueve la línea de transcriber porque se hará directo
 # if "transcriber" not in st.session_state:
 #    st.session_state.transcriber = Transcriber()
@@ -123,11 +173,13 @@ for message in st.session_state.messages:
                 st.audio(message["audio_path"], format="audio/mp3", autoplay=True)
 
 # ----------------- FUNCIÓN PARA OBTENER ESTRUCTURA DE ARCHIVOS (CON CACHÉ) -----------------
-def get_cached_file_structure():
-    if st.session_state.file_structure is None:
+# Se guarda el escaneo del directorio; el texto que va al prompt se arma en cada
+# comando a partir de él, según lo que pidió el usuario.
+def get_cached_file_entries():
+    if st.session_state.file_entries is None:
         with st.spinner("Actualizando vista de archivos..."):
-            st.session_state.file_structure = get_file_structure(WORKING_DIR)
-    return st.session_state.file_structure
+            st.session_state.file_entries = scan_file_entries(WORKING_DIR)
+    return st.session_state.file_entries
 
 # ----------------- FUNCIÓN PARA PROCESAR EL PROMPT -----------------
 def process_prompt(prompt, modo_voz):
@@ -136,20 +188,56 @@ def process_prompt(prompt, modo_voz):
     with st.chat_message("user", avatar="😃"):
         st.markdown(prompt)
 
-    with st.chat_message("assistant", avatar="🗂️"):
-        with st.spinner("🚀 Procesando tu solicitud..."):
-            # Obtener la estructura de archivos (usando el caché)
-            file_structure = get_cached_file_structure()
-            response = process_command(prompt, st.session_state.chat_history, modo_voz, file_structure)
+    # Todo lo que pasa hasta mostrar la respuesta queda en las trazas del turno
+    # (ver tracing.py): contexto, modelo, herramientas, Mangle y audio.
+    with st.chat_message("assistant", avatar="🗂️"), turno("comando", comando=prompt):
+        # Contexto de archivos acotado y relevante para este pedido (usando el caché)
+        file_structure = build_file_context(get_cached_file_entries(), prompt)
+
+        # La respuesta se muestra a medida que llega: primero los pasos del
+        # agente (herramientas) y luego el texto final, token a token. El audio
+        # de cada frase empieza a generarse en cuanto la frase está completa.
+        pasos = st.status("🚀 Procesando tu solicitud...", expanded=False)
+        texto_placeholder = st.empty()
+        lector = LectorPorFrases() if modo_voz == "Voz y texto" else None
+        texto = ""
+        response = None
+        for evento in iter_command_events(prompt, st.session_state.chat_history, file_structure,
+                                          session_id=st.session_state.session_id):
+            if evento["type"] == "tool_start":
+                pasos.update(label=f"🔧 Usando {evento['tool']}...")
+                pasos.write(f"🔧 **{evento['tool']}**: `{evento['input']}`")
+            elif evento["type"] == "tool_end":
+                salida = evento["output"]
+                pasos.write(salida if len(salida) <= 300 else salida[:300] + "…")
+            elif evento["type"] == "token":
+                texto += evento["text"]
+                texto_placeholder.markdown(texto + "▌")
+                if lector:
+                    lector.agregar(evento["text"])
+            elif evento["type"] == "final":
+                response = evento["response"]
+        pasos.update(label="✅ Listo", state="complete")
 
         if response.get("files_changed", False):
-            st.session_state.file_structure = None # Invalidar caché
+            # Se actualizan solo las rutas que tocaron las herramientas; si no
+            # hay detalle de los cambios (o afectan a todo), se vuelve a escanear.
+            entradas = st.session_state.file_entries
+            if entradas is not None and response.get("changes"):
+                entradas = aplicar_cambios(entradas, response["changes"], WORKING_DIR)
+            else:
+                entradas = None
+            st.session_state.file_entries = entradas
 
         if response["success"]:
-            st.markdown(response["message"])
-            if modo_voz == "Voz y texto":
+            texto_placeholder.markdown(response["message"])
+            if lector:
                 try:
-                    result = speak_response(response["message"])
+                    # Si el modelo no transmitió la respuesta (p. ej. el
+                    # mensaje vino directo de una herramienta), se lee entera.
+                    if not texto.strip():
+                        lector.agregar(response["message"])
+                    result = lector.finalizar()
                     audio_path = result["file_path"]
                     st.session_state.messages.append({"role": "assistant", "content": response["message"], "audio_path": audio_path, "avatar": "🗂️"})
                 except Exception as e:
@@ -158,6 +246,9 @@ def process_prompt(prompt, modo_voz):
             else:
                 st.session_state.messages.append({"role": "assistant", "content": response["message"], "avatar": "🗂️"})
         else:
+            if lector:
+                lector.descartar()
+            texto_placeholder.empty()
             st.error(response["message"])
             st.session_state.messages.append({"role": "assistant", "content": response["message"], "avatar": "🗂️"})
     st.rerun()
@@ -0,0 +1,196 @@
+# cache.py
+"""
+Cachés del agente.
+
+- Caché de respuestas: un pedido de solo lectura ("¿qué dice notas.txt?",
+  "¿qué proyectos hay?") que se repite se responde sin volver a llamar al LLM.
+  La clave es el pedido normalizado, el contexto de archivos enviado al modelo
+  y la versión de la base de conocimiento de Mangle; cada entrada guarda además la huella (mtime y tamaño) de los
+  archivos que se leyeron, y deja de valer si alguno cambió.
+- Memo de herramientas: read_file_content y search_files recuerdan su
+  resultado mientras los archivos no cambien. Las consultas a Mangle ya tienen
+  su propia caché en mangle_client (cliente_mangle.cache).
+
+Cada entrada declara de qué depende: de una ruta (y sus carpetas), del árbol
+de archivos (búsquedas, listados) o, siempre, de los archivos en general.
+Cuando una herramienta termina, invalidar_archivos() recibe los cambios que
+anotó (está suscrita con cambios.al_cambiar) y descarta solo lo que dependía de las rutas tocadas;
+sin cambios descarta todo lo que depende de los archivos.
+"""
+
+import functools
+import hashlib
+import os
+import re
+import unicodedata
+
+from cambios import afecta_todo, al_cambiar, rutas_afectadas
+from mangle_client import CacheConsultas, cliente_mangle
+
+# Respuestas completas del agente que se guardan y cuánto tiempo (segundos).
+CACHE_RESPUESTAS_MAX = int(os.getenv("CACHE_RESPUESTAS_MAX", "128"))
+CACHE_RESPUESTAS_TTL = float(os.getenv("CACHE_RESPUESTAS_TTL", "300"))
+# Resultados de herramientas de lectura. El TTL cubre cambios hechos fuera de
+# FileMate, que no pasan por invalidar_archivos().
+CACHE_HERRAMIENTAS_MAX = 256
+CACHE_HERRAMIENTAS_TTL = 60
+
+# Dependencias de las entradas: todas dependen de DEP_ARCHIVOS; las que usan
+# la lista de archivos (búsquedas, árbol) también de DEP_ARBOL, y las que leen
+# un archivo de "ruta:<ruta>" y "ruta:<carpeta>" por cada carpeta que lo contiene.
+DEP_ARCHIVOS = "archivos"
+DEP_ARBOL = "arbol"
+
+# Herramientas cuyo resultado depende de qué archivos existen.
+_HERRAMIENTAS_DE_ARBOL = {"search_files", "fuzzy_search_files", "get_file_tree", "search_text_in_files"}
+
+# Herramientas que no cambian nada: una respuesta que solo usó estas se puede
+# reutilizar. get_datetime no está porque su resultado cambia solo.
+HERRAMIENTAS_SOLO_LECTURA = {
+    "search_files", "fuzzy_search_files", "get_file_tree", "read_file_content", "search_in_file",
+    "search_text_in_files",
+    "consultar_base_de_conocimiento", "buscar_contactos_por_proyecto",
+    "buscar_contactos_prioritarios", "listar_todos_los_proyectos",
+    "calcular_metricas_proyecto", "generar_dashboard_metricas",
+    "detectar_proyectos_en_riesgo", "buscar_proyectos_por_estado",
+    "buscar_equipo_proyecto",
+}
+
+# Palabras que hacen que el pedido dependa de la conversación ("léelo otra
+# vez", "y el anterior?"); esos pedidos no se guardan.
+_PALABRAS_DE_CONTEXTO = {
+    "anterior", "ese", "esa", "eso", "esos", "esas", "este", "esta", "esto",
+    "otro", "otra", "otros", "otras", "mismo", "misma", "ultimo", "ultima",
+    "tambien", "ahora", "luego", "despues", "antes", "entonces",
+}
+
+cache_respuestas = CacheConsultas(CACHE_RESPUESTAS_MAX, CACHE_RESPUESTAS_TTL)
+cache_herramientas = CacheConsultas(CACHE_HERRAMIENTAS_MAX, CACHE_HERRAMIENTAS_TTL)
+
+
+def normalizar_comando(command: str) -> str:
+    """Minúsculas, sin tildes ni signos de puntuación y con los espacios colapsados."""
+    texto = unicodedata.normalize("NFKD", command.lower())
+    texto = "".join(c for c in texto if not unicodedata.combining(c))
+    texto = re.sub(r"[¿?¡!.,;:]+", " ", texto)
+    return " ".join(texto.split())
+
+
+def huella_archivo(ruta: str):
+    """(mtime, tamaño) del archivo, o None si no existe."""
+    try:
+        estado = os.stat(ruta)
+    except OSError:
+        return None
+    return (estado.st_mtime_ns, estado.st_size)
+
+
+def dependencias_de_ruta(ruta: str) -> set:
+    """Dependencias de algo leído en la ruta (relativa al directorio de trabajo)."""
+    partes = os.path.normpath(ruta).replace(os.sep, "/").split("/")
+    return {f"ruta:{'/'.join(partes[:i])}" for i in range(1, len(partes) + 1)}
+
+
+@al_cambiar
+def invalidar_archivos(cambios: list = None) -> None:
+    """
+    Descarta las respuestas y resultados afectados por los cambios (ver
+    cambios.py), o todo lo que depende de los archivos si no se indican.
+    """
+    rutas = rutas_afectadas(cambios) if cambios else []
+    if not rutas or any(afecta_todo(r) for r in rutas):
+        dependencias = [DEP_ARCHIVOS]
+    else:
+        dependencias = [DEP_ARBOL] + [f"ruta:{r}" for r in rutas]
+    cache_respuestas.invalidar(dependencias)
+    cache_herramientas.invalidar(dependencias)
+
+
+def memoizar(nombre: str, huella=None, dependencias=None):
+    """
+    Decorador para herramientas de lectura: guarda el resultado por argumentos
+    hasta que se invalide lo que usa o venza el TTL. dependencias (una función
+    con los mismos argumentos) indica de qué rutas depende; si no se indica,
+    depende del árbol de archivos. Si se indica huella, su valor también forma
+    parte de la clave, para notar cambios hechos fuera de FileMate.
+    """
+    def decorador(func):
+        @functools.wraps(func)
+        def envoltura(*args, **kwargs):
+            try:
+                clave = (nombre, args, tuple(sorted(kwargs.items())),
+                         huella(*args, **kwargs) if huella else None)
+                hash(clave)
+            except TypeError:
+                return func(*args, **kwargs)
+            valor = cache_herramientas.obtener(clave)
+            if valor is None:
+                valor = func(*args, **kwargs)
+                deps = dependencias(*args, **kwargs) if dependencias else {DEP_ARBOL}
+                cache_herramientas.guardar(clave, frozenset(deps | {DEP_ARCHIVOS}), valor)
+            # Las listas se copian para que quien las reciba no altere la caché.
+            return list(valor) if isinstance(valor, list) else valor
+        return envoltura
+    return decorador
+
+
+def _clave_respuesta(command: str, file_structure: str):
+    contexto = hashlib.sha1(file_structure.encode("utf-8")).hexdigest()
+    return (normalizar_comando(command), contexto, cliente_mangle.version)
+
+
+def _rutas_leidas(pasos: list) -> list:
+    """Archivos (relativos a 'files') que leyeron las herramientas de los pasos."""
+    rutas = []
+    for herramienta, argumentos in pasos:
+        if herramienta in ("read_file_content", "search_in_file") and isinstance(argumentos, dict):
+            ruta = argumentos.get("file_path")
+            if ruta:
+                rutas.append(ruta)
+    return rutas
+
+
+def buscar_respuesta(command: str, file_structure: str = ""):
+    """Respuesta guardada para el pedido, o None si no hay o ya no es válida."""
+    clave = _clave_respuesta(command, file_structure)
+    entrada = cache_respuestas.obtener(clave)
+    if entrada is None:
+        return None
+    if any(huella_archivo(ruta) != huella for ruta, huella in entrada["huellas"].items()):
+        cache_respuestas.descartar(clave)
+        return None
+    return entrada
+
+
+def guardar_respuesta(command: str, mensaje: str, pasos: list, file_structure: str = "") -> bool:
+    """
+    Guarda la respuesta si el pedido es de solo lectura: usó al menos una
+    herramienta, todas las usadas (pares (nombre, argumentos)) son de
+    lectura y el pedido no depende de la conversación. Devuelve si se guardó.
+    """
+    if set(normalizar_comando(command).split()) & _PALABRAS_DE_CONTEXTO:
+        return False
+    herramientas = [herramienta for herramienta, _ in pasos]
+    # Sin herramientas la respuesta sale de la memoria de la conversación
+    # ("¿cómo me llamo?"), que no forma parte de la clave.
+    if not herramientas:
+        return False
+    if any(h not in HERRAMIENTAS_SOLO_LECTURA for h in herramientas):
+        return False
+    if mensaje.lower().startswith(("error", "no pude", "no se pudo", "oops")):
+        return False
+    rutas = _rutas_leidas(pasos)
+    huellas = {os.path.join("files", ruta): huella_archivo(os.path.join("files", ruta)) for ruta in rutas}
+    # El contexto de archivos del prompt ya forma parte de la clave; aquí solo
+    # cuenta lo que las herramientas leyeron.
+    dependencias = {DEP_ARCHIVOS}
+    if any(h in _HERRAMIENTAS_DE_ARBOL for h in herramientas):
+        dependencias.add(DEP_ARBOL)
+    for ruta in rutas:
+        dependencias |= dependencias_de_ruta(ruta)
+    cache_respuestas.guardar(
+        _clave_respuesta(command, file_structure),
+        frozenset(dependencias),
+        {"message": mensaje, "herramientas": herramientas, "huellas": huellas},
+    )
+    return True
@@ -0,0 +1,121 @@
+# cambios.py
+"""
+Registro de los cambios que hacen las herramientas en el espacio de trabajo.
+
+Cada herramienta que crea, modifica, elimina, mueve o renombra algo lo anota
+con registrar_creado / registrar_modificado / registrar_eliminado /
+registrar_renombrado. Las anotaciones
+van al registro abierto con grabar_cambios(): el agente abre uno por comando
+(y uno por herramienta, para avisar con notificar() en cuanto termina), así la
+interfaz, las cachés y el índice de archivos actualizan solo las rutas
+afectadas en lugar de volver a recorrer todo el directorio.
+
+Cada cambio es un diccionario {"tipo": "creado" | "eliminado" | "renombrado"
+| "modificado", "ruta": ..., "destino": ...} con rutas relativas al directorio
+de trabajo y separadas por '/'. "destino" solo está en los renombrados (y
+movimientos); "modificado" (contenido editado) lo anotan las herramientas que
+agregan a un archivo existente y también lo avisa el observador del índice de
+archivos.
+"""
+
+import contextvars
+import os
+from contextlib import contextmanager
+
+WORKING_DIR = os.getenv("WORKING_DIRECTORY", "./files")
+
+_registro_actual = contextvars.ContextVar("registro_de_cambios", default=None)
+
+
+def ruta_relativa(ruta: str) -> str:
+    """Ruta relativa al directorio de trabajo, con '/'. Empieza con '..' si queda fuera."""
+    relativa = os.path.relpath(os.path.abspath(ruta), os.path.abspath(WORKING_DIR))
+    relativa = relativa.replace(os.sep, "/")
+    return "" if relativa == "." else relativa
+
+
+def _anotar(cambio: dict) -> None:
+    registro = _registro_actual.get()
+    if registro is not None:
+        registro.append(cambio)
+
+
+def registrar_creado(ruta: str) -> None:
+    _anotar({"tipo": "creado", "ruta": ruta_relativa(ruta)})
+
+
+def registrar_modificado(ruta: str) -> None:
+    _anotar({"tipo": "modificado", "ruta": ruta_relativa(ruta)})
+
+
+def registrar_eliminado(ruta: str) -> None:
+    _anotar({"tipo": "eliminado", "ruta": ruta_relativa(ruta)})
+
+
+def registrar_renombrado(origen: str, destino: str) -> None:
+    _anotar({"tipo": "renombrado", "ruta": ruta_relativa(origen), "destino": ruta_relativa(destino)})
+
+
+@contextmanager
+def grabar_cambios():
+    """
+    Abre un registro y devuelve la lista donde se acumulan los cambios. Al
+    cerrarse, sus cambios pasan también al registro que lo contiene, si hay uno.
+    """
+    registro = []
+    anterior = _registro_actual.get()
+    token = _registro_actual.set(registro)
+    try:
+        yield registro
+    finally:
+        _registro_actual.reset(token)
+        if anterior is not None:
+            anterior.extend(registro)
+
+
+def abrir_registro() -> list:
+    """
+    Abre un registro en el contexto actual sin cerrarlo, para los generadores
+    asíncronos: cada paso puede correr en otro contexto y ahí grabar_cambios()
+    no sirve. Las tareas y herramientas que se lancen después lo heredan.
+    """
+    registro = []
+    _registro_actual.set(registro)
+    return registro
+
+
+_suscriptores = []
+
+
+def al_cambiar(funcion):
+    """
+    Registra una función que se llama con la lista de cambios cada vez que una
+    herramienta termina (o con None si pudo cambiar cualquier cosa, p. ej. al
+    refrescar la vista). La usan las cachés y el índice de archivos.
+    """
+    _suscriptores.append(funcion)
+    return funcion
+
+
+def notificar(cambios: list = None) -> None:
+    """Avisa a los suscriptores de al_cambiar(); un fallo en uno no afecta a los demás."""
+    for funcion in _suscriptores:
+        try:
+            funcion(cambios)
+        except Exception as e:
+            print(f"Error al aplicar cambios de archivos ({getattr(funcion, '__qualname__', funcion)}): {e}")
+
+
+def rutas_afectadas(cambios: list) -> list:
+    """Rutas tocadas por los cambios (origen y destino), sin repetir y en orden."""
+    rutas = []
+    for cambio in cambios:
+        for ruta in (cambio["ruta"], cambio.get("destino")):
+            if ruta is not None and ruta not in rutas:
+                rutas.append(ruta)
+    return rutas
+
+
+def afecta_todo(ruta: str) -> bool:
+    """True si la ruta es el propio directorio de trabajo o queda fuera de él."""
+    return ruta == "" or ruta == ".." or ruta.startswith("../")
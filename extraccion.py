@@ -0,0 +1,381 @@
+# extraccion.py
+"""
+Extracción del texto de los documentos que FileMate sabe leer.
+
+extraer_paginas() devuelve el texto por página: una por página en los PDF y
+una sola con todo el contenido en los demás formatos. La usan
+read_file_content, el índice de texto completo (indice_contenido.py) y
+file_processor.procesar_archivo. Para leer solo una parte sin cargar el
+documento entero están iterar_paginas() (en los PDF analiza solo las páginas
+que se recorren), iterar_lineas() (los archivos de texto se leen línea a
+línea) y leer_bytes() (un rango de bytes con mmap).
+
+El texto de los PDF y DOCX se guarda, página por página, en una caché en
+disco (SQLite) con la ruta, el mtime y el tamaño del archivo: mientras no
+cambie, volver a leerlo no lo vuelve a analizar. La caché tiene un tamaño
+máximo y, al pasarlo, descarta los documentos usados hace más tiempo. Los
+formatos de texto plano se leen directamente, que es tan rápido como leerlos
+de la caché.
+"""
+
+import mmap
+import os
+import sqlite3
+import threading
+import time
+from itertools import islice
+
+import PyPDF2
+from docx import Document
+
+# Formatos que se leen como texto plano.
+FORMATOS_TEXTO = ('.txt', '.md', '.py', '.csv')
+# Formatos que hay que analizar; su texto se guarda en la caché.
+FORMATOS_ANALIZADOS = ('.docx', '.pdf')
+FORMATOS_SOPORTADOS = FORMATOS_TEXTO + FORMATOS_ANALIZADOS
+
+# Base de datos de la caché de texto extraído y su tamaño máximo en bytes de
+# texto (0 la desactiva).
+EXTRACCION_CACHE_DB = os.getenv("EXTRACCION_CACHE_DB", os.path.join("knowledge", "extracciones.db"))
+EXTRACCION_CACHE_MAX_BYTES = int(os.getenv("EXTRACCION_CACHE_MAX_BYTES", str(200 * 1024 * 1024)))
+
+# Páginas de PDF que se leen (y se guardan en la caché) juntas al recorrer un rango.
+PAGINAS_POR_BLOQUE = 16
+
+_VERSION_ESQUEMA = 1
+
+_ESQUEMA = """
+CREATE TABLE IF NOT EXISTS documentos (
+    ruta TEXT PRIMARY KEY,
+    mtime_ns INTEGER NOT NULL,
+    tamano INTEGER NOT NULL,
+    paginas INTEGER NOT NULL,
+    bytes INTEGER NOT NULL,
+    usado REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS documentos_por_uso ON documentos(usado);
+CREATE TABLE IF NOT EXISTS paginas (
+    ruta TEXT NOT NULL,
+    numero INTEGER NOT NULL,
+    texto TEXT NOT NULL,
+    PRIMARY KEY (ruta, numero)
+) WITHOUT ROWID;
+"""
+
+
+class CacheExtracciones:
+    """
+    Texto por página de documentos ya analizados, por ruta absoluta y huella
+    (mtime, tamaño). Un documento puede tener guardadas solo algunas páginas
+    (las que se leyeron por rango). Si la base de datos falla, simplemente no
+    guarda nada.
+    """
+
+    def __init__(self, base_de_datos: str, max_bytes: int):
+        self.base_de_datos = base_de_datos
+        self.max_bytes = max_bytes
+        self._lock = threading.RLock()
+        self._conexion = None
+        self.aciertos = 0
+        self.fallos = 0
+
+    def _conectar(self) -> sqlite3.Connection:
+        with self._lock:
+            if self._conexion is None:
+                carpeta = os.path.dirname(self.base_de_datos)
+                if carpeta:
+                    os.makedirs(carpeta, exist_ok=True)
+                conexion = sqlite3.connect(self.base_de_datos, check_same_thread=False)
+                conexion.execute("PRAGMA journal_mode=WAL")
+                conexion.execute("PRAGMA synchronous=NORMAL")
+                if conexion.execute("PRAGMA user_version").fetchone()[0] != _VERSION_ESQUEMA:
+                    conexion.executescript("DROP TABLE IF EXISTS paginas; DROP TABLE IF EXISTS documentos;")
+                    conexion.executescript(_ESQUEMA)
+                    conexion.execute(f"PRAGMA user_version={_VERSION_ESQUEMA}")
+                self._conexion = conexion
+            return self._conexion
+
+    def _documento(self, conexion: sqlite3.Connection, ruta: str, huella: tuple):
+        """Total de páginas del documento guardado, o None si no está o el archivo cambió."""
+        fila = conexion.execute(
+            "SELECT mtime_ns, tamano, paginas FROM documentos WHERE ruta = ?", (ruta,)
+        ).fetchone()
+        if fila is None or tuple(fila[:2]) != huella:
+            return None
+        return fila[2]
+
+    def _tocar(self, conexion: sqlite3.Connection, ruta: str) -> None:
+        with conexion:
+            conexion.execute("UPDATE documentos SET usado = ? WHERE ruta = ?", (time.time(), ruta))
+
+    def obtener(self, ruta: str, huella: tuple):
+        """Todas las páginas del documento, o None si no están todas o el archivo cambió."""
+        if self.max_bytes <= 0:
+            return None
+        try:
+            conexion = self._conectar()
+            with self._lock:
+                total = self._documento(conexion, ruta, huella)
+                paginas = []
+                if total is not None:
+                    paginas = [texto for (texto,) in conexion.execute(
+                        "SELECT texto FROM paginas WHERE ruta = ? ORDER BY numero", (ruta,)
+                    )]
+                if total is None or len(paginas) != total:
+                    self.fallos += 1
+                    return None
+                self._tocar(conexion, ruta)
+                self.aciertos += 1
+                return paginas
+        except sqlite3.Error as e:
+            print(f"Error al leer la caché de extracciones: {e}")
+            return None
+
+    def obtener_paginas(self, ruta: str, huella: tuple, desde: int, hasta: int) -> dict:
+        """Páginas guardadas entre desde y hasta (inclusive), como {número: texto}."""
+        if self.max_bytes <= 0:
+            return {}
+        try:
+            conexion = self._conectar()
+            with self._lock:
+                if self._documento(conexion, ruta, huella) is None:
+                    return {}
+                paginas = dict(conexion.execute(
+                    "SELECT numero, texto FROM paginas WHERE ruta = ? AND numero BETWEEN ? AND ?",
+                    (ruta, desde, hasta),
+                ))
+                if paginas:
+                    self._tocar(conexion, ruta)
+                self.aciertos += len(paginas)
+                self.fallos += hasta - desde + 1 - len(paginas)
+                return paginas
+        except sqlite3.Error as e:
+            print(f"Error al leer la caché de extracciones: {e}")
+            return {}
+
+    def total_paginas(self, ruta: str, huella: tuple):
+        """Cantidad de páginas del documento si ya se analizó alguna vez, o None."""
+        if self.max_bytes <= 0:
+            return None
+        try:
+            conexion = self._conectar()
+            with self._lock:
+                return self._documento(conexion, ruta, huella)
+        except sqlite3.Error:
+            return None
+
+    def guardar(self, ruta: str, huella: tuple, paginas: list) -> None:
+        """Guarda todas las páginas del documento y descarta los menos usados si se pasa del máximo."""
+        if self.max_bytes <= 0:
+            return
+        tamano = sum(len(p.encode("utf-8")) for p in paginas)
+        if tamano > self.max_bytes:
+            return
+        try:
+            conexion = self._conectar()
+            with self._lock, conexion:
+                conexion.execute("DELETE FROM paginas WHERE ruta = ?", (ruta,))
+                conexion.execute(
+                    "INSERT OR REPLACE INTO documentos (ruta, mtime_ns, tamano, paginas, bytes, usado)"
+                    " VALUES (?, ?, ?, ?, ?, ?)",
+                    (ruta, huella[0], huella[1], len(paginas), tamano, time.time()),
+                )
+                conexion.executemany(
+                    "INSERT INTO paginas (ruta, numero, texto) VALUES (?, ?, ?)",
+                    [(ruta, numero, texto) for numero, texto in enumerate(paginas, 1)],
+                )
+                self._podar(conexion, ruta)
+        except sqlite3.Error as e:
+            print(f"Error al guardar en la caché de extracciones: {e}")
+
+    def guardar_paginas(self, ruta: str, huella: tuple, total: int, paginas: dict) -> None:
+        """Guarda algunas páginas ({número: texto}); si el archivo cambió, descarta las que había."""
+        if self.max_bytes <= 0 or not paginas:
+            return
+        tamano = sum(len(texto.encode("utf-8")) for texto in paginas.values())
+        if tamano > self.max_bytes:
+            return
+        try:
+            conexion = self._conectar()
+            with self._lock, conexion:
+                if self._documento(conexion, ruta, huella) is None:
+                    conexion.execute("DELETE FROM paginas WHERE ruta = ?", (ruta,))
+                    conexion.execute(
+                        "INSERT OR REPLACE INTO documentos (ruta, mtime_ns, tamano, paginas, bytes, usado)"
+                        " VALUES (?, ?, ?, ?, 0, ?)",
+                        (ruta, huella[0], huella[1], total, time.time()),
+                    )
+                conexion.executemany(
+                    "INSERT OR REPLACE INTO paginas (ruta, numero, texto) VALUES (?, ?, ?)",
+                    [(ruta, numero, texto) for numero, texto in paginas.items()],
+                )
+                conexion.execute(
+                    "UPDATE documentos SET usado = ?,"
+                    " bytes = (SELECT COALESCE(SUM(LENGTH(CAST(texto AS BLOB))), 0) FROM paginas WHERE ruta = ?)"
+                    " WHERE ruta = ?",
+                    (time.time(), ruta, ruta),
+                )
+                self._podar(conexion, ruta)
+        except sqlite3.Error as e:
+            print(f"Error al guardar en la caché de extracciones: {e}")
+
+    def _podar(self, conexion: sqlite3.Connection, conservar: str) -> None:
+        """Descarta los documentos usados hace más tiempo (salvo conservar) hasta quedar bajo el máximo."""
+        total = conexion.execute("SELECT COALESCE(SUM(bytes), 0) FROM documentos").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for ruta, tamano in conexion.execute(
+            "SELECT ruta, bytes FROM documentos WHERE ruta != ? ORDER BY usado", (conservar,)
+        ).fetchall():
+            if total <= self.max_bytes:
+                break
+            conexion.execute("DELETE FROM paginas WHERE ruta = ?", (ruta,))
+            conexion.execute("DELETE FROM documentos WHERE ruta = ?", (ruta,))
+            total -= tamano
+
+    def estadisticas(self) -> dict:
+        try:
+            conexion = self._conectar()
+            with self._lock:
+                documentos, total = conexion.execute(
+                    "SELECT COUNT(*), COALESCE(SUM(bytes), 0) FROM documentos"
+                ).fetchone()
+        except sqlite3.Error:
+            documentos = total = 0
+        return {"documentos": documentos, "bytes": total,
+                "aciertos": self.aciertos, "fallos": self.fallos}
+
+
+cache_extracciones = CacheExtracciones(EXTRACCION_CACHE_DB, EXTRACCION_CACHE_MAX_BYTES)
+
+
+def es_soportado(ruta: str) -> bool:
+    return ruta.lower().endswith(FORMATOS_SOPORTADOS)
+
+
+def es_paginado(ruta: str) -> bool:
+    """True si extraer_paginas devuelve una página por página real (PDF)."""
+    return ruta.lower().endswith('.pdf')
+
+
+def es_texto(ruta: str) -> bool:
+    return ruta.lower().endswith(FORMATOS_TEXTO)
+
+
+def _validar(full_path: str) -> None:
+    if not es_soportado(full_path):
+        raise ValueError(f"formato no compatible: {os.path.splitext(full_path)[1] or full_path}")
+
+
+def _clave_y_huella(full_path: str):
+    # La huella se toma antes de analizar: si el archivo cambia mientras
+    # tanto, la próxima lectura no coincide y se vuelve a analizar.
+    estado = os.stat(full_path)
+    return os.path.abspath(full_path), (estado.st_mtime_ns, estado.st_size)
+
+
+def _analizar(full_path: str) -> list:
+    if full_path.lower().endswith('.docx'):
+        doc = Document(full_path)
+        return ["\n".join(p.text for p in doc.paragraphs)]
+    with open(full_path, 'rb') as f:
+        reader = PyPDF2.PdfReader(f)
+        return [page.extract_text() or "" for page in reader.pages]
+
+
+def extraer_paginas(full_path: str) -> list:
+    """
+    Texto del documento, una cadena por página. Lanza ValueError si el
+    formato no es compatible; los errores de lectura se propagan.
+    """
+    _validar(full_path)
+    if es_texto(full_path):
+        with open(full_path, 'r', encoding='utf-8') as f:
+            return [f.read()]
+    clave, huella = _clave_y_huella(full_path)
+    paginas = cache_extracciones.obtener(clave, huella)
+    if paginas is None:
+        paginas = _analizar(full_path)
+        cache_extracciones.guardar(clave, huella, paginas)
+    return paginas
+
+
+def contar_paginas(full_path: str) -> int:
+    """Páginas del documento (1 si no es un PDF), sin extraer su texto."""
+    _validar(full_path)
+    if not es_paginado(full_path):
+        return 1
+    clave, huella = _clave_y_huella(full_path)
+    total = cache_extracciones.total_paginas(clave, huella)
+    if total is None:
+        with open(full_path, 'rb') as f:
+            total = len(PyPDF2.PdfReader(f).pages)
+    return total
+
+
+def iterar_paginas(full_path: str, desde: int = 1, hasta: int = None):
+    """
+    Genera (número, texto) de las páginas desde..hasta (desde 1, inclusive).
+    En los PDF las páginas se analizan (o se toman de la caché) de a bloques
+    a medida que se piden, así leer unas pocas no carga el documento entero.
+    """
+    _validar(full_path)
+    if not es_paginado(full_path):
+        if desde <= 1 and (hasta is None or hasta >= 1):
+            yield 1, extraer_paginas(full_path)[0]
+        return
+    clave, huella = _clave_y_huella(full_path)
+    with open(full_path, 'rb') as f:
+        reader = None
+        total = cache_extracciones.total_paginas(clave, huella)
+        if total is None:
+            reader = PyPDF2.PdfReader(f)
+            total = len(reader.pages)
+        ultima = total if hasta is None else min(hasta, total)
+        for bloque in range(max(desde, 1), ultima + 1, PAGINAS_POR_BLOQUE):
+            fin = min(bloque + PAGINAS_POR_BLOQUE - 1, ultima)
+            guardadas = cache_extracciones.obtener_paginas(clave, huella, bloque, fin)
+            nuevas = {}
+            for numero in range(bloque, fin + 1):
+                if numero not in guardadas:
+                    if reader is None:
+                        reader = PyPDF2.PdfReader(f)
+                    nuevas[numero] = reader.pages[numero - 1].extract_text() or ""
+            cache_extracciones.guardar_paginas(clave, huella, total, nuevas)
+            for numero in range(bloque, fin + 1):
+                yield numero, guardadas.get(numero, nuevas.get(numero))
+
+
+def iterar_lineas(full_path: str, desde: int = 1):
+    """
+    Genera (número, línea) desde la línea indicada (desde 1), sin el salto
+    de línea. Los archivos de texto se leen de a una línea; en PDF y DOCX
+    se numeran las líneas del texto extraído, página tras página.
+    """
+    _validar(full_path)
+    desde = max(desde, 1)
+    if es_texto(full_path):
+        with open(full_path, 'r', encoding='utf-8') as f:
+            for numero, linea in enumerate(islice(f, desde - 1, None), desde):
+                yield numero, linea.rstrip("\r\n")
+        return
+    numero = 0
+    for _, texto in iterar_paginas(full_path):
+        for linea in texto.splitlines():
+            numero += 1
+            if numero >= desde:
+                yield numero, linea
+
+
+def leer_bytes(full_path: str, desde: int, cantidad: int) -> str:
+    """
+    Texto de los bytes desde..desde+cantidad-1 (desde 1) de un archivo de
+    texto, leídos con mmap. Un carácter cortado en los bordes se omite.
+    """
+    if not es_texto(full_path):
+        raise ValueError("la lectura por bytes solo es para archivos de texto")
+    if os.path.getsize(full_path) == 0:
+        return ""
+    inicio = max(desde, 1) - 1
+    with open(full_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as datos:
+        return datos[inicio:inicio + cantidad].decode('utf-8', errors='ignore')
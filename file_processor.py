@@ -1,7 +1,6 @@
 import os
-from pdfminer.high_level import extract_text
-from docx import Document
 import csv
+from extraccion import extraer_paginas
 from langchain.embeddings import OpenAIEmbeddings
 from langchain.vectorstores import FAISS
 import pickle
@@ -17,11 +16,10 @@ else:
 
 def procesar_archivo(file_path):
     texto = ""
-    if file_path.endswith(".pdf"):
-        texto = extract_text(file_path)
-    elif file_path.endswith(".docx"):
-        doc = Document(file_path)
-        texto = "\n".join([p.text for p in doc.paragraphs])
+    if file_path.endswith((".pdf", ".docx")):
+        # El texto ya extraído (por read_file_content o el índice de
+        # contenido) se toma de la caché de extracciones.
+        texto = "\n".join(extraer_paginas(file_path))
     elif file_path.endswith(".txt"):
         with open(file_path, "r", encoding="utf-8") as f:
             texto = f.read()
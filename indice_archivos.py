@@ -0,0 +1,392 @@
+# indice_archivos.py
+"""
+Índice en memoria de los nombres de archivos y carpetas del directorio de trabajo.
+
+Se construye una sola vez (la primera vez que se usa) y después se mantiene
+con los cambios que anotan las herramientas (ver cambios.py) y, si watchdog
+está instalado, con los eventos del sistema de archivos. Así search_files y
+move_file no recorren todo el árbol en cada llamada.
+
+- Por nombre: nombre en minúsculas -> rutas con ese nombre.
+- Por trigramas: cada trigrama del nombre en minúsculas -> nombres que lo
+  contienen. Una búsqueda por subcadena intersecta los trigramas del patrón
+  (empezando por el más raro) y solo compara los nombres que quedan.
+- Búsqueda aproximada (similares): los nombres que comparten más trigramas
+  con el pedido se ordenan por distancia de edición, para tolerar errores
+  de tipeo ("prueva" -> "prueba").
+
+Las rutas son relativas al directorio de trabajo y usan '/'.
+"""
+
+import os
+import threading
+from collections import Counter, defaultdict
+
+from cambios import WORKING_DIR, afecta_todo, al_cambiar, notificar, ruta_relativa, rutas_afectadas
+
+# Con watchdog instalado el índice también sigue los cambios hechos fuera de
+# FileMate. Se puede desactivar con INDICE_ARCHIVOS_OBSERVAR=0.
+INDICE_ARCHIVOS_OBSERVAR = os.getenv("INDICE_ARCHIVOS_OBSERVAR", "1") != "0"
+
+# Similitud mínima (1 = idéntico) para proponer un nombre parecido.
+SIMILITUD_MINIMA = 0.6
+# Nombres que se comparan con distancia de edición en cada búsqueda aproximada.
+CANDIDATOS_APROXIMADOS = 200
+# Trigramas presentes en más nombres que esto (".tx", "pdf"...) casi no
+# distinguen y son caros de contar; se ignoran si hay otros.
+MAX_NOMBRES_POR_TRIGRAMA = 20000
+
+
+def trigramas(texto: str) -> set:
+    """Trigramas de un texto (ya en minúsculas)."""
+    return {texto[i:i + 3] for i in range(len(texto) - 2)}
+
+
+def distancia_edicion(a: str, b: str) -> int:
+    """Distancia de Levenshtein (inserciones, borrados y sustituciones)."""
+    if len(a) < len(b):
+        a, b = b, a
+    anterior = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        actual = [i]
+        for j, cb in enumerate(b, 1):
+            actual.append(min(anterior[j] + 1, actual[j - 1] + 1, anterior[j - 1] + (ca != cb)))
+        anterior = actual
+    return anterior[-1]
+
+
+def similitud(a: str, b: str) -> float:
+    """1 - distancia de edición normalizada por la longitud del más largo."""
+    if not a and not b:
+        return 1.0
+    return 1 - distancia_edicion(a, b) / max(len(a), len(b))
+
+
+class IndiceArchivos:
+    """Índice de nombres de un directorio; se puede usar desde varios hilos."""
+
+    def __init__(self, directorio: str):
+        self.directorio = directorio
+        self._lock = threading.RLock()
+        self._construccion_lock = threading.Lock()
+        self._aplicar_lock = threading.Lock()  # los cambios se aplican de a uno y en orden
+        self._construido = False
+        self._reconstruyendo = False
+        self._durante_reconstruccion = []  # cambios que llegan mientras se reconstruye
+        self._observador = None
+        self._carpetas = set()     # rutas que son carpetas
+        self._hijos = {}           # carpeta ("" para la raíz) -> rutas que contiene
+        self._por_nombre = {}      # nombre en minúsculas -> rutas
+        self._trigramas = {}       # trigrama -> nombres en minúsculas
+
+    # --- Mantenimiento -------------------------------------------------
+
+    def _agregar(self, ruta: str, es_carpeta: bool) -> None:
+        carpeta, _, nombre = ruta.rpartition("/")
+        self._hijos.setdefault(carpeta, set()).add(ruta)
+        if es_carpeta:
+            self._carpetas.add(ruta)
+        clave = nombre.lower()
+        rutas = self._por_nombre.get(clave)
+        if rutas is None:
+            self._por_nombre[clave] = {ruta}
+            for trigrama in trigramas(clave):
+                self._trigramas.setdefault(trigrama, set()).add(clave)
+        else:
+            rutas.add(ruta)
+
+    def _quitar(self, ruta: str) -> None:
+        """Quita la ruta y, si es una carpeta, todo lo que contiene."""
+        for hijo in list(self._hijos.pop(ruta, ())):
+            self._quitar(hijo)
+        carpeta, _, nombre = ruta.rpartition("/")
+        hermanos = self._hijos.get(carpeta)
+        if hermanos is not None:
+            hermanos.discard(ruta)
+        self._carpetas.discard(ruta)
+        clave = nombre.lower()
+        rutas = self._por_nombre.get(clave)
+        if rutas is None or ruta not in rutas:
+            return
+        rutas.discard(ruta)
+        if not rutas:
+            del self._por_nombre[clave]
+            for trigrama in trigramas(clave):
+                nombres = self._trigramas.get(trigrama)
+                if nombres is not None:
+                    nombres.discard(clave)
+                    if not nombres:
+                        del self._trigramas[trigrama]
+
+    def _listar(self, relativa: str):
+        """Genera (ruta, es_carpeta) de todo lo que hay en disco dentro de la carpeta relativa."""
+        pendientes = [relativa]
+        while pendientes:
+            actual = pendientes.pop()
+            try:
+                with os.scandir(os.path.join(self.directorio, actual)) as it:
+                    for entry in it:
+                        ruta = f"{actual}/{entry.name}" if actual else entry.name
+                        try:
+                            es_carpeta = entry.is_dir(follow_symlinks=False)
+                        except OSError:
+                            continue
+                        yield ruta, es_carpeta
+                        if es_carpeta:
+                            pendientes.append(ruta)
+            except OSError:
+                continue
+
+    def reconstruir(self) -> None:
+        """
+        Vuelve a leer todo el directorio. El índice nuevo se arma aparte y
+        reemplaza al anterior de una vez, así nunca se consulta a medio armar.
+        """
+        with self._construccion_lock:
+            with self._lock:
+                self._reconstruyendo = True
+                self._durante_reconstruccion = []
+            try:
+                carpetas = set()
+                hijos = defaultdict(set)
+                por_nombre = {}
+                for ruta, es_carpeta in self._listar(""):
+                    carpeta, _, nombre = ruta.rpartition("/")
+                    hijos[carpeta].add(ruta)
+                    if es_carpeta:
+                        carpetas.add(ruta)
+                    clave = nombre.lower()
+                    rutas = por_nombre.get(clave)
+                    if rutas is None:
+                        por_nombre[clave] = {ruta}
+                    else:
+                        rutas.add(ruta)
+                indice_trigramas = defaultdict(set)
+                for clave in por_nombre:
+                    for i in range(len(clave) - 2):
+                        indice_trigramas[clave[i:i + 3]].add(clave)
+                with self._lock:
+                    self._carpetas = carpetas
+                    self._hijos = dict(hijos)
+                    self._por_nombre = por_nombre
+                    self._trigramas = dict(indice_trigramas)
+                    self._construido = True
+            finally:
+                with self._lock:
+                    self._reconstruyendo = False
+                    pendientes, self._durante_reconstruccion = self._durante_reconstruccion, []
+            # El recorrido pudo pasar por una carpeta antes de que cambiara:
+            # los cambios que llegaron mientras tanto se aplican ahora.
+            for cambios in pendientes:
+                self.aplicar(cambios)
+        if INDICE_ARCHIVOS_OBSERVAR:
+            self._observar()
+
+    def _asegurar(self) -> None:
+        if not self._construido:
+            with self._construccion_lock:
+                construido = self._construido
+            if not construido:
+                self.reconstruir()
+
+    def precargar(self) -> None:
+        """Construye el índice en segundo plano (p. ej. al arrancar la aplicación)."""
+        if self._construido:
+            return
+        threading.Thread(target=self._asegurar, name="indice-archivos", daemon=True).start()
+
+    def aplicar(self, cambios: list = None) -> None:
+        """
+        Actualiza el índice con los cambios anotados por las herramientas: quita
+        cada ruta afectada y la vuelve a leer del disco. Con None (o un cambio
+        en la raíz) se reconstruye entero la próxima vez que se use. Los que
+        llegan durante una reconstrucción se aplican al terminarla.
+        """
+        rutas = rutas_afectadas(cambios or [])
+        with self._aplicar_lock:
+            with self._lock:
+                if self._reconstruyendo:
+                    self._durante_reconstruccion.append(cambios)
+                    return
+                if not self._construido:
+                    return
+                if cambios is None or any(afecta_todo(r) for r in rutas):
+                    self._construido = False
+                    return
+            # El disco se lee sin tomar el lock, para no frenar las búsquedas
+            # mientras se recorre una carpeta grande; solo el reemplazo lo toma.
+            leidas = []
+            for ruta in rutas:
+                completa = os.path.join(self.directorio, ruta)
+                if not os.path.exists(completa):
+                    leidas.append((ruta, None))
+                elif os.path.isdir(completa):
+                    leidas.append((ruta, [(ruta, True)] + list(self._listar(ruta))))
+                else:
+                    leidas.append((ruta, [(ruta, False)]))
+            with self._lock:
+                if self._reconstruyendo:
+                    # Empezó una reconstrucción mientras se leía el disco.
+                    self._durante_reconstruccion.append(cambios)
+                    return
+                if not self._construido:
+                    return
+                for ruta, entradas in leidas:
+                    self._quitar(ruta)
+                    if entradas is None:
+                        continue
+                    # Las carpetas intermedias (p. ej. creadas al mover a un
+                    # destino nuevo) pueden no estar anotadas.
+                    carpeta = ruta.rpartition("/")[0]
+                    faltantes = []
+                    while carpeta and carpeta not in self._carpetas:
+                        faltantes.append(carpeta)
+                        carpeta = carpeta.rpartition("/")[0]
+                    for carpeta in reversed(faltantes):
+                        self._agregar(carpeta, True)
+                    for entrada, es_carpeta in entradas:
+                        self._agregar(entrada, es_carpeta)
+
+    def _observar(self) -> None:
+        """Sigue los eventos del sistema de archivos con watchdog, si está instalado."""
+        if self._observador is not None:
+            return
+        try:
+            from watchdog.events import FileSystemEventHandler
+            from watchdog.observers import Observer
+        except ImportError:
+            return
+
+        class _Eventos(FileSystemEventHandler):
+            # Los eventos se pasan por notificar() para que también se
+            # actualicen las cachés; lo hecho por las propias herramientas
+            # llega dos veces, pero aplicar es idempotente.
+            def on_created(self, event):
+                notificar([{"tipo": "creado", "ruta": ruta_relativa(event.src_path)}])
+
+            def on_deleted(self, event):
+                notificar([{"tipo": "eliminado", "ruta": ruta_relativa(event.src_path)}])
+
+            def on_modified(self, event):
+                # Cambios de contenido; el de una carpeta ya llega por sus hijos.
+                if not event.is_directory:
+                    notificar([{"tipo": "modificado", "ruta": ruta_relativa(event.src_path)}])
+
+            def on_moved(self, event):
+                notificar([{"tipo": "renombrado", "ruta": ruta_relativa(event.src_path),
+                            "destino": ruta_relativa(event.dest_path)}])
+
+        try:
+            observador = Observer()
+            observador.daemon = True
+            observador.schedule(_Eventos(), self.directorio, recursive=True)
+            observador.start()
+            self._observador = observador
+        except Exception as e:
+            print(f"No se pudo observar '{self.directorio}' ({e}); el índice solo se actualizará con las herramientas.")
+            self._observador = False
+
+    # --- Consultas -----------------------------------------------------
+
+    def _nombres_que_contienen(self, patron: str):
+        if len(patron) < 3:
+            return [nombre for nombre in self._por_nombre if patron in nombre]
+        listas = sorted((self._trigramas.get(t, set()) for t in trigramas(patron)), key=len)
+        candidatos = set(listas[0])
+        for nombres in listas[1:]:
+            if not candidatos:
+                break
+            candidatos &= nombres
+        return [nombre for nombre in candidatos if patron in nombre]
+
+    def buscar(self, patron: str, carpetas: bool = False) -> list:
+        """Rutas cuyo nombre contiene el patrón (sin distinguir mayúsculas), ordenadas."""
+        self._asegurar()
+        patron = patron.lower()
+        with self._lock:
+            rutas = [ruta for nombre in self._nombres_que_contienen(patron)
+                     for ruta in self._por_nombre[nombre]
+                     if carpetas or ruta not in self._carpetas]
+        return sorted(rutas)
+
+    def por_nombre(self, nombre: str, carpetas: bool = False) -> list:
+        """Rutas con exactamente ese nombre (distinguiendo mayúsculas), ordenadas."""
+        self._asegurar()
+        with self._lock:
+            rutas = [ruta for ruta in self._por_nombre.get(nombre.lower(), ())
+                     if ruta.rpartition("/")[2] == nombre and (carpetas or ruta not in self._carpetas)]
+        return sorted(rutas)
+
+    def similares(self, nombre: str, limite: int = 5, minimo: float = SIMILITUD_MINIMA,
+                  carpetas: bool = True, archivos: bool = True) -> list:
+        """
+        Rutas cuyo nombre se parece al indicado, como [(ruta, similitud)] de la
+        más parecida a la menos. Si el pedido no tiene extensión, también se
+        compara con los nombres sin extensión ("informe" ~ "informe.pdf").
+        """
+        self._asegurar()
+        consulta = nombre.strip().replace("\\", "/").rstrip("/").rpartition("/")[2].lower()
+        buscados = trigramas(consulta)
+        if not buscados:
+            return []
+        sin_extension = "." not in consulta
+        with self._lock:
+            listas = sorted((n for n in (self._trigramas.get(t) for t in buscados) if n), key=len)
+            if not listas:
+                return []
+            utiles = [n for n in listas if len(n) <= MAX_NOMBRES_POR_TRIGRAMA] or listas[:1]
+            comunes = Counter()
+            for nombres in utiles:
+                comunes.update(nombres)
+            # Primer filtro barato: coeficiente de Dice sobre los trigramas.
+            candidatos = sorted(
+                comunes,
+                key=lambda n: -2 * comunes[n] / (len(buscados) + max(len(n) - 2, 1)),
+            )[:CANDIDATOS_APROXIMADOS]
+            resultados = []
+            for candidato in candidatos:
+                puntaje = similitud(consulta, candidato)
+                if sin_extension:
+                    puntaje = max(puntaje, similitud(consulta, os.path.splitext(candidato)[0]))
+                if puntaje < minimo:
+                    continue
+                for ruta in self._por_nombre[candidato]:
+                    es_carpeta = ruta in self._carpetas
+                    if (es_carpeta and carpetas) or (not es_carpeta and archivos):
+                        resultados.append((ruta, puntaje))
+        resultados.sort(key=lambda r: (-r[1], r[0]))
+        return resultados[:limite]
+
+    def archivos(self, carpeta: str = "") -> list:
+        """Archivos (no carpetas) que hay dentro de la carpeta, en cualquier nivel."""
+        self._asegurar()
+        with self._lock:
+            pendientes = [carpeta]
+            rutas = []
+            while pendientes:
+                for ruta in self._hijos.get(pendientes.pop(), ()):
+                    if ruta in self._carpetas:
+                        pendientes.append(ruta)
+                    else:
+                        rutas.append(ruta)
+        return rutas
+
+    def es_carpeta(self, ruta: str) -> bool:
+        self._asegurar()
+        with self._lock:
+            return ruta in self._carpetas
+
+    def estadisticas(self) -> dict:
+        with self._lock:
+            return {
+                "rutas": sum(len(r) for r in self._por_nombre.values()),
+                "carpetas": len(self._carpetas),
+                "nombres": len(self._por_nombre),
+                "trigramas": len(self._trigramas),
+                "observando": bool(self._observador),
+            }
+
+
+# Índice compartido del directorio de trabajo.
+indice_archivos = IndiceArchivos(WORKING_DIR)
+al_cambiar(indice_archivos.aplicar)
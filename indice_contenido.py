@@ -0,0 +1,333 @@
+# indice_contenido.py
+"""
+Índice de texto completo del contenido de los documentos del espacio de trabajo.
+
+Cada línea no vacía del texto extraído (ver extraccion.py) se guarda en una
+tabla de SQLite con un índice FTS5, así search_text_in_files encuentra una
+palabra en todos los documentos sin volver a abrir ninguno y ordena los
+resultados por relevancia (BM25), con un fragmento de cada línea.
+
+El índice se actualiza de forma incremental: de cada documento se guarda su
+mtime, tamaño y hash, y solo se vuelve a extraer el texto de los que
+cambiaron (si solo cambió el mtime pero no el contenido, no se extrae). Las
+rutas a revisar llegan por cambios.al_cambiar (herramientas y observador del
+índice de archivos); la primera vez, o tras un aviso sin cambios concretos,
+se comparan todos los documentos.
+
+Las rutas son relativas al directorio de trabajo y usan '/'.
+"""
+
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+
+from cambios import WORKING_DIR, afecta_todo, al_cambiar, rutas_afectadas
+from extraccion import es_paginado, es_soportado, extraer_paginas
+from indice_archivos import indice_archivos
+from tracing import span
+
+# Base de datos del índice (junto a la base de conocimiento de file_processor).
+INDICE_CONTENIDO_DB = os.getenv("INDICE_CONTENIDO_DB", os.path.join("knowledge", "indice_contenido.db"))
+# Archivos más grandes que esto no se indexan (bytes).
+INDICE_CONTENIDO_MAX_BYTES = 20 * 1024 * 1024
+# Con hasta estas rutas pendientes la búsqueda las actualiza antes de
+# consultar; con más, se actualizan en segundo plano.
+MAX_PENDIENTES_EN_LINEA = 20
+
+_VERSION_ESQUEMA = 1
+
+_ESQUEMA = """
+CREATE TABLE IF NOT EXISTS documentos (
+    id INTEGER PRIMARY KEY,
+    ruta TEXT UNIQUE NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    tamano INTEGER NOT NULL,
+    hash TEXT
+);
+CREATE TABLE IF NOT EXISTS lineas (
+    id INTEGER PRIMARY KEY,
+    doc_id INTEGER NOT NULL,
+    pagina INTEGER,
+    linea INTEGER NOT NULL,
+    texto TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS lineas_por_documento ON lineas(doc_id);
+CREATE VIRTUAL TABLE IF NOT EXISTS lineas_fts USING fts5(
+    texto, content='lineas', content_rowid='id',
+    tokenize='unicode61 remove_diacritics 2'
+);
+"""
+
+# lineas_fts indexa el texto de lineas sin copiarlo (content='lineas'). Se
+# mantiene con una sentencia por documento en lugar de triggers por fila,
+# que multiplican por cuatro el tiempo de indexar.
+_INDEXAR_DOCUMENTO = "INSERT INTO lineas_fts(rowid, texto) SELECT id, texto FROM lineas WHERE doc_id = ?"
+_DESINDEXAR_DOCUMENTO = (
+    "INSERT INTO lineas_fts(lineas_fts, rowid, texto)"
+    " SELECT 'delete', id, texto FROM lineas WHERE doc_id = ?"
+)
+
+
+def _borrar_lineas(conexion: sqlite3.Connection, doc_id: int) -> None:
+    conexion.execute(_DESINDEXAR_DOCUMENTO, (doc_id,))
+    conexion.execute("DELETE FROM lineas WHERE doc_id = ?", (doc_id,))
+
+
+def hash_archivo(ruta: str) -> str:
+    """SHA-1 del contenido del archivo."""
+    h = hashlib.sha1()
+    with open(ruta, "rb") as f:
+        for bloque in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(bloque)
+    return h.hexdigest()
+
+
+def consulta_fts(texto: str, operador: str = "AND") -> str:
+    """Convierte el texto del usuario en una consulta FTS5: sus palabras, entre comillas."""
+    palabras = re.findall(r"\w+", texto)
+    return f" {operador} ".join(f'"{p}"' for p in palabras)
+
+
+def _escapar_like(texto: str) -> str:
+    return texto.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def _en_backups(ruta: str) -> bool:
+    # Como en el contexto de archivos, lo que está dentro de backups no cuenta.
+    return "backups" in ruta.split("/")[:-1]
+
+
+class IndiceContenido:
+    """Índice de texto completo de un directorio; se puede usar desde varios hilos."""
+
+    def __init__(self, directorio: str, base_de_datos: str):
+        self.directorio = directorio
+        self.base_de_datos = base_de_datos
+        self._lock = threading.RLock()
+        self._sincronizacion_lock = threading.Lock()
+        self._conexion = None
+        self._todo = True          # hay que comparar todos los documentos
+        self._pendientes = set()   # rutas (archivos o carpetas) a revisar
+        self._hilo = None
+
+    def _conectar(self) -> sqlite3.Connection:
+        with self._lock:
+            if self._conexion is None:
+                carpeta = os.path.dirname(self.base_de_datos)
+                if carpeta:
+                    os.makedirs(carpeta, exist_ok=True)
+                conexion = sqlite3.connect(self.base_de_datos, check_same_thread=False)
+                conexion.execute("PRAGMA journal_mode=WAL")
+                conexion.execute("PRAGMA synchronous=NORMAL")
+                if conexion.execute("PRAGMA user_version").fetchone()[0] != _VERSION_ESQUEMA:
+                    conexion.executescript(
+                        "DROP TABLE IF EXISTS lineas_fts; DROP TABLE IF EXISTS lineas;"
+                        " DROP TABLE IF EXISTS documentos;"
+                    )
+                    conexion.executescript(_ESQUEMA)
+                    conexion.execute(f"PRAGMA user_version={_VERSION_ESQUEMA}")
+                self._conexion = conexion
+            return self._conexion
+
+    # --- Actualización -------------------------------------------------
+
+    def aplicar(self, cambios: list = None) -> None:
+        """Anota las rutas a revisar; sin cambios concretos se revisa todo."""
+        rutas = rutas_afectadas(cambios or [])
+        with self._lock:
+            if cambios is None or any(afecta_todo(r) for r in rutas):
+                self._todo = True
+            else:
+                self._pendientes.update(rutas)
+
+    def _registrados(self, carpeta: str = None) -> dict:
+        """ruta -> (id, mtime_ns, tamaño, hash) de los documentos indexados (de una carpeta o ruta)."""
+        conexion = self._conectar()
+        with self._lock:
+            if carpeta is None:
+                filas = conexion.execute("SELECT ruta, id, mtime_ns, tamano, hash FROM documentos")
+            else:
+                filas = conexion.execute(
+                    "SELECT ruta, id, mtime_ns, tamano, hash FROM documentos"
+                    " WHERE ruta = ? OR ruta LIKE ? ESCAPE '\\'",
+                    (carpeta, _escapar_like(carpeta) + "/%"),
+                )
+            return {fila[0]: fila[1:] for fila in filas}
+
+    def _comparar(self, en_disco: list, registrados: dict) -> int:
+        """Indexa lo nuevo o cambiado y borra lo que ya no está. Devuelve cuántos se indexaron."""
+        indexados = 0
+        for ruta in en_disco:
+            if not es_soportado(ruta) or _en_backups(ruta):
+                continue
+            try:
+                estado = os.stat(os.path.join(self.directorio, ruta))
+            except OSError:
+                continue
+            registrado = registrados.pop(ruta, None)
+            if registrado and registrado[1:3] == (estado.st_mtime_ns, estado.st_size):
+                continue
+            self._indexar(ruta, estado, registrado)
+            indexados += 1
+        if registrados:
+            conexion = self._conectar()
+            with self._lock, conexion:
+                for doc_id, *_ in registrados.values():
+                    _borrar_lineas(conexion, doc_id)
+                    conexion.execute("DELETE FROM documentos WHERE id = ?", (doc_id,))
+        return indexados
+
+    def _indexar(self, ruta: str, estado, registrado) -> None:
+        completa = os.path.join(self.directorio, ruta)
+        lineas = []
+        huella = None
+        if estado.st_size <= INDICE_CONTENIDO_MAX_BYTES:
+            try:
+                huella = hash_archivo(completa)
+                if registrado is None or registrado[3] != huella:
+                    paginado = es_paginado(ruta)
+                    for n_pagina, texto in enumerate(extraer_paginas(completa), 1):
+                        for n_linea, linea in enumerate(texto.splitlines(), 1):
+                            if linea.strip():
+                                lineas.append((n_pagina if paginado else None, n_linea, linea.strip()))
+            except Exception as e:
+                # Se registra igual, para no reintentar hasta que el archivo cambie.
+                print(f"No se pudo indexar el contenido de '{ruta}': {e}")
+        conexion = self._conectar()
+        with self._lock, conexion:
+            if registrado is not None and huella is not None and registrado[3] == huella:
+                # Mismo contenido (p. ej. solo cambió la fecha): no se reindexa.
+                conexion.execute("UPDATE documentos SET mtime_ns = ?, tamano = ? WHERE id = ?",
+                                 (estado.st_mtime_ns, estado.st_size, registrado[0]))
+                return
+            if registrado is not None:
+                doc_id = registrado[0]
+                _borrar_lineas(conexion, doc_id)
+                conexion.execute("UPDATE documentos SET mtime_ns = ?, tamano = ?, hash = ? WHERE id = ?",
+                                 (estado.st_mtime_ns, estado.st_size, huella, doc_id))
+            else:
+                doc_id = conexion.execute(
+                    "INSERT INTO documentos (ruta, mtime_ns, tamano, hash) VALUES (?, ?, ?, ?)",
+                    (ruta, estado.st_mtime_ns, estado.st_size, huella),
+                ).lastrowid
+            conexion.executemany(
+                "INSERT INTO lineas (doc_id, pagina, linea, texto) VALUES (?, ?, ?, ?)",
+                [(doc_id, pagina, linea, texto) for pagina, linea, texto in lineas],
+            )
+            conexion.execute(_INDEXAR_DOCUMENTO, (doc_id,))
+
+    def _archivos_en(self, ruta: str) -> list:
+        completa = os.path.join(self.directorio, ruta)
+        if os.path.isfile(completa):
+            return [ruta]
+        if os.path.isdir(completa):
+            return indice_archivos.archivos(ruta)
+        return []
+
+    def sincronizar(self) -> None:
+        """Pone el índice al día con el disco (solo lo pendiente, o todo si hace falta)."""
+        with self._sincronizacion_lock:
+            with self._lock:
+                todo, self._todo = self._todo, False
+                pendientes, self._pendientes = self._pendientes, set()
+            try:
+                with span("indice_contenido.sincronizar", todo=todo, rutas=len(pendientes)) as atributos:
+                    if todo:
+                        indexados = self._comparar(indice_archivos.archivos(), self._registrados())
+                    else:
+                        indexados = 0
+                        for ruta in pendientes:
+                            indexados += self._comparar(self._archivos_en(ruta), self._registrados(ruta))
+                    atributos["indexados"] = indexados
+            except Exception as e:
+                print(f"Error al actualizar el índice de contenido: {e}")
+                with self._lock:
+                    self._todo = True
+
+    def _en_segundo_plano(self) -> None:
+        while True:
+            with self._lock:
+                if not (self._todo or self._pendientes):
+                    self._hilo = None
+                    return
+            self.sincronizar()
+
+    def precargar(self) -> None:
+        """Actualiza el índice en segundo plano (p. ej. al arrancar la aplicación)."""
+        with self._lock:
+            if self._hilo is not None or not (self._todo or self._pendientes):
+                return
+            self._hilo = threading.Thread(target=self._en_segundo_plano, name="indice-contenido", daemon=True)
+            self._hilo.start()
+
+    def al_dia(self) -> bool:
+        with self._lock:
+            return self._hilo is None and not self._todo and not self._pendientes
+
+    def _ponerse_al_dia(self) -> None:
+        with self._lock:
+            en_linea = (self._hilo is None and not self._todo
+                        and 0 < len(self._pendientes) <= MAX_PENDIENTES_EN_LINEA)
+        if en_linea:
+            self.sincronizar()
+        else:
+            self.precargar()
+
+    # --- Consultas -----------------------------------------------------
+
+    def _consultar(self, consulta: str, limite: int, carpeta: str) -> list:
+        sql = (
+            "SELECT d.ruta, l.pagina, l.linea,"
+            " snippet(lineas_fts, 0, '**', '**', '…', 16), bm25(lineas_fts)"
+            " FROM lineas_fts"
+            " JOIN lineas l ON l.id = lineas_fts.rowid"
+            " JOIN documentos d ON d.id = l.doc_id"
+            " WHERE lineas_fts MATCH ?"
+        )
+        parametros = [consulta]
+        if carpeta:
+            sql += " AND (d.ruta = ? OR d.ruta LIKE ? ESCAPE '\\')"
+            parametros += [carpeta, _escapar_like(carpeta) + "/%"]
+        sql += " ORDER BY bm25(lineas_fts) LIMIT ?"
+        parametros.append(limite)
+        conexion = self._conectar()
+        with self._lock:
+            filas = conexion.execute(sql, parametros).fetchall()
+        return [
+            {"ruta": ruta, "pagina": pagina, "linea": linea, "fragmento": fragmento, "puntaje": -puntaje}
+            for ruta, pagina, linea, fragmento, puntaje in filas
+        ]
+
+    def buscar(self, texto: str, limite: int = 20, carpeta: str = "") -> dict:
+        """
+        Líneas de los documentos que contienen todas las palabras del texto
+        (o, si ninguna las tiene todas, alguna), de la más a la menos
+        relevante. Devuelve {"resultados": [{"ruta", "pagina", "linea",
+        "fragmento", "puntaje"}], "completo": bool}; "completo" es False
+        mientras el índice se está armando en segundo plano.
+        """
+        carpeta = carpeta.strip().replace("\\", "/").strip("/")
+        self._ponerse_al_dia()
+        resultados = []
+        consulta = consulta_fts(texto)
+        if consulta:
+            resultados = self._consultar(consulta, limite, carpeta)
+            if not resultados and " AND " in consulta:
+                resultados = self._consultar(consulta_fts(texto, "OR"), limite, carpeta)
+        return {"resultados": resultados, "completo": self.al_dia()}
+
+    def estadisticas(self) -> dict:
+        conexion = self._conectar()
+        with self._lock:
+            documentos = conexion.execute("SELECT COUNT(*) FROM documentos").fetchone()[0]
+            lineas = conexion.execute("SELECT COUNT(*) FROM lineas").fetchone()[0]
+            pendientes = len(self._pendientes)
+        return {"documentos": documentos, "lineas": lineas, "pendientes": pendientes,
+                "al_dia": self.al_dia()}
+
+
+# Índice compartido del directorio de trabajo.
+indice_contenido = IndiceContenido(WORKING_DIR, INDICE_CONTENIDO_DB)
+al_cambiar(indice_contenido.aplicar)
@@ -0,0 +1,532 @@
+# mangle_client.py - Cliente gRPC persistente para el microservicio Mangle
+import os
+import re
+import json
+import time
+import atexit
+import threading
+from collections import OrderedDict
+from typing import NamedTuple, Optional
+import grpc
+from dotenv import load_dotenv
+import mangle_pb2
+import mangle_pb2_grpc
+from tracing import span
+
+load_dotenv()
+# Dirección del servidor. Acepta "host:puerto" o un socket Unix con el formato
+# "unix:///tmp/mangle.sock" (servidor iniciado con --mode=unix).
+MANGLE_TARGET = os.getenv("MANGLE_TARGET", "localhost:8080")
+# Tiempo máximo (en segundos) que puede tardar una llamada antes de abortarse.
+MANGLE_TIMEOUT = float(os.getenv("MANGLE_TIMEOUT", "10"))
+# Intentos totales por llamada cuando el servidor responde UNAVAILABLE.
+MANGLE_MAX_INTENTOS = int(os.getenv("MANGLE_MAX_INTENTOS", "3"))
+# Caché local de resultados: cantidad máxima de consultas guardadas (0 la desactiva)
+# y segundos que se considera válido un resultado.
+MANGLE_CACHE_MAX = int(os.getenv("MANGLE_CACHE_MAX", "256"))
+MANGLE_CACHE_TTL = float(os.getenv("MANGLE_CACHE_TTL", "60"))
+
+
+class Nombre(str):
+    """Constante de tipo nombre de Mangle, como /activo o /proyecto/alpha."""
+    __slots__ = ()
+
+    def __repr__(self):
+        return f"Nombre({str.__repr__(self)})"
+
+
+class Fila(NamedTuple):
+    """Una respuesta de Mangle: el predicado y sus argumentos ya convertidos a tipos de Python."""
+    predicado: str
+    valores: tuple
+
+
+_ESCAPES = {"n": "\n", "t": "\t", "r": "\r", "a": "\a", "b": "\b", "f": "\f",
+            "v": "\v", "\\": "\\", '"': '"', "'": "'"}
+_DELIMITADORES = set(",)]}: \t\n")
+
+
+class _LectorTerminos:
+    """Analizador descendente para los átomos que devuelve el servidor (ast.Atom.String())."""
+
+    def __init__(self, texto: str):
+        self.texto = texto
+        self.pos = 0
+
+    def _saltar_espacios(self):
+        while self.pos < len(self.texto) and self.texto[self.pos].isspace():
+            self.pos += 1
+
+    def _actual(self):
+        self._saltar_espacios()
+        return self.texto[self.pos] if self.pos < len(self.texto) else ""
+
+    def _esperar(self, caracter: str):
+        if self._actual() != caracter:
+            raise ValueError(f"se esperaba '{caracter}' en la posición {self.pos} de {self.texto!r}")
+        self.pos += 1
+
+    def _token(self) -> str:
+        inicio = self.pos
+        while self.pos < len(self.texto):
+            c = self.texto[self.pos]
+            # ':' separa clave y valor en mapas, pero también forma parte de nombres como fn:pair.
+            if c == ":" and self.texto[self.pos + 1:self.pos + 2].isalpha():
+                self.pos += 1
+                continue
+            if c in _DELIMITADORES or c in "([{":
+                break
+            self.pos += 1
+        return self.texto[inicio:self.pos]
+
+    def _argumentos(self, cierre: str) -> list:
+        valores = []
+        if self._actual() == cierre:
+            self.pos += 1
+            return valores
+        while True:
+            valores.append(self.valor())
+            if self._actual() == ",":
+                self.pos += 1
+                continue
+            self._esperar(cierre)
+            return valores
+
+    def _cadena(self) -> str:
+        comilla = self.texto[self.pos]
+        self.pos += 1
+        partes = []
+        while self.pos < len(self.texto):
+            c = self.texto[self.pos]
+            if c == comilla:
+                self.pos += 1
+                return "".join(partes)
+            if c == "\\":
+                self.pos += 1
+                e = self.texto[self.pos:self.pos + 1]
+                if e in _ESCAPES:
+                    partes.append(_ESCAPES[e])
+                    self.pos += 1
+                elif e in ("x", "u", "U"):
+                    largo = {"x": 2, "u": 4, "U": 8}[e]
+                    partes.append(chr(int(self.texto[self.pos + 1:self.pos + 1 + largo], 16)))
+                    self.pos += 1 + largo
+                elif e.isdigit():
+                    partes.append(chr(int(self.texto[self.pos:self.pos + 3], 8)))
+                    self.pos += 3
+                else:
+                    raise ValueError(f"escape desconocido '\\{e}' en {self.texto!r}")
+                continue
+            partes.append(c)
+            self.pos += 1
+        raise ValueError(f"cadena sin cerrar en {self.texto!r}")
+
+    def valor(self):
+        c = self._actual()
+        if c in ('"', "'"):
+            return self._cadena()
+        if c == "b" and self.texto[self.pos + 1:self.pos + 2] == '"':
+            self.pos += 1
+            return self._cadena().encode("latin-1")
+        if c == "[":
+            self.pos += 1
+            if self._actual() == "]":
+                self.pos += 1
+                return []
+            primero = self.valor()
+            if self._actual() == ":":
+                # Mapa: [clave: valor, ...]
+                self.pos += 1
+                mapa = {primero: self.valor()}
+                while self._actual() == ",":
+                    self.pos += 1
+                    clave = self.valor()
+                    self._esperar(":")
+                    mapa[clave] = self.valor()
+                self._esperar("]")
+                return mapa
+            lista = [primero]
+            if self._actual() == ",":
+                self.pos += 1
+                lista.extend(self._argumentos("]"))
+            else:
+                self._esperar("]")
+            return lista
+        if c == "{":
+            # Estructura: {/campo: valor, ...}
+            self.pos += 1
+            estructura = {}
+            while self._actual() != "}":
+                clave = self.valor()
+                self._esperar(":")
+                estructura[clave] = self.valor()
+                if self._actual() == ",":
+                    self.pos += 1
+            self.pos += 1
+            return estructura
+        if c == "/":
+            return Nombre(self._token())
+        token = self._token()
+        if not token:
+            raise ValueError(f"valor vacío en la posición {self.pos} de {self.texto!r}")
+        if self._actual() == "(":
+            # Término aplicado, ej. fn:pair(1, 2): se devuelve como tupla.
+            self.pos += 1
+            return tuple(self._argumentos(")"))
+        try:
+            return int(token)
+        except ValueError:
+            pass
+        try:
+            return float(token)
+        except ValueError:
+            return token
+
+    def atomo(self) -> Fila:
+        self._saltar_espacios()
+        predicado = self._token()
+        if not predicado:
+            raise ValueError(f"no se encontró un predicado en {self.texto!r}")
+        valores = ()
+        if self._actual() == "(":
+            self.pos += 1
+            valores = tuple(self._argumentos(")"))
+        if self._actual() == ".":
+            self.pos += 1
+        if self._actual():
+            raise ValueError(f"texto sobrante en la posición {self.pos} de {self.texto!r}")
+        return Fila(predicado, valores)
+
+
+class Pagina(NamedTuple):
+    """
+    Una página de resultados de una consulta. total es la cantidad total de respuestas
+    informada por el servidor, o None si no la informó o si la lectura se cortó en el
+    límite antes de recibirla; hay_mas indica si quedan filas después de esta página.
+    """
+    filas: list
+    desde: int
+    total: Optional[int]
+    hay_mas: bool
+
+    @property
+    def siguiente(self) -> int:
+        """Valor de 'desde' con el que se pide la página siguiente."""
+        return self.desde + len(self.filas)
+
+
+# Trailer en el que el servidor informa la cantidad total de respuestas de una consulta.
+TRAILER_TOTAL = "x-mangle-total"
+
+
+# Un predicado es un identificador seguido de "(" que no forma parte de un nombre
+# (/foo) ni de una función (fn:sum).
+_PATRON_PREDICADO = re.compile(r"(?<![\w:/.])([a-z_][A-Za-z0-9_]*)\s*\(")
+
+
+def predicados_referenciados(*textos: str) -> frozenset:
+    """Devuelve los nombres de predicado que aparecen en consultas o programas de Mangle."""
+    return frozenset(p for texto in textos if texto for p in _PATRON_PREDICADO.findall(texto))
+
+
+class CacheConsultas:
+    """
+    Caché LRU con vencimiento (TTL) para resultados de consultas. Cada entrada recuerda
+    de qué predicados depende, para poder invalidar solo lo afectado por un Update.
+    """
+
+    def __init__(self, max_entradas: int = MANGLE_CACHE_MAX, ttl: float = MANGLE_CACHE_TTL):
+        self.max_entradas = max_entradas
+        self.ttl = ttl
+        self.aciertos = 0
+        self.fallos = 0
+        self._entradas = OrderedDict()  # clave -> (vence, predicados, valor)
+        self._lock = threading.Lock()
+
+    def obtener(self, clave):
+        """Devuelve el valor guardado para la clave o None si no está o venció."""
+        if self.max_entradas <= 0:
+            return None
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is None or entrada[0] < time.monotonic():
+                if entrada is not None:
+                    del self._entradas[clave]
+                self.fallos += 1
+                return None
+            self._entradas.move_to_end(clave)
+            self.aciertos += 1
+            return entrada[2]
+
+    def guardar(self, clave, predicados: frozenset, valor):
+        if self.max_entradas <= 0:
+            return
+        with self._lock:
+            self._entradas[clave] = (time.monotonic() + self.ttl, predicados, valor)
+            self._entradas.move_to_end(clave)
+            while len(self._entradas) > self.max_entradas:
+                self._entradas.popitem(last=False)
+
+    def descartar(self, clave) -> None:
+        """Descarta una entrada concreta (por ejemplo, si quien la usa detecta que quedó vieja)."""
+        with self._lock:
+            self._entradas.pop(clave, None)
+
+    def invalidar(self, predicados=None) -> int:
+        """
+        Descarta las entradas que dependen de alguno de los predicados indicados
+        (o todas, si no se indica ninguno). Devuelve cuántas se descartaron.
+        """
+        with self._lock:
+            if predicados is None:
+                cantidad = len(self._entradas)
+                self._entradas.clear()
+                return cantidad
+            predicados = set(predicados)
+            claves = [clave for clave, (_, deps, _) in self._entradas.items() if deps & predicados]
+            for clave in claves:
+                del self._entradas[clave]
+            return len(claves)
+
+    def estadisticas(self) -> dict:
+        with self._lock:
+            total = self.aciertos + self.fallos
+            return {
+                "entradas": len(self._entradas),
+                "aciertos": self.aciertos,
+                "fallos": self.fallos,
+                "tasa_aciertos": self.aciertos / total if total else 0.0,
+            }
+
+
+def parsear_respuesta(answer: str) -> Fila:
+    """
+    Convierte una respuesta del servidor (ej. 'horas_semanales("Lucas", "Proyecto_Gamma", 20)')
+    en una Fila con valores tipados: str para cadenas, int/float para números y Nombre
+    para nombres (/activo). Las listas, mapas y estructuras se devuelven como list/dict.
+    Si el texto no se puede interpretar, la fila conserva el texto original como predicado.
+    """
+    try:
+        return _LectorTerminos(answer).atomo()
+    except (ValueError, IndexError):
+        return Fila(answer.strip(), ())
+
+
+class MangleClient:
+    """
+    Cliente reutilizable para el servicio Mangle.
+
+    El canal gRPC se crea la primera vez que se usa y se comparte entre todas las
+    llamadas (HTTP/2 multiplexa las peticiones concurrentes sobre la misma conexión),
+    así que solo la primera consulta paga el costo de conexión. Los reintentos ante
+    UNAVAILABLE los resuelve el propio gRPC mediante la política de reintentos del canal.
+
+    Los resultados de query, query_page y batch_query se guardan en una caché local
+    que se invalida sola cuando un update informa cambios en los predicados de los que
+    depende cada consulta (ver CacheConsultas).
+    """
+
+    def __init__(self, target: str = MANGLE_TARGET, timeout: float = MANGLE_TIMEOUT,
+                 max_intentos: int = MANGLE_MAX_INTENTOS):
+        self.target = target
+        self.timeout = timeout
+        self.max_intentos = max_intentos
+        self._channel = None
+        self._stub = None
+        self._lock = threading.Lock()
+        self.cache = CacheConsultas()
+        # Aumenta cada vez que cambia la base de conocimiento; permite a otras
+        # cachés (p. ej. la de respuestas del agente) saber si quedaron viejas.
+        self.version = 0
+        # Programas de reglas ya registrados en el servidor: {nombre: programa}
+        self._programas_registrados = {}
+
+    def _opciones_canal(self):
+        """Opciones del canal: keepalive y política de reintentos ante UNAVAILABLE."""
+        service_config = {
+            "methodConfig": [{
+                "name": [{"service": "mangle.Mangle"}],
+                "retryPolicy": {
+                    "maxAttempts": max(self.max_intentos, 2),
+                    "initialBackoff": "0.1s",
+                    "maxBackoff": "2s",
+                    "backoffMultiplier": 2,
+                    "retryableStatusCodes": ["UNAVAILABLE"],
+                },
+            }]
+        }
+        return [
+            ("grpc.enable_retries", 1 if self.max_intentos > 1 else 0),
+            ("grpc.service_config", json.dumps(service_config)),
+            ("grpc.keepalive_time_ms", 30000),
+            ("grpc.keepalive_timeout_ms", 10000),
+            ("grpc.keepalive_permit_without_calls", 1),
+            ("grpc.http2.max_pings_without_data", 0),
+        ]
+
+    def _obtener_stub(self):
+        """Devuelve el stub, creando el canal de forma perezosa la primera vez."""
+        if self._stub is None:
+            with self._lock:
+                if self._stub is None:
+                    self._channel = grpc.insecure_channel(self.target, options=self._opciones_canal())
+                    self._stub = mangle_pb2_grpc.MangleStub(self._channel)
+        return self._stub
+
+    def iter_query(self, query: str, program: str = "", limit: int = 0, offset: int = 0,
+                   timeout: float = None):
+        """
+        Generador que devuelve las respuestas de una consulta como objetos Fila a medida
+        que llegan por el stream. Si se deja de consumir (break, close() o llegar a limit),
+        la llamada gRPC se cancela y el servidor deja de evaluar.
+        """
+        with span("mangle.Query", "mangle", consulta=query) as atributos:
+            stub = self._obtener_stub()
+            request = mangle_pb2.QueryRequest(query=query, program=program, limit=limit, offset=offset)
+            llamada = stub.Query(request, timeout=timeout or self.timeout)
+            enviadas = 0
+            try:
+                for result in llamada:
+                    if limit and enviadas >= limit:
+                        break
+                    enviadas += 1
+                    yield parsear_respuesta(result.answer)
+            finally:
+                llamada.cancel()
+                atributos["filas"] = enviadas
+
+    def query(self, query: str, program: str = "", timeout: float = None):
+        """Envía una consulta y devuelve la lista de respuestas como objetos Fila."""
+        clave = ("query", query, program)
+        filas = self.cache.obtener(clave)
+        if filas is None:
+            filas = list(self.iter_query(query, program, timeout=timeout))
+            self.cache.guardar(clave, predicados_referenciados(query, program), filas)
+        return list(filas)
+
+    def query_page(self, query: str, program: str = "", limit: int = 50, offset: int = 0,
+                   timeout: float = None) -> Pagina:
+        """
+        Pide solo una página de resultados (limit filas a partir de offset).
+        El servidor informa el total en el trailer x-mangle-total; si no lo hace
+        (servidor sin paginación), se lee a lo sumo una fila de más para saber si hay más.
+        """
+        clave = ("pagina", query, program, limit, offset)
+        pagina = self.cache.obtener(clave)
+        if pagina is not None:
+            return pagina._replace(filas=list(pagina.filas))
+        with span("mangle.Query", "mangle", consulta=query, limite=limit, desde=offset) as atributos:
+            stub = self._obtener_stub()
+            request = mangle_pb2.QueryRequest(query=query, program=program, limit=limit, offset=offset)
+            llamada = stub.Query(request, timeout=timeout or self.timeout)
+            filas = []
+            cortada = False
+            try:
+                for result in llamada:
+                    if limit and len(filas) >= limit:
+                        cortada = True
+                        break
+                    filas.append(parsear_respuesta(result.answer))
+            finally:
+                llamada.cancel()
+                atributos["filas"] = len(filas)
+
+        total = None
+        if not cortada:
+            for clave, valor in llamada.trailing_metadata() or ():
+                if clave == TRAILER_TOTAL:
+                    total = int(valor)
+        if total is not None:
+            hay_mas = offset + len(filas) < total
+        else:
+            hay_mas = cortada
+        pagina = Pagina(filas, offset, total, hay_mas)
+        self.cache.guardar(clave, predicados_referenciados(query, program), pagina)
+        return pagina._replace(filas=list(filas))
+
+    def batch_query(self, consultas: dict, program: str = "", timeout: float = None):
+        """
+        Envía varias consultas {etiqueta: consulta} en una sola llamada. El servidor las
+        evalúa todas sobre el mismo estado de la base de conocimiento.
+        Devuelve dos diccionarios: {etiqueta: lista de Fila} y {etiqueta: mensaje_de_error}
+        (este último solo con las consultas que fallaron).
+        El lote se guarda entero en la caché, bajo una sola clave: servir unas consultas
+        de la caché y pedir solo el resto mezclaría estados distintos del servidor.
+        """
+        clave = ("lote", tuple(consultas.items()), program)
+        respuestas = self.cache.obtener(clave)
+        if respuestas is not None:
+            return {tag: list(filas) for tag, filas in respuestas.items()}, {}
+
+        respuestas = {}
+        errores = {}
+        with span("mangle.BatchQuery", "mangle", consultas=len(consultas)):
+            stub = self._obtener_stub()
+            request = mangle_pb2.BatchQueryRequest(
+                queries=[mangle_pb2.TaggedQuery(tag=tag, query=query) for tag, query in consultas.items()],
+                program=program,
+            )
+            for grupo in stub.BatchQuery(request, timeout=timeout or self.timeout):
+                if grupo.error:
+                    errores[grupo.tag] = grupo.error
+                else:
+                    respuestas[grupo.tag] = [parsear_respuesta(answer) for answer in grupo.answers]
+        # Se respeta el orden en que se pidieron las consultas.
+        respuestas = {tag: respuestas[tag] for tag in consultas if tag in respuestas}
+        if not errores:
+            self.cache.guardar(clave, predicados_referenciados(program, *consultas.values()), respuestas)
+        return {tag: list(filas) for tag, filas in respuestas.items()}, errores
+
+    def update(self, program: str, timeout: float = None):
+        """Actualiza la base de conocimiento y devuelve los predicados modificados."""
+        with span("mangle.Update", "mangle") as atributos:
+            stub = self._obtener_stub()
+            request = mangle_pb2.UpdateRequest(program=program)
+            response = stub.Update(request, timeout=timeout or self.timeout)
+            actualizados = list(response.updated_predicates)
+            atributos["predicados_actualizados"] = len(actualizados)
+        if actualizados:
+            self.invalidar_cache(actualizados)
+        return actualizados
+
+    def invalidar_cache(self, predicados=None):
+        """Descarta los resultados que dependen de los predicados (o todos) y cambia la versión."""
+        self.cache.invalidar(predicados)
+        self.version += 1
+
+    def registrar_programa(self, nombre: str, programa: str, forzar: bool = False):
+        """
+        Registra en el servidor (mediante update) un programa de reglas con nombre, solo
+        la primera vez que se necesita, si cambió su texto o si se pide forzar. Las reglas
+        quedan en el servidor y sus resultados se mantienen materializados, así que después
+        basta con consultar los predicados que definen. Reenviar las mismas reglas no tiene
+        efecto en el servidor. Ojo: un servidor que arranca sin su base (o con otra) no
+        tiene las reglas, y el canal se reconecta solo, así que este registro puede quedar
+        desactualizado sin que falle ninguna llamada; conviene registrar con las reglas un
+        hecho marca y volver a registrarlas con forzar=True solo si la marca falta.
+        """
+        if not forzar and self._programas_registrados.get(nombre) == programa:
+            return
+        try:
+            self.update(programa)
+        except grpc.RpcError as e:
+            if e.code() == grpc.StatusCode.UNAVAILABLE:
+                # El servidor pudo haberse reiniciado y perdido las reglas.
+                self._programas_registrados.clear()
+            raise
+        self._programas_registrados[nombre] = programa
+
+    def close(self):
+        """Cierra el canal y vacía la caché. La siguiente llamada abrirá uno nuevo."""
+        self.invalidar_cache()
+        self._programas_registrados.clear()
+        with self._lock:
+            if self._channel is not None:
+                self._channel.close()
+            self._channel = None
+            self._stub = None
+
+
+# Cliente compartido por todas las herramientas de tools.py
+cliente_mangle = MangleClient()
+atexit.register(cliente_mangle.close)
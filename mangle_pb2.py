@@ -24,7 +24,7 @@ _sym_db = _symbol_database.Default()
 
 
 
-DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\x0cmangle.proto\x12\x06mangle\".\n\x0cQueryRequest\x12\r\n\x05query\x18\x01 \x01(\t\x12\x0f\n\x07program\x18\x02 \x01(\t\" \n\rUpdateRequest\x12\x0f\n\x07program\x18\x02 \x01(\t\"\x19\n\nQueryError\x12\x0b\n\x03msg\x18\x01 \x01(\t\"\x1a\n\x0bUpdateError\x12\x0b\n\x03msg\x18\x01 \x01(\t\"\x1d\n\x0bQueryAnswer\x12\x0e\n\x06\x61nswer\x18\x01 \x01(\t\"*\n\x0cUpdateAnswer\x12\x1a\n\x12updated_predicates\x18\x02 \x03(\t2u\n\x06Mangle\x12\x34\n\x05Query\x12\x14.mangle.QueryRequest\x1a\x13.mangle.QueryAnswer0\x01\x12\x35\n\x06Update\x12\x15.mangle.UpdateRequest\x1a\x14.mangle.UpdateAnswerB+Z)github.com/burakemir/mangle-service/protob\x06proto3')
+DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\x0cmangle.proto\x12\x06mangle\"M\n\x0cQueryRequest\x12\r\n\x05query\x18\x01 \x01(\t\x12\x0f\n\x07program\x18\x02 \x01(\t\x12\r\n\x05limit\x18\x03 \x01(\r\x12\x0e\n\x06offset\x18\x04 \x01(\r\" \n\rUpdateRequest\x12\x0f\n\x07program\x18\x02 \x01(\t\"\x19\n\nQueryError\x12\x0b\n\x03msg\x18\x01 \x01(\t\"\x1a\n\x0bUpdateError\x12\x0b\n\x03msg\x18\x01 \x01(\t\"\x1d\n\x0bQueryAnswer\x12\x0e\n\x06\x61nswer\x18\x01 \x01(\t\"*\n\x0cUpdateAnswer\x12\x1a\n\x12updated_predicates\x18\x02 \x03(\t\"J\n\x11\x42\x61tchQueryRequest\x12$\n\x07queries\x18\x01 \x03(\x0b\x32\x13.mangle.TaggedQuery\x12\x0f\n\x07program\x18\x02 \x01(\t\")\n\x0bTaggedQuery\x12\x0b\n\x03tag\x18\x01 \x01(\t\x12\r\n\x05query\x18\x02 \x01(\t\"?\n\x10\x42\x61tchQueryAnswer\x12\x0b\n\x03tag\x18\x01 \x01(\t\x12\x0f\n\x07\x61nswers\x18\x02 \x03(\t\x12\r\n\x05\x65rror\x18\x03 \x01(\t2\xba\x01\n\x06Mangle\x12\x34\n\x05Query\x12\x14.mangle.QueryRequest\x1a\x13.mangle.QueryAnswer0\x01\x12\x35\n\x06Update\x12\x15.mangle.UpdateRequest\x1a\x14.mangle.UpdateAnswer\x12\x43\n\nBatchQuery\x12\x19.mangle.BatchQueryRequest\x1a\x18.mangle.BatchQueryAnswer0\x01\x42+Z)github.com/burakemir/mangle-service/protob\x06proto3')
 
 _globals = globals()
 _builder.BuildMessageAndEnumDescriptors(DESCRIPTOR, _globals)
@@ -33,17 +33,23 @@ if not _descriptor._USE_C_DESCRIPTORS:
   _globals['DESCRIPTOR']._loaded_options = None
   _globals['DESCRIPTOR']._serialized_options = b'Z)github.com/burakemir/mangle-service/proto'
   _globals['_QUERYREQUEST']._serialized_start=24
-  _globals['_QUERYREQUEST']._serialized_end=70
-  _globals['_UPDATEREQUEST']._serialized_start=72
-  _globals['_UPDATEREQUEST']._serialized_end=104
-  _globals['_QUERYERROR']._serialized_start=106
-  _globals['_QUERYERROR']._serialized_end=131
-  _globals['_UPDATEERROR']._serialized_start=133
-  _globals['_UPDATEERROR']._serialized_end=159
-  _globals['_QUERYANSWER']._serialized_start=161
-  _globals['_QUERYANSWER']._serialized_end=190
-  _globals['_UPDATEANSWER']._serialized_start=192
-  _globals['_UPDATEANSWER']._serialized_end=234
-  _globals['_MANGLE']._serialized_start=236
-  _globals['_MANGLE']._serialized_end=353
+  _globals['_QUERYREQUEST']._serialized_end=101
+  _globals['_UPDATEREQUEST']._serialized_start=103
+  _globals['_UPDATEREQUEST']._serialized_end=135
+  _globals['_QUERYERROR']._serialized_start=137
+  _globals['_QUERYERROR']._serialized_end=162
+  _globals['_UPDATEERROR']._serialized_start=164
+  _globals['_UPDATEERROR']._serialized_end=190
+  _globals['_QUERYANSWER']._serialized_start=192
+  _globals['_QUERYANSWER']._serialized_end=221
+  _globals['_UPDATEANSWER']._serialized_start=223
+  _globals['_UPDATEANSWER']._serialized_end=265
+  _globals['_BATCHQUERYREQUEST']._serialized_start=267
+  _globals['_BATCHQUERYREQUEST']._serialized_end=341
+  _globals['_TAGGEDQUERY']._serialized_start=343
+  _globals['_TAGGEDQUERY']._serialized_end=384
+  _globals['_BATCHQUERYANSWER']._serialized_start=386
+  _globals['_BATCHQUERYANSWER']._serialized_end=449
+  _globals['_MANGLE']._serialized_start=452
+  _globals['_MANGLE']._serialized_end=638
 # @@protoc_insertion_point(module_scope)
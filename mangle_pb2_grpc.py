@@ -44,6 +44,11 @@ class MangleStub(object):
                 request_serializer=mangle__pb2.UpdateRequest.SerializeToString,
                 response_deserializer=mangle__pb2.UpdateAnswer.FromString,
                 _registered_method=True)
+        self.BatchQuery = channel.unary_stream(
+                '/mangle.Mangle/BatchQuery',
+                request_serializer=mangle__pb2.BatchQueryRequest.SerializeToString,
+                response_deserializer=mangle__pb2.BatchQueryAnswer.FromString,
+                _registered_method=True)
 
 
 class MangleServicer(object):
@@ -52,6 +57,7 @@ class MangleServicer(object):
     def Query(self, request, context):
         """The server answers a query with a stream of responses.
         It is possible that the list of results is empty.
+        If limit or offset are set, only that page of results is sent.
         In case of errors, no answers are sent and a QueryError
         message is included in status response metadata.
         """
@@ -68,6 +74,15 @@ class MangleServicer(object):
         context.set_details('Method not implemented!')
         raise NotImplementedError('Method not implemented!')
 
+    def BatchQuery(self, request, context):
+        """The server answers all queries of the batch, sending one
+        BatchQueryAnswer per query in request order. Updates are not
+        applied while the batch is being evaluated.
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
 
 def add_MangleServicer_to_server(servicer, server):
     rpc_method_handlers = {
@@ -81,6 +96,11 @@ def add_MangleServicer_to_server(servicer, server):
                     request_deserializer=mangle__pb2.UpdateRequest.FromString,
                     response_serializer=mangle__pb2.UpdateAnswer.SerializeToString,
             ),
+            'BatchQuery': grpc.unary_stream_rpc_method_handler(
+                    servicer.BatchQuery,
+                    request_deserializer=mangle__pb2.BatchQueryRequest.FromString,
+                    response_serializer=mangle__pb2.BatchQueryAnswer.SerializeToString,
+            ),
     }
     generic_handler = grpc.method_handlers_generic_handler(
             'mangle.Mangle', rpc_method_handlers)
@@ -145,3 +165,30 @@ class Mangle(object):
             timeout,
             metadata,
             _registered_method=True)
+
+    @staticmethod
+    def BatchQuery(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_stream(
+            request,
+            target,
+            '/mangle.Mangle/BatchQuery',
+            mangle__pb2.BatchQueryRequest.SerializeToString,
+            mangle__pb2.BatchQueryAnswer.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
@@ -42,6 +42,14 @@ type QueryRequest struct {
 	// relations, as long as the overall query is evaluated according
 	// to Mangle semantics.
 	Program string `protobuf:"bytes,2,opt,name=program,proto3" json:"program,omitempty"`
+	// Maximum number of answers to send. Zero means no limit.
+	// The total number of answers (including those that were not
+	// sent) is reported in the "x-mangle-total" trailer.
+	Limit uint32 `protobuf:"varint,3,opt,name=limit,proto3" json:"limit,omitempty"`
+	// Number of answers to skip before the first one is sent.
+	// Together with limit, this allows paging through large
+	// relations: the next page starts at offset + limit.
+	Offset uint32 `protobuf:"varint,4,opt,name=offset,proto3" json:"offset,omitempty"`
 }
 
 func (x *QueryRequest) Reset() {
@@ -90,6 +98,20 @@ func (x *QueryRequest) GetProgram() string {
 	return ""
 }
 
+func (x *QueryRequest) GetLimit() uint32 {
+	if x != nil {
+		return x.Limit
+	}
+	return 0
+}
+
+func (x *QueryRequest) GetOffset() uint32 {
+	if x != nil {
+		return x.Offset
+	}
+	return 0
+}
+
 // An update request consists of fact and rule definitions
 // (a "program"). The program will be evaluated on top of
 // the current state.
@@ -339,39 +361,248 @@ func (x *UpdateAnswer) GetUpdatedPredicates() []string {
 	return nil
 }
 
+// A batch query request bundles several queries, so that a report
+// needs a single round trip. All queries are evaluated against the
+// same state of the store.
+type BatchQueryRequest struct {
+	state         protoimpl.MessageState
+	sizeCache     protoimpl.SizeCache
+	unknownFields protoimpl.UnknownFields
+
+	// The queries to evaluate, each identified by a tag.
+	Queries []*TaggedQuery `protobuf:"bytes,1,rep,name=queries,proto3" json:"queries,omitempty"`
+	// See QueryRequest for what a program is. The program is evaluated
+	// once and shared by all queries of the batch.
+	Program string `protobuf:"bytes,2,opt,name=program,proto3" json:"program,omitempty"`
+}
+
+func (x *BatchQueryRequest) Reset() {
+	*x = BatchQueryRequest{}
+	if protoimpl.UnsafeEnabled {
+		mi := &file_mangle_proto_msgTypes[6]
+		ms := protoimpl.X.MessageStateOf(protoimpl.Pointer(x))
+		ms.StoreMessageInfo(mi)
+	}
+}
+
+func (x *BatchQueryRequest) String() string {
+	return protoimpl.X.MessageStringOf(x)
+}
+
+func (*BatchQueryRequest) ProtoMessage() {}
+
+func (x *BatchQueryRequest) ProtoReflect() protoreflect.Message {
+	mi := &file_mangle_proto_msgTypes[6]
+	if protoimpl.UnsafeEnabled && x != nil {
+		ms := protoimpl.X.MessageStateOf(protoimpl.Pointer(x))
+		if ms.LoadMessageInfo() == nil {
+			ms.StoreMessageInfo(mi)
+		}
+		return ms
+	}
+	return mi.MessageOf(x)
+}
+
+// Deprecated: Use BatchQueryRequest.ProtoReflect.Descriptor instead.
+func (*BatchQueryRequest) Descriptor() ([]byte, []int) {
+	return file_mangle_proto_rawDescGZIP(), []int{6}
+}
+
+func (x *BatchQueryRequest) GetQueries() []*TaggedQuery {
+	if x != nil {
+		return x.Queries
+	}
+	return nil
+}
+
+func (x *BatchQueryRequest) GetProgram() string {
+	if x != nil {
+		return x.Program
+	}
+	return ""
+}
+
+// A query together with a tag chosen by the client.
+type TaggedQuery struct {
+	state         protoimpl.MessageState
+	sizeCache     protoimpl.SizeCache
+	unknownFields protoimpl.UnknownFields
+
+	// Identifies the answers of this query in the response stream.
+	Tag string `protobuf:"bytes,1,opt,name=tag,proto3" json:"tag,omitempty"`
+	// See QueryRequest for what a query is.
+	Query string `protobuf:"bytes,2,opt,name=query,proto3" json:"query,omitempty"`
+}
+
+func (x *TaggedQuery) Reset() {
+	*x = TaggedQuery{}
+	if protoimpl.UnsafeEnabled {
+		mi := &file_mangle_proto_msgTypes[7]
+		ms := protoimpl.X.MessageStateOf(protoimpl.Pointer(x))
+		ms.StoreMessageInfo(mi)
+	}
+}
+
+func (x *TaggedQuery) String() string {
+	return protoimpl.X.MessageStringOf(x)
+}
+
+func (*TaggedQuery) ProtoMessage() {}
+
+func (x *TaggedQuery) ProtoReflect() protoreflect.Message {
+	mi := &file_mangle_proto_msgTypes[7]
+	if protoimpl.UnsafeEnabled && x != nil {
+		ms := protoimpl.X.MessageStateOf(protoimpl.Pointer(x))
+		if ms.LoadMessageInfo() == nil {
+			ms.StoreMessageInfo(mi)
+		}
+		return ms
+	}
+	return mi.MessageOf(x)
+}
+
+// Deprecated: Use TaggedQuery.ProtoReflect.Descriptor instead.
+func (*TaggedQuery) Descriptor() ([]byte, []int) {
+	return file_mangle_proto_rawDescGZIP(), []int{7}
+}
+
+func (x *TaggedQuery) GetTag() string {
+	if x != nil {
+		return x.Tag
+	}
+	return ""
+}
+
+func (x *TaggedQuery) GetQuery() string {
+	if x != nil {
+		return x.Query
+	}
+	return ""
+}
+
+// All answer tuples for one query of a batch.
+type BatchQueryAnswer struct {
+	state         protoimpl.MessageState
+	sizeCache     protoimpl.SizeCache
+	unknownFields protoimpl.UnknownFields
+
+	// The tag of the query these answers belong to.
+	Tag string `protobuf:"bytes,1,opt,name=tag,proto3" json:"tag,omitempty"`
+	// The answer tuples, in the same format as QueryAnswer.answer.
+	Answers []string `protobuf:"bytes,2,rep,name=answers,proto3" json:"answers,omitempty"`
+	// If non-empty, this query could not be evaluated and answers
+	// is empty. The other queries of the batch are not affected.
+	Error string `protobuf:"bytes,3,opt,name=error,proto3" json:"error,omitempty"`
+}
+
+func (x *BatchQueryAnswer) Reset() {
+	*x = BatchQueryAnswer{}
+	if protoimpl.UnsafeEnabled {
+		mi := &file_mangle_proto_msgTypes[8]
+		ms := protoimpl.X.MessageStateOf(protoimpl.Pointer(x))
+		ms.StoreMessageInfo(mi)
+	}
+}
+
+func (x *BatchQueryAnswer) String() string {
+	return protoimpl.X.MessageStringOf(x)
+}
+
+func (*BatchQueryAnswer) ProtoMessage() {}
+
+func (x *BatchQueryAnswer) ProtoReflect() protoreflect.Message {
+	mi := &file_mangle_proto_msgTypes[8]
+	if protoimpl.UnsafeEnabled && x != nil {
+		ms := protoimpl.X.MessageStateOf(protoimpl.Pointer(x))
+		if ms.LoadMessageInfo() == nil {
+			ms.StoreMessageInfo(mi)
+		}
+		return ms
+	}
+	return mi.MessageOf(x)
+}
+
+// Deprecated: Use BatchQueryAnswer.ProtoReflect.Descriptor instead.
+func (*BatchQueryAnswer) Descriptor() ([]byte, []int) {
+	return file_mangle_proto_rawDescGZIP(), []int{8}
+}
+
+func (x *BatchQueryAnswer) GetTag() string {
+	if x != nil {
+		return x.Tag
+	}
+	return ""
+}
+
+func (x *BatchQueryAnswer) GetAnswers() []string {
+	if x != nil {
+		return x.Answers
+	}
+	return nil
+}
+
+func (x *BatchQueryAnswer) GetError() string {
+	if x != nil {
+		return x.Error
+	}
+	return ""
+}
+
 var File_mangle_proto protoreflect.FileDescriptor
 
 var file_mangle_proto_rawDesc = []byte{
 	0x0a, 0x0c, 0x6d, 0x61, 0x6e, 0x67, 0x6c, 0x65, 0x2e, 0x70, 0x72, 0x6f, 0x74, 0x6f, 0x12, 0x06,
-	0x6d, 0x61, 0x6e, 0x67, 0x6c, 0x65, 0x22, 0x3e, 0x0a, 0x0c, 0x51, 0x75, 0x65, 0x72, 0x79, 0x52,
+	0x6d, 0x61, 0x6e, 0x67, 0x6c, 0x65, 0x22, 0x6c, 0x0a, 0x0c, 0x51, 0x75, 0x65, 0x72, 0x79, 0x52,
 	0x65, 0x71, 0x75, 0x65, 0x73, 0x74, 0x12, 0x14, 0x0a, 0x05, 0x71, 0x75, 0x65, 0x72, 0x79, 0x18,
 	0x01, 0x20, 0x01, 0x28, 0x09, 0x52, 0x05, 0x71, 0x75, 0x65, 0x72, 0x79, 0x12, 0x18, 0x0a, 0x07,
 	0x70, 0x72, 0x6f, 0x67, 0x72, 0x61, 0x6d, 0x18, 0x02, 0x20, 0x01, 0x28, 0x09, 0x52, 0x07, 0x70,
-	0x72, 0x6f, 0x67, 0x72, 0x61, 0x6d, 0x22, 0x29, 0x0a, 0x0d, 0x55, 0x70, 0x64, 0x61, 0x74, 0x65,
-	0x52, 0x65, 0x71, 0x75, 0x65, 0x73, 0x74, 0x12, 0x18, 0x0a, 0x07, 0x70, 0x72, 0x6f, 0x67, 0x72,
-	0x61, 0x6d, 0x18, 0x02, 0x20, 0x01, 0x28, 0x09, 0x52, 0x07, 0x70, 0x72, 0x6f, 0x67, 0x72, 0x61,
-	0x6d, 0x22, 0x1e, 0x0a, 0x0a, 0x51, 0x75, 0x65, 0x72, 0x79, 0x45, 0x72, 0x72, 0x6f, 0x72, 0x12,
-	0x10, 0x0a, 0x03, 0x6d, 0x73, 0x67, 0x18, 0x01, 0x20, 0x01, 0x28, 0x09, 0x52, 0x03, 0x6d, 0x73,
-	0x67, 0x22, 0x1f, 0x0a, 0x0b, 0x55, 0x70, 0x64, 0x61, 0x74, 0x65, 0x45, 0x72, 0x72, 0x6f, 0x72,
-	0x12, 0x10, 0x0a, 0x03, 0x6d, 0x73, 0x67, 0x18, 0x01, 0x20, 0x01, 0x28, 0x09, 0x52, 0x03, 0x6d,
-	0x73, 0x67, 0x22, 0x25, 0x0a, 0x0b, 0x51, 0x75, 0x65, 0x72, 0x79, 0x41, 0x6e, 0x73, 0x77, 0x65,
-	0x72, 0x12, 0x16, 0x0a, 0x06, 0x61, 0x6e, 0x73, 0x77, 0x65, 0x72, 0x18, 0x01, 0x20, 0x01, 0x28,
-	0x09, 0x52, 0x06, 0x61, 0x6e, 0x73, 0x77, 0x65, 0x72, 0x22, 0x3d, 0x0a, 0x0c, 0x55, 0x70, 0x64,
-	0x61, 0x74, 0x65, 0x41, 0x6e, 0x73, 0x77, 0x65, 0x72, 0x12, 0x2d, 0x0a, 0x12, 0x75, 0x70, 0x64,
-	0x61, 0x74, 0x65, 0x64, 0x5f, 0x70, 0x72, 0x65, 0x64, 0x69, 0x63, 0x61, 0x74, 0x65, 0x73, 0x18,
-	0x02, 0x20, 0x03, 0x28, 0x09, 0x52, 0x11, 0x75, 0x70, 0x64, 0x61, 0x74, 0x65, 0x64, 0x50, 0x72,
-	0x65, 0x64, 0x69, 0x63, 0x61, 0x74, 0x65, 0x73, 0x32, 0x75, 0x0a, 0x06, 0x4d, 0x61, 0x6e, 0x67,
-	0x6c, 0x65, 0x12, 0x34, 0x0a, 0x05, 0x51, 0x75, 0x65, 0x72, 0x79, 0x12, 0x14, 0x2e, 0x6d, 0x61,
-	0x6e, 0x67, 0x6c, 0x65, 0x2e, 0x51, 0x75, 0x65, 0x72, 0x79, 0x52, 0x65, 0x71, 0x75, 0x65, 0x73,
-	0x74, 0x1a, 0x13, 0x2e, 0x6d, 0x61, 0x6e, 0x67, 0x6c, 0x65, 0x2e, 0x51, 0x75, 0x65, 0x72, 0x79,
-	0x41, 0x6e, 0x73, 0x77, 0x65, 0x72, 0x30, 0x01, 0x12, 0x35, 0x0a, 0x06, 0x55, 0x70, 0x64, 0x61,
-	0x74, 0x65, 0x12, 0x15, 0x2e, 0x6d, 0x61, 0x6e, 0x67, 0x6c, 0x65, 0x2e, 0x55, 0x70, 0x64, 0x61,
-	0x74, 0x65, 0x52, 0x65, 0x71, 0x75, 0x65, 0x73, 0x74, 0x1a, 0x14, 0x2e, 0x6d, 0x61, 0x6e, 0x67,
-	0x6c, 0x65, 0x2e, 0x55, 0x70, 0x64, 0x61, 0x74, 0x65, 0x41, 0x6e, 0x73, 0x77, 0x65, 0x72, 0x42,
-	0x2b, 0x5a, 0x29, 0x67, 0x69, 0x74, 0x68, 0x75, 0x62, 0x2e, 0x63, 0x6f, 0x6d, 0x2f, 0x62, 0x75,
-	0x72, 0x61, 0x6b, 0x65, 0x6d, 0x69, 0x72, 0x2f, 0x6d, 0x61, 0x6e, 0x67, 0x6c, 0x65, 0x2d, 0x73,
-	0x65, 0x72, 0x76, 0x69, 0x63, 0x65, 0x2f, 0x70, 0x72, 0x6f, 0x74, 0x6f, 0x62, 0x06, 0x70, 0x72,
-	0x6f, 0x74, 0x6f, 0x33,
+	0x72, 0x6f, 0x67, 0x72, 0x61, 0x6d, 0x12, 0x14, 0x0a, 0x05, 0x6c, 0x69, 0x6d, 0x69, 0x74, 0x18,
+	0x03, 0x20, 0x01, 0x28, 0x0d, 0x52, 0x05, 0x6c, 0x69, 0x6d, 0x69, 0x74, 0x12, 0x16, 0x0a, 0x06,
+	0x6f, 0x66, 0x66, 0x73, 0x65, 0x74, 0x18, 0x04, 0x20, 0x01, 0x28, 0x0d, 0x52, 0x06, 0x6f, 0x66,
+	0x66, 0x73, 0x65, 0x74, 0x22, 0x29, 0x0a, 0x0d, 0x55, 0x70, 0x64, 0x61, 0x74, 0x65, 0x52, 0x65,
+	0x71, 0x75, 0x65, 0x73, 0x74, 0x12, 0x18, 0x0a, 0x07, 0x70, 0x72, 0x6f, 0x67, 0x72, 0x61, 0x6d,
+	0x18, 0x02, 0x20, 0x01, 0x28, 0x09, 0x52, 0x07, 0x70, 0x72, 0x6f, 0x67, 0x72, 0x61, 0x6d, 0x22,
+	0x1e, 0x0a, 0x0a, 0x51, 0x75, 0x65, 0x72, 0x79, 0x45, 0x72, 0x72, 0x6f, 0x72, 0x12, 0x10, 0x0a,
+	0x03, 0x6d, 0x73, 0x67, 0x18, 0x01, 0x20, 0x01, 0x28, 0x09, 0x52, 0x03, 0x6d, 0x73, 0x67, 0x22,
+	0x1f, 0x0a, 0x0b, 0x55, 0x70, 0x64, 0x61, 0x74, 0x65, 0x45, 0x72, 0x72, 0x6f, 0x72, 0x12, 0x10,
+	0x0a, 0x03, 0x6d, 0x73, 0x67, 0x18, 0x01, 0x20, 0x01, 0x28, 0x09, 0x52, 0x03, 0x6d, 0x73, 0x67,
+	0x22, 0x25, 0x0a, 0x0b, 0x51, 0x75, 0x65, 0x72, 0x79, 0x41, 0x6e, 0x73, 0x77, 0x65, 0x72, 0x12,
+	0x16, 0x0a, 0x06, 0x61, 0x6e, 0x73, 0x77, 0x65, 0x72, 0x18, 0x01, 0x20, 0x01, 0x28, 0x09, 0x52,
+	0x06, 0x61, 0x6e, 0x73, 0x77, 0x65, 0x72, 0x22, 0x3d, 0x0a, 0x0c, 0x55, 0x70, 0x64, 0x61, 0x74,
+	0x65, 0x41, 0x6e, 0x73, 0x77, 0x65, 0x72, 0x12, 0x2d, 0x0a, 0x12, 0x75, 0x70, 0x64, 0x61, 0x74,
+	0x65, 0x64, 0x5f, 0x70, 0x72, 0x65, 0x64, 0x69, 0x63, 0x61, 0x74, 0x65, 0x73, 0x18, 0x02, 0x20,
+	0x03, 0x28, 0x09, 0x52, 0x11, 0x75, 0x70, 0x64, 0x61, 0x74, 0x65, 0x64, 0x50, 0x72, 0x65, 0x64,
+	0x69, 0x63, 0x61, 0x74, 0x65, 0x73, 0x22, 0x5c, 0x0a, 0x11, 0x42, 0x61, 0x74, 0x63, 0x68, 0x51,
+	0x75, 0x65, 0x72, 0x79, 0x52, 0x65, 0x71, 0x75, 0x65, 0x73, 0x74, 0x12, 0x2d, 0x0a, 0x07, 0x71,
+	0x75, 0x65, 0x72, 0x69, 0x65, 0x73, 0x18, 0x01, 0x20, 0x03, 0x28, 0x0b, 0x32, 0x13, 0x2e, 0x6d,
+	0x61, 0x6e, 0x67, 0x6c, 0x65, 0x2e, 0x54, 0x61, 0x67, 0x67, 0x65, 0x64, 0x51, 0x75, 0x65, 0x72,
+	0x79, 0x52, 0x07, 0x71, 0x75, 0x65, 0x72, 0x69, 0x65, 0x73, 0x12, 0x18, 0x0a, 0x07, 0x70, 0x72,
+	0x6f, 0x67, 0x72, 0x61, 0x6d, 0x18, 0x02, 0x20, 0x01, 0x28, 0x09, 0x52, 0x07, 0x70, 0x72, 0x6f,
+	0x67, 0x72, 0x61, 0x6d, 0x22, 0x35, 0x0a, 0x0b, 0x54, 0x61, 0x67, 0x67, 0x65, 0x64, 0x51, 0x75,
+	0x65, 0x72, 0x79, 0x12, 0x10, 0x0a, 0x03, 0x74, 0x61, 0x67, 0x18, 0x01, 0x20, 0x01, 0x28, 0x09,
+	0x52, 0x03, 0x74, 0x61, 0x67, 0x12, 0x14, 0x0a, 0x05, 0x71, 0x75, 0x65, 0x72, 0x79, 0x18, 0x02,
+	0x20, 0x01, 0x28, 0x09, 0x52, 0x05, 0x71, 0x75, 0x65, 0x72, 0x79, 0x22, 0x54, 0x0a, 0x10, 0x42,
+	0x61, 0x74, 0x63, 0x68, 0x51, 0x75, 0x65, 0x72, 0x79, 0x41, 0x6e, 0x73, 0x77, 0x65, 0x72, 0x12,
+	0x10, 0x0a, 0x03, 0x74, 0x61, 0x67, 0x18, 0x01, 0x20, 0x01, 0x28, 0x09, 0x52, 0x03, 0x74, 0x61,
+	0x67, 0x12, 0x18, 0x0a, 0x07, 0x61, 0x6e, 0x73, 0x77, 0x65, 0x72, 0x73, 0x18, 0x02, 0x20, 0x03,
+	0x28, 0x09, 0x52, 0x07, 0x61, 0x6e, 0x73, 0x77, 0x65, 0x72, 0x73, 0x12, 0x14, 0x0a, 0x05, 0x65,
+	0x72, 0x72, 0x6f, 0x72, 0x18, 0x03, 0x20, 0x01, 0x28, 0x09, 0x52, 0x05, 0x65, 0x72, 0x72, 0x6f,
+	0x72, 0x32, 0xba, 0x01, 0x0a, 0x06, 0x4d, 0x61, 0x6e, 0x67, 0x6c, 0x65, 0x12, 0x34, 0x0a, 0x05,
+	0x51, 0x75, 0x65, 0x72, 0x79, 0x12, 0x14, 0x2e, 0x6d, 0x61, 0x6e, 0x67, 0x6c, 0x65, 0x2e, 0x51,
+	0x75, 0x65, 0x72, 0x79, 0x52, 0x65, 0x71, 0x75, 0x65, 0x73, 0x74, 0x1a, 0x13, 0x2e, 0x6d, 0x61,
+	0x6e, 0x67, 0x6c, 0x65, 0x2e, 0x51, 0x75, 0x65, 0x72, 0x79, 0x41, 0x6e, 0x73, 0x77, 0x65, 0x72,
+	0x30, 0x01, 0x12, 0x35, 0x0a, 0x06, 0x55, 0x70, 0x64, 0x61, 0x74, 0x65, 0x12, 0x15, 0x2e, 0x6d,
+	0x61, 0x6e, 0x67, 0x6c, 0x65, 0x2e, 0x55, 0x70, 0x64, 0x61, 0x74, 0x65, 0x52, 0x65, 0x71, 0x75,
+	0x65, 0x73, 0x74, 0x1a, 0x14, 0x2e, 0x6d, 0x61, 0x6e, 0x67, 0x6c, 0x65, 0x2e, 0x55, 0x70, 0x64,
+	0x61, 0x74, 0x65, 0x41, 0x6e, 0x73, 0x77, 0x65, 0x72, 0x12, 0x43, 0x0a, 0x0a, 0x42, 0x61, 0x74,
+	0x63, 0x68, 0x51, 0x75, 0x65, 0x72, 0x79, 0x12, 0x19, 0x2e, 0x6d, 0x61, 0x6e, 0x67, 0x6c, 0x65,
+	0x2e, 0x42, 0x61, 0x74, 0x63, 0x68, 0x51, 0x75, 0x65, 0x72, 0x79, 0x52, 0x65, 0x71, 0x75, 0x65,
+	0x73, 0x74, 0x1a, 0x18, 0x2e, 0x6d, 0x61, 0x6e, 0x67, 0x6c, 0x65, 0x2e, 0x42, 0x61, 0x74, 0x63,
+	0x68, 0x51, 0x75, 0x65, 0x72, 0x79, 0x41, 0x6e, 0x73, 0x77, 0x65, 0x72, 0x30, 0x01, 0x42, 0x2b,
+	0x5a, 0x29, 0x67, 0x69, 0x74, 0x68, 0x75, 0x62, 0x2e, 0x63, 0x6f, 0x6d, 0x2f, 0x62, 0x75, 0x72,
+	0x61, 0x6b, 0x65, 0x6d, 0x69, 0x72, 0x2f, 0x6d, 0x61, 0x6e, 0x67, 0x6c, 0x65, 0x2d, 0x73, 0x65,
+	0x72, 0x76, 0x69, 0x63, 0x65, 0x2f, 0x70, 0x72, 0x6f, 0x74, 0x6f, 0x62, 0x06, 0x70, 0x72, 0x6f,
+	0x74, 0x6f, 0x33,
 }
 
 var (
@@ -386,25 +617,31 @@ func file_mangle_proto_rawDescGZIP() []byte {
 	return file_mangle_proto_rawDescData
 }
 
-var file_mangle_proto_msgTypes = make([]protoimpl.MessageInfo, 6)
+var file_mangle_proto_msgTypes = make([]protoimpl.MessageInfo, 9)
 var file_mangle_proto_goTypes = []interface{}{
-	(*QueryRequest)(nil),  // 0: mangle.QueryRequest
-	(*UpdateRequest)(nil), // 1: mangle.UpdateRequest
-	(*QueryError)(nil),    // 2: mangle.QueryError
-	(*UpdateError)(nil),   // 3: mangle.UpdateError
-	(*QueryAnswer)(nil),   // 4: mangle.QueryAnswer
-	(*UpdateAnswer)(nil),  // 5: mangle.UpdateAnswer
+	(*QueryRequest)(nil),      // 0: mangle.QueryRequest
+	(*UpdateRequest)(nil),     // 1: mangle.UpdateRequest
+	(*QueryError)(nil),        // 2: mangle.QueryError
+	(*UpdateError)(nil),       // 3: mangle.UpdateError
+	(*QueryAnswer)(nil),       // 4: mangle.QueryAnswer
+	(*UpdateAnswer)(nil),      // 5: mangle.UpdateAnswer
+	(*BatchQueryRequest)(nil), // 6: mangle.BatchQueryRequest
+	(*TaggedQuery)(nil),       // 7: mangle.TaggedQuery
+	(*BatchQueryAnswer)(nil),  // 8: mangle.BatchQueryAnswer
 }
 var file_mangle_proto_depIdxs = []int32{
-	0, // 0: mangle.Mangle.Query:input_type -> mangle.QueryRequest
-	1, // 1: mangle.Mangle.Update:input_type -> mangle.UpdateRequest
-	4, // 2: mangle.Mangle.Query:output_type -> mangle.QueryAnswer
-	5, // 3: mangle.Mangle.Update:output_type -> mangle.UpdateAnswer
-	2, // [2:4] is the sub-list for method output_type
-	0, // [0:2] is the sub-list for method input_type
-	0, // [0:0] is the sub-list for extension type_name
-	0, // [0:0] is the sub-list for extension extendee
-	0, // [0:0] is the sub-list for field type_name
+	7, // 0: mangle.BatchQueryRequest.queries:type_name -> mangle.TaggedQuery
+	0, // 1: mangle.Mangle.Query:input_type -> mangle.QueryRequest
+	1, // 2: mangle.Mangle.Update:input_type -> mangle.UpdateRequest
+	6, // 3: mangle.Mangle.BatchQuery:input_type -> mangle.BatchQueryRequest
+	4, // 4: mangle.Mangle.Query:output_type -> mangle.QueryAnswer
+	5, // 5: mangle.Mangle.Update:output_type -> mangle.UpdateAnswer
+	8, // 6: mangle.Mangle.BatchQuery:output_type -> mangle.BatchQueryAnswer
+	4, // [4:7] is the sub-list for method output_type
+	1, // [1:4] is the sub-list for method input_type
+	1, // [1:1] is the sub-list for extension type_name
+	1, // [1:1] is the sub-list for extension extendee
+	0, // [0:1] is the sub-list for field type_name
 }
 
 func init() { file_mangle_proto_init() }
@@ -485,6 +722,42 @@ func file_mangle_proto_init() {
 				return nil
 			}
 		}
+		file_mangle_proto_msgTypes[6].Exporter = func(v interface{}, i int) interface{} {
+			switch v := v.(*BatchQueryRequest); i {
+			case 0:
+				return &v.state
+			case 1:
+				return &v.sizeCache
+			case 2:
+				return &v.unknownFields
+			default:
+				return nil
+			}
+		}
+		file_mangle_proto_msgTypes[7].Exporter = func(v interface{}, i int) interface{} {
+			switch v := v.(*TaggedQuery); i {
+			case 0:
+				return &v.state
+			case 1:
+				return &v.sizeCache
+			case 2:
+				return &v.unknownFields
+			default:
+				return nil
+			}
+		}
+		file_mangle_proto_msgTypes[8].Exporter = func(v interface{}, i int) interface{} {
+			switch v := v.(*BatchQueryAnswer); i {
+			case 0:
+				return &v.state
+			case 1:
+				return &v.sizeCache
+			case 2:
+				return &v.unknownFields
+			default:
+				return nil
+			}
+		}
 	}
 	type x struct{}
 	out := protoimpl.TypeBuilder{
@@ -492,7 +765,7 @@ func file_mangle_proto_init() {
 			GoPackagePath: reflect.TypeOf(x{}).PkgPath(),
 			RawDescriptor: file_mangle_proto_rawDesc,
 			NumEnums:      0,
-			NumMessages:   6,
+			NumMessages:   9,
 			NumExtensions: 0,
 			NumServices:   1,
 		},
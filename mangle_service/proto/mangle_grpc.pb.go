@@ -21,8 +21,9 @@ import (
 const _ = grpc.SupportPackageIsVersion7
 
 const (
-	Mangle_Query_FullMethodName  = "/mangle.Mangle/Query"
-	Mangle_Update_FullMethodName = "/mangle.Mangle/Update"
+	Mangle_Query_FullMethodName      = "/mangle.Mangle/Query"
+	Mangle_Update_FullMethodName     = "/mangle.Mangle/Update"
+	Mangle_BatchQuery_FullMethodName = "/mangle.Mangle/BatchQuery"
 )
 
 // MangleClient is the client API for Mangle service.
@@ -31,6 +32,7 @@ const (
 type MangleClient interface {
 	// The server answers a query with a stream of responses.
 	// It is possible that the list of results is empty.
+	// If limit or offset are set, only that page of results is sent.
 	// In case of errors, no answers are sent and a QueryError
 	// message is included in status response metadata.
 	Query(ctx context.Context, in *QueryRequest, opts ...grpc.CallOption) (Mangle_QueryClient, error)
@@ -38,6 +40,10 @@ type MangleClient interface {
 	// In case of errors, no update happens and an UpdateError
 	// message is included in status response metadata.
 	Update(ctx context.Context, in *UpdateRequest, opts ...grpc.CallOption) (*UpdateAnswer, error)
+	// The server answers all queries of the batch, sending one
+	// BatchQueryAnswer per query in request order. Updates are not
+	// applied while the batch is being evaluated.
+	BatchQuery(ctx context.Context, in *BatchQueryRequest, opts ...grpc.CallOption) (Mangle_BatchQueryClient, error)
 }
 
 type mangleClient struct {
@@ -89,12 +95,45 @@ func (c *mangleClient) Update(ctx context.Context, in *UpdateRequest, opts ...gr
 	return out, nil
 }
 
+func (c *mangleClient) BatchQuery(ctx context.Context, in *BatchQueryRequest, opts ...grpc.CallOption) (Mangle_BatchQueryClient, error) {
+	stream, err := c.cc.NewStream(ctx, &Mangle_ServiceDesc.Streams[1], Mangle_BatchQuery_FullMethodName, opts...)
+	if err != nil {
+		return nil, err
+	}
+	x := &mangleBatchQueryClient{stream}
+	if err := x.ClientStream.SendMsg(in); err != nil {
+		return nil, err
+	}
+	if err := x.ClientStream.CloseSend(); err != nil {
+		return nil, err
+	}
+	return x, nil
+}
+
+type Mangle_BatchQueryClient interface {
+	Recv() (*BatchQueryAnswer, error)
+	grpc.ClientStream
+}
+
+type mangleBatchQueryClient struct {
+	grpc.ClientStream
+}
+
+func (x *mangleBatchQueryClient) Recv() (*BatchQueryAnswer, error) {
+	m := new(BatchQueryAnswer)
+	if err := x.ClientStream.RecvMsg(m); err != nil {
+		return nil, err
+	}
+	return m, nil
+}
+
 // MangleServer is the server API for Mangle service.
 // All implementations must embed UnimplementedMangleServer
 // for forward compatibility
 type MangleServer interface {
 	// The server answers a query with a stream of responses.
 	// It is possible that the list of results is empty.
+	// If limit or offset are set, only that page of results is sent.
 	// In case of errors, no answers are sent and a QueryError
 	// message is included in status response metadata.
 	Query(*QueryRequest, Mangle_QueryServer) error
@@ -102,6 +141,10 @@ type MangleServer interface {
 	// In case of errors, no update happens and an UpdateError
 	// message is included in status response metadata.
 	Update(context.Context, *UpdateRequest) (*UpdateAnswer, error)
+	// The server answers all queries of the batch, sending one
+	// BatchQueryAnswer per query in request order. Updates are not
+	// applied while the batch is being evaluated.
+	BatchQuery(*BatchQueryRequest, Mangle_BatchQueryServer) error
 	mustEmbedUnimplementedMangleServer()
 }
 
@@ -115,6 +158,9 @@ func (UnimplementedMangleServer) Query(*QueryRequest, Mangle_QueryServer) error
 func (UnimplementedMangleServer) Update(context.Context, *UpdateRequest) (*UpdateAnswer, error) {
 	return nil, status.Errorf(codes.Unimplemented, "method Update not implemented")
 }
+func (UnimplementedMangleServer) BatchQuery(*BatchQueryRequest, Mangle_BatchQueryServer) error {
+	return status.Errorf(codes.Unimplemented, "method BatchQuery not implemented")
+}
 func (UnimplementedMangleServer) mustEmbedUnimplementedMangleServer() {}
 
 // UnsafeMangleServer may be embedded to opt out of forward compatibility for this service.
@@ -167,6 +213,27 @@ func _Mangle_Update_Handler(srv interface{}, ctx context.Context, dec func(inter
 	return interceptor(ctx, in, info, handler)
 }
 
+func _Mangle_BatchQuery_Handler(srv interface{}, stream grpc.ServerStream) error {
+	m := new(BatchQueryRequest)
+	if err := stream.RecvMsg(m); err != nil {
+		return err
+	}
+	return srv.(MangleServer).BatchQuery(m, &mangleBatchQueryServer{stream})
+}
+
+type Mangle_BatchQueryServer interface {
+	Send(*BatchQueryAnswer) error
+	grpc.ServerStream
+}
+
+type mangleBatchQueryServer struct {
+	grpc.ServerStream
+}
+
+func (x *mangleBatchQueryServer) Send(m *BatchQueryAnswer) error {
+	return x.ServerStream.SendMsg(m)
+}
+
 // Mangle_ServiceDesc is the grpc.ServiceDesc for Mangle service.
 // It's only intended for direct use with grpc.RegisterService,
 // and not to be introspected or modified (even as a copy)
@@ -185,6 +252,11 @@ var Mangle_ServiceDesc = grpc.ServiceDesc{
 			Handler:       _Mangle_Query_Handler,
 			ServerStreams: true,
 		},
+		{
+			StreamName:    "BatchQuery",
+			Handler:       _Mangle_BatchQuery_Handler,
+			ServerStreams: true,
+		},
 	},
 	Metadata: "mangle.proto",
 }
@@ -15,6 +15,7 @@ import (
 	pb "github.com/burakemir/mangle-service/proto"
 	"github.com/burakemir/mangle-service/service"
 	"google.golang.org/grpc"
+	"google.golang.org/grpc/keepalive"
 )
 
 var (
@@ -123,7 +124,13 @@ func main() {
 		persistor = setUpPersistor(*persistInterval, mangleService.PersistCallback(*db))
 	}
 
-	server := grpc.NewServer()
+	// Python clients keep a long-lived channel and send keepalive pings
+	// (every 30s, also while idle); accept them instead of closing with
+	// GOAWAY "too_many_pings".
+	server := grpc.NewServer(grpc.KeepaliveEnforcementPolicy(keepalive.EnforcementPolicy{
+		MinTime:             10 * time.Second,
+		PermitWithoutStream: true,
+	}))
 	pb.RegisterMangleServer(server, mangleService)
 
 	basectx, cancel := signal.NotifyContext(context.Background(), syscall.SIGINT, syscall.SIGTERM)
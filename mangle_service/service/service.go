@@ -2,14 +2,23 @@
 package service
 
 import (
-	"bytes"
+	"bufio"
 	"compress/gzip"
 	"context"
+	"encoding/json"
+	"errors"
+	"fmt"
 	"io"
+	"io/fs"
 	"log"
+	"maps"
 	"os"
+	"path/filepath"
+	"sort"
+	"strconv"
 	"strings"
 	"sync"
+	"sync/atomic"
 	"time"
 
 	"github.com/google/mangle/analysis"
@@ -17,11 +26,14 @@ import (
 	"github.com/google/mangle/engine"
 	"github.com/google/mangle/factstore"
 	"github.com/google/mangle/parse"
+	"google.golang.org/grpc/metadata"
 
 	pb "github.com/burakemir/mangle-service/proto"
 )
 
-var programInfo *analysis.ProgramInfo
+// TotalTrailer is the trailer key under which Query reports the total
+// number of answers, including those outside the requested page.
+const TotalTrailer = "x-mangle-total"
 
 func copyDecl(decls map[ast.PredicateSym]*ast.Decl) map[ast.PredicateSym]ast.Decl {
 	m := make(map[ast.PredicateSym]ast.Decl, len(decls))
@@ -31,20 +43,104 @@ func copyDecl(decls map[ast.PredicateSym]*ast.Decl) map[ast.PredicateSym]ast.Dec
 	return m
 }
 
+// maxLayers is the number of update layers after which a snapshot is
+// compacted into a single layer, so reads do not slow down as updates pile up.
+const maxLayers = 16
+
+// A snapshot is an immutable version of the database. Its layers are never
+// modified after the snapshot is published: an update builds a new layer
+// and publishes a new snapshot that shares the layers of the previous one.
+// Readers therefore never wait for writers, and a reader sees a consistent
+// state for as long as it holds on to a snapshot.
+type snapshot struct {
+	version uint64
+	// The store loaded from --db (if any), followed by one layer per update.
+	layers []factstore.ReadOnlyFactStore
+	// Current facts of the predicates that are recomputed instead of
+	// updated incrementally (see recomputedPredicates). Their facts in
+	// layers are outdated and hidden.
+	recomputed map[ast.PredicateSym]factstore.ReadOnlyFactStore
+	// Declarations and rules of all updates applied so far.
+	programInfo *analysis.ProgramInfo
+	// Sources of the updates that added rules, in order. They are
+	// persisted next to the db (see rulesPath).
+	sources []string
+}
+
+// Returns a store that reads all layers of the snapshot. Writes go to a
+// fresh layer that is not part of the snapshot.
+func (s *snapshot) store() factstore.FactStore {
+	return factstore.NewMergedStore(readers(s.layers, s.recomputed), factstore.NewSimpleInMemoryStore())
+}
+
+// Returns the stores to read from: layers (and extra), without the facts
+// of the recomputed predicates, followed by the current facts of those.
+func readers(layers []factstore.ReadOnlyFactStore, recomputed map[ast.PredicateSym]factstore.ReadOnlyFactStore, extra ...factstore.ReadOnlyFactStore) []factstore.ReadOnlyFactStore {
+	all := append(layers[:len(layers):len(layers)], extra...)
+	if len(recomputed) == 0 {
+		return all
+	}
+	stores := make([]factstore.ReadOnlyFactStore, 0, len(all)+len(recomputed))
+	for _, layer := range all {
+		stores = append(stores, withoutPredicates{layer, recomputed})
+	}
+	for _, store := range recomputed {
+		stores = append(stores, store)
+	}
+	return stores
+}
+
+// A read-only store that hides the facts of some predicates of another.
+type withoutPredicates struct {
+	factstore.ReadOnlyFactStore
+	hidden map[ast.PredicateSym]factstore.ReadOnlyFactStore
+}
+
+func (s withoutPredicates) GetFacts(query ast.Atom, fn func(ast.Atom) error) error {
+	if _, ok := s.hidden[query.Predicate]; ok {
+		return nil
+	}
+	return s.ReadOnlyFactStore.GetFacts(query, fn)
+}
+
+func (s withoutPredicates) Contains(fact ast.Atom) bool {
+	if _, ok := s.hidden[fact.Predicate]; ok {
+		return false
+	}
+	return s.ReadOnlyFactStore.Contains(fact)
+}
+
+func (s withoutPredicates) ListPredicates() []ast.PredicateSym {
+	var preds []ast.PredicateSym
+	for _, sym := range s.ReadOnlyFactStore.ListPredicates() {
+		if _, ok := s.hidden[sym]; !ok {
+			preds = append(preds, sym)
+		}
+	}
+	return preds
+}
+
 type MangleService struct {
 	pb.UnimplementedMangleServer
-	store       factstore.FactStore
-	programInfo *analysis.ProgramInfo
-	lock        sync.Mutex
-	evalFn      func(store factstore.FactStore) (engine.Stats, error)
+	current atomic.Pointer[snapshot]
+	// Serializes updates, since each one builds on the rules of the previous.
+	updateLock sync.Mutex
+	// Last snapshot written by PersistCallback.
+	persisted *snapshot
+}
+
+// Returns the path of the file where the rules persisted with the db at
+// dbPath are kept.
+func rulesPath(dbPath string) string {
+	return dbPath + ".rules.json"
 }
 
 func New(dbPath string) (*MangleService, error) {
-	var store factstore.FactStore
+	var layers []factstore.ReadOnlyFactStore
+	programInfo := &analysis.ProgramInfo{}
+	var sources []string
 
-	if dbPath == "" {
-		store = factstore.NewSimpleInMemoryStore()
-	} else {
+	if dbPath != "" {
 		// This reads the entire contents into memory.
 		// The fact that it is gzipped may make this more
 		// bearable, but if you have a large DB or small memory
@@ -57,93 +153,224 @@ func New(dbPath string) (*MangleService, error) {
 		if err != nil {
 			return nil, err
 		}
-		store = factstore.NewMergedStore([]factstore.ReadOnlyFactStore{s}, factstore.NewIndexedInMemoryStore())
+		layers = append(layers, s)
+		programInfo = declsFromFacts(s)
+		if sources, err = readRules(rulesPath(dbPath)); err != nil {
+			return nil, err
+		}
 	}
-	return &MangleService{store: store, lock: sync.Mutex{}, programInfo: programInfo}, nil
+	m := &MangleService{}
+	m.current.Store(&snapshot{layers: layers, programInfo: programInfo})
+	// The rules are evaluated again, so facts derived after the db was
+	// written (e.g. if the server stopped in between) are not missing.
+	for _, source := range sources {
+		if _, err := m.apply(source); err != nil {
+			return nil, fmt.Errorf("could not apply rules from %s: %w", rulesPath(dbPath), err)
+		}
+	}
+	return m, nil
+}
+
+// Returns a program with the declarations of the predicates in store, so
+// that rules sent later (or loaded with the db) can read them. One fact of
+// each predicate is analyzed, which is what declares it in an update.
+func declsFromFacts(store factstore.ReadOnlyFactStore) *analysis.ProgramInfo {
+	errFound := errors.New("found")
+	var source strings.Builder
+	for _, sym := range store.ListPredicates() {
+		store.GetFacts(ast.NewQuery(sym), func(fact ast.Atom) error {
+			source.WriteString(fact.String() + ".\n")
+			return errFound
+		})
+	}
+	u, err := parse.Unit(strings.NewReader(source.String()))
+	if err == nil {
+		var info *analysis.ProgramInfo
+		if info, err = analysis.Analyze([]parse.SourceUnit{u}, copyDecl(nil)); err == nil {
+			return &analysis.ProgramInfo{Decls: info.Decls, EdbPredicates: info.EdbPredicates}
+		}
+	}
+	log.Printf("service.go: could not declare the predicates of the db: %v", err)
+	return &analysis.ProgramInfo{}
+}
+
+// Returns the update sources persisted at path, or none if there is no
+// such file.
+func readRules(path string) ([]string, error) {
+	data, err := os.ReadFile(path)
+	if errors.Is(err, fs.ErrNotExist) {
+		return nil, nil
+	}
+	if err != nil {
+		return nil, err
+	}
+	var sources []string
+	if err := json.Unmarshal(data, &sources); err != nil {
+		return nil, fmt.Errorf("%s: %w", path, err)
+	}
+	return sources, nil
+}
+
+// Returns the current snapshot. It stays valid (and unchanged) even if
+// updates are published while it is in use.
+func (m *MangleService) snapshot() *snapshot {
+	return m.current.Load()
 }
 
 // This should only be called once.
+// The callback writes the current snapshot, so queries and updates go on
+// while it runs. The db is streamed to a temporary file next to dbPath
+// that replaces dbPath only once it is complete; if nothing changed since
+// the last call, nothing is written.
+// The rules of the updates are written too, to rulesPath(dbPath), so a
+// server started again from dbPath keeps applying them.
 func (m *MangleService) PersistCallback(dbPath string) func() {
 	return func() {
-		m.lock.Lock()
-		defer m.lock.Unlock()
-		var start = time.Now()
-		var b bytes.Buffer
-		w := gzip.NewWriter(&b)
-		sc := factstore.SimpleColumn{} // non-deterministic
-		if err := sc.WriteTo(m.store, w); err != nil {
-			log.Fatal(err)
+		snap := m.snapshot()
+		if snap == m.persisted {
+			return
 		}
-		if err := w.Close(); err != nil {
-			log.Fatal(err)
-		}
-		if err := os.WriteFile(dbPath, b.Bytes(), 0644); err != nil {
-			log.Fatal(err)
+		var start = time.Now()
+		if err := writeSnapshot(snap, dbPath); err != nil {
+			log.Printf("could not write db at %s: %v", dbPath, err)
+			return
 		}
-		log.Printf("wrote db at %s (%s)", dbPath, time.Now().Sub(start))
+		m.persisted = snap
+		log.Printf("wrote db at %s (version %d, %s)", dbPath, snap.version, time.Now().Sub(start))
 	}
 }
 
-// Parses, analyzes and evaluates source, using current store.
-func (m *MangleService) UpdateFromSource(reader io.Reader) error {
-	u, err := parse.Unit(reader)
+// Writes the rules of snap and then its facts. The rules go first: if the
+// db is not written after them, the next start evaluates them again on the
+// previous db (see New), while a db without its rules would serve derived
+// predicates that no longer grow.
+func writeSnapshot(snap *snapshot, dbPath string) error {
+	rules, err := json.Marshal(snap.sources)
 	if err != nil {
 		return err
 	}
-	info, err := analysis.Analyze([]parse.SourceUnit{u}, nil)
+	err = writeFile(rulesPath(dbPath), func(w io.Writer) error {
+		_, err := w.Write(rules)
+		return err
+	})
 	if err != nil {
 		return err
 	}
-	programInfo = info
-	strata, predToStratum, err := analysis.Stratify(analysis.Program{
-		EdbPredicates: programInfo.EdbPredicates,
-		IdbPredicates: programInfo.IdbPredicates,
-		Rules:         programInfo.Rules,
+	return writeFile(dbPath, func(w io.Writer) error {
+		gz := gzip.NewWriter(w)
+		sc := factstore.SimpleColumn{} // non-deterministic
+		if err := sc.WriteTo(snap.store(), gz); err != nil {
+			return err
+		}
+		return gz.Close()
 	})
+}
+
+// Streams write to a temporary file next to path, which replaces path
+// only once it is complete.
+func writeFile(path string, write func(io.Writer) error) (err error) {
+	f, err := os.CreateTemp(filepath.Dir(path), filepath.Base(path)+".tmp-*")
 	if err != nil {
 		return err
 	}
-	m.evalFn = func(store factstore.FactStore) (engine.Stats, error) {
-		return engine.EvalStratifiedProgramWithStats(programInfo, strata, predToStratum, store)
+	defer func() {
+		if err != nil {
+			f.Close()
+			os.Remove(f.Name())
+		}
+	}()
+	buf := bufio.NewWriter(f)
+	if err := write(buf); err != nil {
+		return err
+	}
+	if err := buf.Flush(); err != nil {
+		return err
+	}
+	if err := f.Sync(); err != nil {
+		return err
 	}
-	stats, err := m.evalFn(m.store)
+	if err := f.Close(); err != nil {
+		return err
+	}
+	if err := os.Chmod(f.Name(), 0644); err != nil {
+		return err
+	}
+	return os.Rename(f.Name(), path)
+}
+
+// Parses, analyzes and evaluates source, using current store.
+func (m *MangleService) UpdateFromSource(reader io.Reader) error {
+	source, err := io.ReadAll(reader)
 	if err != nil {
 		return err
 	}
-	log.Printf("service.go:UpdateFromSource: initial eval finished. \nstats: %v\nnum facts:%d",
-		stats, m.store.EstimateFactCount())
+	if _, err := m.apply(string(source)); err != nil {
+		return err
+	}
+	log.Printf("service.go:UpdateFromSource: initial eval finished. \nnum facts:%d",
+		m.snapshot().store().EstimateFactCount())
 	return nil
 }
 
+// Returns the store that queries should read from. If program is non-empty,
+// it is evaluated on top of store and the derived facts are kept in a
+// separate layer, so store itself is not modified.
+func withProgram(store factstore.FactStore, current *analysis.ProgramInfo, program string) (factstore.FactStore, error) {
+	if program == "" {
+		return store, nil
+	}
+	u, err := parse.Unit(strings.NewReader(program))
+	if err != nil {
+		return nil, err
+	}
+	info, err := analysis.Analyze([]parse.SourceUnit{u}, copyDecl(current.Decls))
+	if err != nil {
+		return nil, err
+	}
+	teeing := factstore.NewTeeingStore(store)
+	stats, err := engine.EvalProgramWithStats(info, teeing)
+	if err != nil {
+		return nil, err
+	}
+	log.Printf("service.go: evaluation of request program finished. stats: %v\n", stats)
+	log.Printf("service.go: store predicates: %s\n", teeing.ListPredicates())
+	return teeing, nil
+}
+
+// Parses a query atom. A trailing period ("foo(X).") is accepted, since
+// clients often write queries the way facts are written.
+func parseQuery(query string) (ast.Atom, error) {
+	return parse.Atom(strings.TrimSuffix(strings.TrimSpace(query), "."))
+}
+
 func (m *MangleService) Query(req *pb.QueryRequest, stream pb.Mangle_QueryServer) error {
-	var store = m.store
-	if program := req.GetProgram(); program != "" {
-		u, err := parse.Unit(strings.NewReader(program))
-		if err != nil {
-			return err
-		}
-		programInfo, err := analysis.Analyze([]parse.SourceUnit{u}, copyDecl(programInfo.Decls))
-		if err != nil {
-			return err
-		}
-		store = factstore.NewTeeingStore(store)
-		stats, err := engine.EvalProgramWithStats(programInfo, store)
-		if err != nil {
-			return err
-		}
-		log.Printf("service.go:Query evaluation of request program finished. stats: %v\n", stats)
-		log.Printf("service.go:Query store predicates: %s\n", store.ListPredicates())
+	snap := m.snapshot()
+	store, err := withProgram(snap.store(), snap.programInfo, req.GetProgram())
+	if err != nil {
+		return err
 	}
 
 	query := req.GetQuery()
-	u, err := parse.Atom(query)
+	u, err := parseQuery(query)
 	if err != nil {
 		log.Printf("service.go:Query parse %q (query) failed: %v\n", query, err)
 		return err
 	}
 
 	log.Printf("querying store with query %v", u)
+	offset := int(req.GetOffset())
+	limit := int(req.GetLimit())
+	total := 0
 	err = store.GetFacts(u, func(a ast.Atom) error {
+		// Stop as soon as the client cancels, e.g. after reading enough rows.
+		if err := stream.Context().Err(); err != nil {
+			return err
+		}
+		total++
+		if total <= offset || (limit > 0 && total > offset+limit) {
+			// Outside the requested page: only counted for the trailer.
+			return nil
+		}
 		answer := &pb.QueryAnswer{
 			Answer: a.String(),
 		}
@@ -156,48 +383,464 @@ func (m *MangleService) Query(req *pb.QueryRequest, stream pb.Mangle_QueryServer
 	if err != nil {
 		return err
 	}
+	stream.SetTrailer(metadata.Pairs(TotalTrailer, strconv.Itoa(total)))
 	return nil
 }
 
-func (m *MangleService) Update(ctx context.Context, req *pb.UpdateRequest) (*pb.UpdateAnswer, error) {
-	u, err := parse.Unit(strings.NewReader(req.GetProgram()))
+// All queries of a batch are evaluated on the same snapshot, so their
+// answers reflect the same state even if updates are published meanwhile.
+func (m *MangleService) BatchQuery(req *pb.BatchQueryRequest, stream pb.Mangle_BatchQueryServer) error {
+	snap := m.snapshot()
+	store, err := withProgram(snap.store(), snap.programInfo, req.GetProgram())
 	if err != nil {
-		return nil, err
+		return err
 	}
-	//programInfo, err := analysis.Analyze([]parse.SourceUnit{u}, copyDecl(programInfo.Decls))
-	if err != nil {
-		return nil, err
+
+	for _, q := range req.GetQueries() {
+		answer := &pb.BatchQueryAnswer{Tag: q.GetTag()}
+		u, err := parseQuery(q.GetQuery())
+		if err != nil {
+			log.Printf("service.go:BatchQuery parse %q (query) failed: %v\n", q.GetQuery(), err)
+			answer.Error = err.Error()
+		} else if err := store.GetFacts(u, func(a ast.Atom) error {
+			answer.Answers = append(answer.Answers, a.String())
+			return nil
+		}); err != nil {
+			answer.Answers = nil
+			answer.Error = err.Error()
+		}
+		if err := stream.Send(answer); err != nil {
+			log.Printf("service.go: got send err: %v", err)
+			return err
+		}
 	}
-	info, err := analysis.Analyze([]parse.SourceUnit{u}, nil)
+	log.Printf("service.go:BatchQuery evaluated %d queries", len(req.GetQueries()))
+	return nil
+}
+
+func (m *MangleService) Update(ctx context.Context, req *pb.UpdateRequest) (*pb.UpdateAnswer, error) {
+	return m.apply(req.GetProgram())
+}
+
+// Applies an update on top of the current state. The unit is analyzed
+// against the declarations already known, its rules are added to the
+// rules of previous updates, and its facts are added to the store
+// directly. Then the derived facts are brought up to date one stratum at
+// a time (see evalChanges), evaluating only the strata that read a
+// predicate that actually got new facts. An update that only adds facts
+// for predicates no rule reads does no evaluation at all.
+// Derived facts are never retracted, except those of recomputed
+// predicates, which are replaced as a whole.
+func (m *MangleService) apply(source string) (*pb.UpdateAnswer, error) {
+	u, err := parse.Unit(strings.NewReader(source))
 	if err != nil {
 		return nil, err
 	}
-	programInfo = info
-	strata, predToStratum, err := analysis.Stratify(analysis.Program{
-		EdbPredicates: programInfo.EdbPredicates,
-		IdbPredicates: programInfo.IdbPredicates,
-		Rules:         programInfo.Rules,
-	})
+	m.updateLock.Lock()
+	defer m.updateLock.Unlock()
+
+	snap := m.snapshot()
+	info, err := analysis.Analyze([]parse.SourceUnit{u}, copyDecl(snap.programInfo.Decls))
 	if err != nil {
 		return nil, err
 	}
+	merged, newRules := mergeProgram(snap.programInfo, info)
 
+	// New facts go to a new layer; the layers of snap are only read.
+	// delta holds the facts that are new in this update, each under the
+	// delta predicate of its own predicate (see deltaSym).
+	old := snap.store()
 	updates := factstore.NewSimpleInMemoryStore()
-	merging := factstore.NewMergedStore([]factstore.FactStore{m.store}, updates)
-	stats, err := engine.EvalStratifiedProgramWithStats(programInfo, strata, predToStratum, merging)
+	delta := factstore.NewSimpleInMemoryStore()
+	changed := make(map[ast.PredicateSym]bool)
+	for _, fact := range info.InitialFacts {
+		if !old.Contains(fact) && updates.Add(fact) {
+			delta.Add(ast.Atom{Predicate: deltaSym(fact.Predicate), Args: fact.Args})
+			changed[fact.Predicate] = true
+		}
+	}
+
+	recomputed, evaluated, err := evalChanges(merged, newRules, snap, old, updates, delta, changed)
 	if err != nil {
 		return nil, err
 	}
 
+	// Only the predicates whose facts changed are reported, so clients
+	// invalidate exactly what they have to.
 	var updatedPreds []string
-	for _, sym := range updates.ListPredicates() {
+	for sym := range changed {
 		updatedPreds = append(updatedPreds, sym.Symbol)
 	}
+	sort.Strings(updatedPreds)
 
 	answer := &pb.UpdateAnswer{UpdatedPredicates: updatedPreds}
-	log.Printf("Updated, stats: %v\n updated preds: %v", stats, answer)
-	m.lock.Lock()
-	defer m.lock.Unlock()
-	m.store.Merge(updates)
+	log.Printf("Updated, %d new facts, %d new rules, %d rules evaluated\n updated preds: %v",
+		len(info.InitialFacts), len(newRules), evaluated, answer)
+	layers := snap.layers
+	if len(updates.ListPredicates()) > 0 {
+		layers = append(layers[:len(layers):len(layers)], updates)
+	}
+	if len(layers) > maxLayers {
+		layers = compact(layers, recomputed)
+	}
+	sources := snap.sources
+	if len(newRules) > 0 {
+		sources = append(sources[:len(sources):len(sources)], source)
+	}
+	m.current.Store(&snapshot{version: snap.version + 1, layers: layers, recomputed: recomputed, programInfo: merged, sources: sources})
 	return answer, nil
 }
+
+// Returns layers with all but the first layer merged into one. The first
+// layer (the db loaded at startup, or the first update) is usually the
+// largest one and is kept as is. The outdated facts of recomputed
+// predicates are dropped. The given layers are not modified.
+func compact(layers []factstore.ReadOnlyFactStore, recomputed map[ast.PredicateSym]factstore.ReadOnlyFactStore) []factstore.ReadOnlyFactStore {
+	start := time.Now()
+	compacted := factstore.NewIndexedInMemoryStore()
+	for _, layer := range layers[1:] {
+		compacted.Merge(withoutPredicates{layer, recomputed})
+	}
+	log.Printf("service.go: compacted %d layers (%s)", len(layers)-1, time.Now().Sub(start))
+	return []factstore.ReadOnlyFactStore{layers[0], compacted}
+}
+
+// Returns a new program with the declarations and rules of both current
+// and info, together with the rules of info that current did not have
+// yet. Sending the same rule twice does not duplicate it.
+func mergeProgram(current, info *analysis.ProgramInfo) (*analysis.ProgramInfo, []ast.Clause) {
+	merged := &analysis.ProgramInfo{
+		EdbPredicates: union(current.EdbPredicates, info.EdbPredicates),
+		IdbPredicates: union(current.IdbPredicates, info.IdbPredicates),
+		Decls:         union(current.Decls, info.Decls),
+		Rules:         append([]ast.Clause(nil), current.Rules...),
+	}
+	known := make(map[string]bool, len(current.Rules))
+	for _, rule := range current.Rules {
+		known[rule.String()] = true
+	}
+	var newRules []ast.Clause
+	for _, rule := range info.Rules {
+		if known[rule.String()] {
+			continue
+		}
+		known[rule.String()] = true
+		merged.Rules = append(merged.Rules, rule)
+		newRules = append(newRules, rule)
+	}
+	return merged, newRules
+}
+
+// Returns the changed predicates together with the head predicates of
+// all rules that (transitively) read one of them.
+func affectedPredicates(rules []ast.Clause, changed map[ast.PredicateSym]bool) map[ast.PredicateSym]bool {
+	affected := maps.Clone(changed)
+	for grew := true; grew; {
+		grew = false
+		for _, rule := range rules {
+			if affected[rule.Head.Predicate] {
+				continue
+			}
+			if readsAny(rule, affected) {
+				affected[rule.Head.Predicate] = true
+				grew = true
+			}
+		}
+	}
+	return affected
+}
+
+// Returns the predicates a rule reads from.
+func premisePredicates(rule ast.Clause) []ast.PredicateSym {
+	var preds []ast.PredicateSym
+	for _, premise := range rule.Premises {
+		switch p := premise.(type) {
+		case ast.Atom:
+			preds = append(preds, p.Predicate)
+		case ast.NegAtom:
+			preds = append(preds, p.Atom.Predicate)
+		}
+	}
+	return preds
+}
+
+// Reports whether rule reads one of preds.
+func readsAny(rule ast.Clause, preds map[ast.PredicateSym]bool) bool {
+	for _, sym := range premisePredicates(rule) {
+		if preds[sym] {
+			return true
+		}
+	}
+	return false
+}
+
+// Returns the predicates defined by a rule with aggregation (a transform)
+// or negation, together with those that (transitively) read one of them.
+// New facts can make their earlier results wrong (a sum that grew, a fact
+// that is no longer missing), so they are recomputed instead of updated.
+func recomputedPredicates(rules []ast.Clause) map[ast.PredicateSym]bool {
+	nonMonotone := make(map[ast.PredicateSym]bool)
+	for _, rule := range rules {
+		if rule.Transform != nil {
+			nonMonotone[rule.Head.Predicate] = true
+			continue
+		}
+		for _, premise := range rule.Premises {
+			if _, ok := premise.(ast.NegAtom); ok {
+				nonMonotone[rule.Head.Predicate] = true
+			}
+		}
+	}
+	return affectedPredicates(rules, nonMonotone)
+}
+
+// Returns the predicate that holds the new facts of sym during an update.
+// Mangle names start with a letter, so it cannot clash with a user's.
+func deltaSym(sym ast.PredicateSym) ast.PredicateSym {
+	return ast.PredicateSym{Symbol: "_delta_" + sym.Symbol, Arity: sym.Arity}
+}
+
+// Brings the derived facts up to date after an update. The strata of
+// program are visited in evaluation order, and a stratum is evaluated only
+// if it has a new rule or reads a predicate in changed. Monotone strata
+// are evaluated on the delta (see evalDelta), recomputed ones from scratch
+// (see recomputeStratum). changed and delta grow with the facts each stratum
+// derives, so later strata see them; new facts go to updates.
+// Returns the current facts of the recomputed predicates and the number of
+// rules evaluated.
+func evalChanges(program *analysis.ProgramInfo, newRules []ast.Clause, snap *snapshot, old factstore.ReadOnlyFactStore,
+	updates, delta factstore.FactStore, changed map[ast.PredicateSym]bool) (map[ast.PredicateSym]factstore.ReadOnlyFactStore, int, error) {
+	recomputed := make(map[ast.PredicateSym]factstore.ReadOnlyFactStore, len(snap.recomputed))
+	maps.Copy(recomputed, snap.recomputed)
+	isNew := make(map[string]bool, len(newRules))
+	for _, rule := range newRules {
+		isNew[rule.String()] = true
+	}
+	pending := len(newRules) > 0
+	for _, rule := range program.Rules {
+		pending = pending || readsAny(rule, changed)
+	}
+	if !pending {
+		return recomputed, 0, nil
+	}
+
+	strata, predToStratum, err := analysis.Stratify(analysis.Program{
+		EdbPredicates: program.EdbPredicates,
+		IdbPredicates: program.IdbPredicates,
+		Rules:         program.Rules,
+	})
+	if err != nil {
+		return nil, 0, err
+	}
+	rulesByStratum := make([][]ast.Clause, len(strata))
+	for _, rule := range program.Rules {
+		i := predToStratum[rule.Head.Predicate]
+		rulesByStratum[i] = append(rulesByStratum[i], rule)
+	}
+	toRecompute := recomputedPredicates(program.Rules)
+
+	evaluated := 0
+	for _, rules := range rulesByStratum {
+		heads := make(map[ast.PredicateSym]bool)
+		affected, recompute := false, false
+		for _, rule := range rules {
+			heads[rule.Head.Predicate] = true
+			affected = affected || isNew[rule.String()] || readsAny(rule, changed)
+			recompute = recompute || toRecompute[rule.Head.Predicate]
+		}
+		if !affected {
+			continue
+		}
+		if recompute {
+			err = recomputeStratum(program, rules, heads, snap, old, updates, recomputed, changed)
+		} else {
+			err = evalDelta(program, rules, heads, isNew, snap, old, updates, delta, recomputed, changed)
+		}
+		if err != nil {
+			return nil, 0, err
+		}
+		evaluated += len(rules)
+	}
+	return recomputed, evaluated, nil
+}
+
+// Evaluates a monotone stratum (no aggregation or negation) on the delta.
+// Each rule is rewritten once for every premise over a changed predicate
+// or a predicate of the stratum: the rewritten rule reads that premise
+// from its delta predicate, first, so the new facts drive the join and the
+// full relations are only probed. The rewritten rules derive into the
+// delta predicates of the stratum, which are copied into the predicates
+// themselves; the engine then evaluates this program semi-naively, so a
+// new fact of the stratum feeds its recursive rules only once. A new rule
+// has no earlier results and is evaluated whole, into its delta predicate.
+// The derived facts that are really new are added to updates, and their
+// delta facts to delta for the strata that follow.
+func evalDelta(program *analysis.ProgramInfo, stratumRules []ast.Clause, heads map[ast.PredicateSym]bool, isNew map[string]bool,
+	snap *snapshot, old factstore.ReadOnlyFactStore, updates, delta factstore.FactStore,
+	recomputed map[ast.PredicateSym]factstore.ReadOnlyFactStore, changed map[ast.PredicateSym]bool) error {
+	decls := maps.Clone(program.Decls)
+	idb := filterKeys(program.IdbPredicates, func(sym ast.PredicateSym) bool { return heads[sym] })
+	edb := union(program.EdbPredicates, filterKeys(program.IdbPredicates, func(sym ast.PredicateSym) bool { return !heads[sym] }))
+	addDelta := func(set map[ast.PredicateSym]struct{}, sym ast.PredicateSym) {
+		set[deltaSym(sym)] = struct{}{}
+		if decl, ok := program.Decls[sym]; ok {
+			deltaDecl := *decl
+			deltaDecl.DeclaredAtom = ast.Atom{Predicate: deltaSym(sym), Args: decl.DeclaredAtom.Args}
+			decls[deltaSym(sym)] = &deltaDecl
+		}
+	}
+
+	var rules []ast.Clause
+	for sym := range heads {
+		addDelta(idb, sym)
+		rules = append(rules, copyRule(sym))
+	}
+	for sym := range changed {
+		if !heads[sym] {
+			addDelta(edb, sym)
+		}
+	}
+	for _, rule := range stratumRules {
+		deltaHead := ast.Atom{Predicate: deltaSym(rule.Head.Predicate), Args: rule.Head.Args}
+		if isNew[rule.String()] {
+			rules = append(rules, ast.Clause{Head: deltaHead, Premises: rule.Premises})
+			continue
+		}
+		for i, premise := range rule.Premises {
+			atom, ok := premise.(ast.Atom)
+			if !ok || !(changed[atom.Predicate] || heads[atom.Predicate]) {
+				continue
+			}
+			premises := make([]ast.Term, 0, len(rule.Premises))
+			premises = append(premises, ast.Atom{Predicate: deltaSym(atom.Predicate), Args: atom.Args})
+			premises = append(premises, rule.Premises[:i]...)
+			premises = append(premises, rule.Premises[i+1:]...)
+			rules = append(rules, ast.Clause{Head: deltaHead, Premises: premises})
+		}
+	}
+
+	derived := factstore.NewSimpleInMemoryStore()
+	store := factstore.NewMergedStore(readers(snap.layers, recomputed, updates, delta), derived)
+	if err := evalRules(decls, edb, idb, rules, store); err != nil {
+		return err
+	}
+	for sym := range heads {
+		err := derived.GetFacts(ast.NewQuery(deltaSym(sym)), func(fact ast.Atom) error {
+			atom := ast.Atom{Predicate: sym, Args: fact.Args}
+			if !old.Contains(atom) && updates.Add(atom) {
+				delta.Add(fact)
+				changed[sym] = true
+			}
+			return nil
+		})
+		if err != nil {
+			return err
+		}
+	}
+	return nil
+}
+
+// Returns the rule sym(X0, ..., Xn) :- deltaSym(sym)(X0, ..., Xn).
+func copyRule(sym ast.PredicateSym) ast.Clause {
+	args := make([]ast.BaseTerm, sym.Arity)
+	for i := range args {
+		args[i] = ast.Variable{Symbol: fmt.Sprintf("X%d", i)}
+	}
+	return ast.Clause{
+		Head:     ast.Atom{Predicate: sym, Args: args},
+		Premises: []ast.Term{ast.Atom{Predicate: deltaSym(sym), Args: args}},
+	}
+}
+
+// Evaluates a stratum of recomputed predicates from scratch, hiding their
+// current facts, and replaces those facts in recomputed with the result.
+// The cost grows with the relations the stratum reads, not with the delta:
+// aggregation and negation cannot be updated from the new facts alone.
+func recomputeStratum(program *analysis.ProgramInfo, rules []ast.Clause, heads map[ast.PredicateSym]bool,
+	snap *snapshot, old factstore.ReadOnlyFactStore, updates factstore.FactStore,
+	recomputed map[ast.PredicateSym]factstore.ReadOnlyFactStore, changed map[ast.PredicateSym]bool) error {
+	hidden := maps.Clone(recomputed)
+	for sym := range heads {
+		hidden[sym] = factstore.NewSimpleInMemoryStore()
+	}
+	idb := filterKeys(program.IdbPredicates, func(sym ast.PredicateSym) bool { return heads[sym] })
+	edb := union(program.EdbPredicates, filterKeys(program.IdbPredicates, func(sym ast.PredicateSym) bool { return !heads[sym] }))
+	derived := factstore.NewSimpleInMemoryStore()
+	store := factstore.NewMergedStore(readers(snap.layers, hidden, updates), derived)
+	if err := evalRules(program.Decls, edb, idb, rules, store); err != nil {
+		return err
+	}
+	for sym := range heads {
+		facts := factstore.NewSimpleInMemoryStore()
+		n := 0
+		err := derived.GetFacts(ast.NewQuery(sym), func(fact ast.Atom) error {
+			if facts.Add(fact) {
+				n++
+				if !old.Contains(fact) {
+					changed[sym] = true
+				}
+			}
+			return nil
+		})
+		if err != nil {
+			return err
+		}
+		if n != countFacts(old, sym) {
+			changed[sym] = true
+		}
+		recomputed[sym] = facts
+	}
+	return nil
+}
+
+// Returns the number of facts of sym in store.
+func countFacts(store factstore.ReadOnlyFactStore, sym ast.PredicateSym) int {
+	n := 0
+	store.GetFacts(ast.NewQuery(sym), func(ast.Atom) error {
+		n++
+		return nil
+	})
+	return n
+}
+
+// Stratifies and evaluates rules, whose heads are the idb predicates,
+// over store.
+func evalRules(decls map[ast.PredicateSym]*ast.Decl, edb, idb map[ast.PredicateSym]struct{}, rules []ast.Clause, store factstore.FactStore) error {
+	strata, predToStratum, err := analysis.Stratify(analysis.Program{
+		EdbPredicates: edb,
+		IdbPredicates: idb,
+		Rules:         rules,
+	})
+	if err != nil {
+		return err
+	}
+	program := &analysis.ProgramInfo{
+		Decls:         decls,
+		EdbPredicates: edb,
+		IdbPredicates: idb,
+		Rules:         rules,
+	}
+	stats, err := engine.EvalStratifiedProgramWithStats(program, strata, predToStratum, store)
+	if err != nil {
+		return err
+	}
+	log.Printf("service.go: evaluated %d rules, stats: %v", len(rules), stats)
+	return nil
+}
+
+func union[K comparable, V any](a, b map[K]V) map[K]V {
+	m := make(map[K]V, len(a)+len(b))
+	maps.Copy(m, a)
+	maps.Copy(m, b)
+	return m
+}
+
+func filterKeys[K comparable, V any](m map[K]V, keep func(K) bool) map[K]V {
+	filtered := make(map[K]V)
+	for k, v := range m {
+		if keep(k) {
+			filtered[k] = v
+		}
+	}
+	return filtered
+}
@@ -5,6 +5,7 @@ import (
 	"fmt"
 	"io"
 	"net"
+	"path/filepath"
 	"slices"
 	"strings"
 	"testing"
@@ -37,7 +38,10 @@ func atom(s string) ast.Atom {
 
 // TestServerClient tests whether request with a program works.
 func TestServerClient(t *testing.T) {
-	mangleService := service.New()
+	mangleService, err := service.New("")
+	if err != nil {
+		t.Fatal(err)
+	}
 	reader := strings.NewReader(testSource)
 	if err := mangleService.UpdateFromSource(reader); err != nil {
 		t.Fatal(err)
@@ -95,3 +99,395 @@ func TestServerClient(t *testing.T) {
 		}
 	}
 }
+
+// TestBatchQuery tests that a batch returns tagged answers in request
+// order, and that a bad query does not fail the whole batch.
+func TestBatchQuery(t *testing.T) {
+	mangleService, err := service.New("")
+	if err != nil {
+		t.Fatal(err)
+	}
+	if err := mangleService.UpdateFromSource(strings.NewReader(testSource)); err != nil {
+		t.Fatal(err)
+	}
+
+	server := grpc.NewServer()
+	pb.RegisterMangleServer(server, mangleService)
+	listener, err := net.Listen("tcp", "localhost:0")
+	if err != nil {
+		t.Fatal(err)
+	}
+	go server.Serve(listener)
+	defer server.Stop()
+
+	conn, err := grpc.Dial(listener.Addr().String(), grpc.WithTransportCredentials(insecure.NewCredentials()))
+	if err != nil {
+		t.Fatal(err)
+	}
+	defer conn.Close()
+	client := pb.NewMangleClient(conn)
+
+	stream, err := client.BatchQuery(context.Background(), &pb.BatchQueryRequest{
+		Queries: []*pb.TaggedQuery{
+			{Tag: "edges", Query: "edge(/a, X)."},
+			{Tag: "bad", Query: "edge(/a, "},
+			{Tag: "reachable", Query: "reachable(/a, X)"},
+		},
+		Program: testProgram,
+	})
+	if err != nil {
+		t.Fatal(err)
+	}
+	var answers []*pb.BatchQueryAnswer
+	for {
+		answer, err := stream.Recv()
+		if err == io.EOF {
+			break
+		}
+		if err != nil {
+			t.Fatal(err)
+		}
+		answers = append(answers, answer)
+	}
+
+	if len(answers) != 3 {
+		t.Fatalf("expected 3 answer groups, got %d", len(answers))
+	}
+	if got := answers[0]; got.GetTag() != "edges" || len(got.GetAnswers()) != 1 {
+		t.Errorf("edges: got %v", got)
+	}
+	if got := answers[1]; got.GetTag() != "bad" || got.GetError() == "" {
+		t.Errorf("bad: expected an error, got %v", got)
+	}
+	if got := answers[2]; got.GetTag() != "reachable" || len(got.GetAnswers()) != 3 {
+		t.Errorf("reachable: got %v", got)
+	}
+}
+
+// TestQueryPaging tests that limit and offset select a page of answers
+// and that the total is reported in the trailer.
+func TestQueryPaging(t *testing.T) {
+	mangleService, err := service.New("")
+	if err != nil {
+		t.Fatal(err)
+	}
+	if err := mangleService.UpdateFromSource(strings.NewReader(testSource)); err != nil {
+		t.Fatal(err)
+	}
+
+	server := grpc.NewServer()
+	pb.RegisterMangleServer(server, mangleService)
+	listener, err := net.Listen("tcp", "localhost:0")
+	if err != nil {
+		t.Fatal(err)
+	}
+	go server.Serve(listener)
+	defer server.Stop()
+
+	conn, err := grpc.Dial(listener.Addr().String(), grpc.WithTransportCredentials(insecure.NewCredentials()))
+	if err != nil {
+		t.Fatal(err)
+	}
+	defer conn.Close()
+	client := pb.NewMangleClient(conn)
+
+	var seen []string
+	for offset := uint32(0); offset < 4; offset += 2 {
+		stream, err := client.Query(context.Background(), &pb.QueryRequest{
+			Query: "reachable(/a, X)", Program: testProgram, Limit: 2, Offset: offset,
+		})
+		if err != nil {
+			t.Fatal(err)
+		}
+		var page []string
+		for {
+			answer, err := stream.Recv()
+			if err == io.EOF {
+				break
+			}
+			if err != nil {
+				t.Fatal(err)
+			}
+			page = append(page, answer.GetAnswer())
+		}
+		if want := min(2, 3-int(offset)); len(page) != want {
+			t.Errorf("offset %d: expected %d answers, got %v", offset, want, page)
+		}
+		if total := stream.Trailer().Get(service.TotalTrailer); len(total) != 1 || total[0] != "3" {
+			t.Errorf("offset %d: expected total 3 in trailer, got %v", offset, total)
+		}
+		seen = append(seen, page...)
+	}
+	slices.Sort(seen)
+	if got := slices.Compact(seen); len(got) != 3 {
+		t.Errorf("expected 3 distinct answers across pages, got %v", got)
+	}
+}
+
+// TestIncrementalUpdate tests that rules sent in one update are kept and
+// applied to facts sent in later updates.
+func TestIncrementalUpdate(t *testing.T) {
+	mangleService, err := service.New("")
+	if err != nil {
+		t.Fatal(err)
+	}
+	if err := mangleService.UpdateFromSource(strings.NewReader(testSource)); err != nil {
+		t.Fatal(err)
+	}
+	ctx := context.Background()
+	if _, err := mangleService.Update(ctx, &pb.UpdateRequest{Program: testProgram}); err != nil {
+		t.Fatal(err)
+	}
+	// Sending the same rules again must not fail or duplicate them.
+	if _, err := mangleService.Update(ctx, &pb.UpdateRequest{Program: testProgram}); err != nil {
+		t.Fatal(err)
+	}
+	answer, err := mangleService.Update(ctx, &pb.UpdateRequest{Program: "edge(/d, /e)."})
+	if err != nil {
+		t.Fatal(err)
+	}
+	updated := answer.GetUpdatedPredicates()
+	if !slices.Contains(updated, "edge") || !slices.Contains(updated, "reachable") {
+		t.Errorf("expected edge and reachable to be updated, got %v", updated)
+	}
+	// A fact that is already known changes nothing.
+	answer, err = mangleService.Update(ctx, &pb.UpdateRequest{Program: "edge(/d, /e)."})
+	if err != nil {
+		t.Fatal(err)
+	}
+	if len(answer.GetUpdatedPredicates()) != 0 {
+		t.Errorf("expected no updated predicates, got %v", answer.GetUpdatedPredicates())
+	}
+
+	server := grpc.NewServer()
+	pb.RegisterMangleServer(server, mangleService)
+	listener, err := net.Listen("tcp", "localhost:0")
+	if err != nil {
+		t.Fatal(err)
+	}
+	go server.Serve(listener)
+	defer server.Stop()
+
+	conn, err := grpc.Dial(listener.Addr().String(), grpc.WithTransportCredentials(insecure.NewCredentials()))
+	if err != nil {
+		t.Fatal(err)
+	}
+	defer conn.Close()
+	stream, err := pb.NewMangleClient(conn).Query(ctx, &pb.QueryRequest{Query: "reachable(/a, X)"})
+	if err != nil {
+		t.Fatal(err)
+	}
+	n := 0
+	for {
+		_, err := stream.Recv()
+		if err == io.EOF {
+			break
+		}
+		if err != nil {
+			t.Fatal(err)
+		}
+		n++
+	}
+	if n != 4 {
+		t.Errorf("expected /a to reach 4 nodes, got %d", n)
+	}
+}
+
+// TestPersist tests that a persisted snapshot can be loaded again, keeps
+// its rules and does not include updates published after it was written.
+func TestPersist(t *testing.T) {
+	mangleService, err := service.New("")
+	if err != nil {
+		t.Fatal(err)
+	}
+	if err := mangleService.UpdateFromSource(strings.NewReader(testSource)); err != nil {
+		t.Fatal(err)
+	}
+	if _, err := mangleService.Update(context.Background(), &pb.UpdateRequest{Program: testProgram}); err != nil {
+		t.Fatal(err)
+	}
+	dbPath := filepath.Join(t.TempDir(), "test.db.gz")
+	persist := mangleService.PersistCallback(dbPath)
+	persist()
+
+	// Updates after persisting are not part of the written db.
+	if _, err := mangleService.Update(context.Background(), &pb.UpdateRequest{Program: "edge(/d, /e)."}); err != nil {
+		t.Fatal(err)
+	}
+
+	loaded, err := service.New(dbPath)
+	if err != nil {
+		t.Fatal(err)
+	}
+	server := grpc.NewServer()
+	pb.RegisterMangleServer(server, loaded)
+	listener, err := net.Listen("tcp", "localhost:0")
+	if err != nil {
+		t.Fatal(err)
+	}
+	go server.Serve(listener)
+	defer server.Stop()
+
+	conn, err := grpc.Dial(listener.Addr().String(), grpc.WithTransportCredentials(insecure.NewCredentials()))
+	if err != nil {
+		t.Fatal(err)
+	}
+	defer conn.Close()
+	stream, err := pb.NewMangleClient(conn).Query(context.Background(), &pb.QueryRequest{Query: "edge(X, Y)"})
+	if err != nil {
+		t.Fatal(err)
+	}
+	n := 0
+	for {
+		_, err := stream.Recv()
+		if err == io.EOF {
+			break
+		}
+		if err != nil {
+			t.Fatal(err)
+		}
+		n++
+	}
+	if n != 3 {
+		t.Errorf("expected 3 persisted edges, got %d", n)
+	}
+
+	// The rules were persisted too: they apply to a new edge.
+	if _, err := loaded.Update(context.Background(), &pb.UpdateRequest{Program: "edge(/d, /f)."}); err != nil {
+		t.Fatal(err)
+	}
+	if got := answers(t, pb.NewMangleClient(conn), "reachable(/a, X)"); len(got) != 4 {
+		t.Errorf("expected /a to reach 4 nodes, got %v", got)
+	}
+}
+
+// Serves mangleService on a local port until the test ends.
+func serve(t *testing.T, mangleService *service.MangleService) pb.MangleClient {
+	server := grpc.NewServer()
+	pb.RegisterMangleServer(server, mangleService)
+	listener, err := net.Listen("tcp", "localhost:0")
+	if err != nil {
+		t.Fatal(err)
+	}
+	go server.Serve(listener)
+	t.Cleanup(server.Stop)
+	conn, err := grpc.Dial(listener.Addr().String(), grpc.WithTransportCredentials(insecure.NewCredentials()))
+	if err != nil {
+		t.Fatal(err)
+	}
+	t.Cleanup(func() { conn.Close() })
+	return pb.NewMangleClient(conn)
+}
+
+// Returns atom as the server writes it.
+func canonical(t *testing.T, atom string) string {
+	a, err := parse.Atom(atom)
+	if err != nil {
+		t.Fatal(err)
+	}
+	return a.String()
+}
+
+// Returns the sorted answers of query.
+func answers(t *testing.T, client pb.MangleClient, query string) []string {
+	stream, err := client.Query(context.Background(), &pb.QueryRequest{Query: query})
+	if err != nil {
+		t.Fatal(err)
+	}
+	var actual []string
+	for {
+		answer, err := stream.Recv()
+		if err == io.EOF {
+			break
+		}
+		if err != nil {
+			t.Fatal(err)
+		}
+		actual = append(actual, canonical(t, answer.GetAnswer()))
+	}
+	slices.Sort(actual)
+	return actual
+}
+
+// TestDeltaJoin tests a rule that reads its own predicate twice: a new
+// edge that joins two paths must connect every node of one with every
+// node of the other, which needs new facts joined with new facts.
+func TestDeltaJoin(t *testing.T) {
+	mangleService, err := service.New("")
+	if err != nil {
+		t.Fatal(err)
+	}
+	ctx := context.Background()
+	program := `
+link(/a, /b).
+link(/c, /d).
+path(X, Y) :- link(X, Y).
+path(X, Z) :- path(X, Y), path(Y, Z).`
+	if _, err := mangleService.Update(ctx, &pb.UpdateRequest{Program: program}); err != nil {
+		t.Fatal(err)
+	}
+	answer, err := mangleService.Update(ctx, &pb.UpdateRequest{Program: "link(/b, /c)."})
+	if err != nil {
+		t.Fatal(err)
+	}
+	if !slices.Equal(answer.GetUpdatedPredicates(), []string{"link", "path"}) {
+		t.Errorf("expected link and path to be updated, got %v", answer.GetUpdatedPredicates())
+	}
+	client := serve(t, mangleService)
+	if got := answers(t, client, "path(/a, X)"); len(got) != 3 {
+		t.Errorf("expected /a to reach /b, /c and /d, got %v", got)
+	}
+	if got := answers(t, client, "path(X, Y)"); len(got) != 6 {
+		t.Errorf("expected 6 paths, got %v", got)
+	}
+}
+
+// TestRecomputed tests that the results of aggregation and negation, and
+// of the rules that read them, are replaced when their inputs change
+// instead of piling up next to the outdated ones.
+func TestRecomputed(t *testing.T) {
+	mangleService, err := service.New("")
+	if err != nil {
+		t.Fatal(err)
+	}
+	ctx := context.Background()
+	program := `
+hours(/ana, /x, 10).
+person(/ana).
+person(/bob).
+busy(/bob).
+load(P, Total) :- hours(P, _, H) |> do fn:group_by(P), let Total = fn:sum(H).
+overloaded(P) :- load(P, Total), :lt(25, Total).
+free(P) :- person(P), !busy(P).`
+	if _, err := mangleService.Update(ctx, &pb.UpdateRequest{Program: program}); err != nil {
+		t.Fatal(err)
+	}
+	client := serve(t, mangleService)
+	if got := answers(t, client, "load(/ana, X)"); !slices.Equal(got, []string{canonical(t, "load(/ana, 10)")}) {
+		t.Errorf("unexpected load %v", got)
+	}
+	if got := answers(t, client, "overloaded(X)"); len(got) != 0 {
+		t.Errorf("expected nobody overloaded, got %v", got)
+	}
+
+	answer, err := mangleService.Update(ctx, &pb.UpdateRequest{Program: "hours(/ana, /y, 20)."})
+	if err != nil {
+		t.Fatal(err)
+	}
+	if updated := answer.GetUpdatedPredicates(); !slices.Equal(updated, []string{"hours", "load", "overloaded"}) {
+		t.Errorf("expected hours, load and overloaded to be updated, got %v", updated)
+	}
+	if got := answers(t, client, "load(/ana, X)"); !slices.Equal(got, []string{canonical(t, "load(/ana, 30)")}) {
+		t.Errorf("expected only the new total, got %v", got)
+	}
+	if got := answers(t, client, "overloaded(X)"); !slices.Equal(got, []string{canonical(t, "overloaded(/ana)")}) {
+		t.Errorf("expected /ana overloaded, got %v", got)
+	}
+
+	if _, err := mangleService.Update(ctx, &pb.UpdateRequest{Program: "busy(/ana)."}); err != nil {
+		t.Fatal(err)
+	}
+	if got := answers(t, client, "free(X)"); len(got) != 0 {
+		t.Errorf("expected nobody free, got %v", got)
+	}
+}
@@ -0,0 +1,153 @@
+# memoria.py
+"""
+Memoria de conversación con presupuesto de tokens.
+
+Cada sesión conserva los mensajes recientes mientras quepan en el presupuesto;
+los más antiguos se condensan en un resumen que se actualiza de forma
+incremental (el resumen anterior + los mensajes que salen de la ventana), de
+modo que nunca se vuelve a resumir lo ya resumido. Las memorias viven en un
+registro por sesión y no se reconstruyen en cada comando.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+
+from langchain.memory import ConversationSummaryBufferMemory
+from langchain.prompts import PromptTemplate
+
+# Tokens (aproximados) que puede ocupar el historial en el prompt.
+MEMORIA_MAX_TOKENS = int(os.getenv("MEMORIA_MAX_TOKENS", "1200"))
+# Al superar el presupuesto se resume hasta dejar la ventana en esta fracción,
+# así el resumen se actualiza cada pocos turnos y no en cada uno.
+FRACCION_TRAS_RESUMIR = 0.6
+# Sesiones que se mantienen en memoria; las menos usadas se descartan.
+MEMORIA_MAX_SESIONES = int(os.getenv("MEMORIA_MAX_SESIONES", "64"))
+
+PROMPT_RESUMEN = PromptTemplate(
+    input_variables=["summary", "new_lines"],
+    template=(
+        "Actualiza el resumen de una conversación entre un usuario y FileMate, "
+        "un asistente de archivos. Conserva nombres de archivos, carpetas, "
+        "proyectos y personas, y las decisiones tomadas. Responde solo con el "
+        "nuevo resumen, en español y en no más de 150 palabras.\n\n"
+        "Resumen actual:\n{summary}\n\n"
+        "Nuevas líneas de la conversación:\n{new_lines}\n\n"
+        "Nuevo resumen:"
+    ),
+)
+
+
+def estimar_tokens(texto: str) -> int:
+    """Estimación local (unos 4 caracteres por token); no llama a la API del modelo."""
+    return len(texto) // 4 + 1
+
+
+def _tokens_mensaje(mensaje) -> int:
+    contenido = mensaje.content if isinstance(mensaje.content, str) else str(mensaje.content)
+    return estimar_tokens(contenido)
+
+
+class MemoriaResumida(ConversationSummaryBufferMemory):
+    """
+    ConversationSummaryBufferMemory que cuenta tokens localmente y resume por
+    tandas. El coste por turno queda acotado por el presupuesto de tokens, no
+    por la duración de la sesión.
+    """
+
+    # Las memorias de un solo comando no resumen: lo que sale de la ventana
+    # se descarta, porque la memoria no se vuelve a usar.
+    resumir: bool = True
+
+    def _mensajes_a_resumir(self) -> list:
+        """Saca de la ventana los mensajes más antiguos si se superó el presupuesto."""
+        buffer = self.chat_memory.messages
+        tokens = sum(_tokens_mensaje(m) for m in buffer)
+        if tokens <= self.max_token_limit:
+            return []
+        objetivo = int(self.max_token_limit * FRACCION_TRAS_RESUMIR)
+        podados = []
+        # Siempre queda al menos el último intercambio en la ventana.
+        while len(buffer) > 2 and tokens > objetivo:
+            mensaje = buffer.pop(0)
+            tokens -= _tokens_mensaje(mensaje)
+            podados.append(mensaje)
+        return podados
+
+    def prune(self) -> None:
+        podados = self._mensajes_a_resumir()
+        if podados and self.resumir:
+            try:
+                self.moving_summary_buffer = self.predict_new_summary(podados, self.moving_summary_buffer)
+            except Exception as e:
+                print(f"Error al resumir la conversación: {e}")
+
+    async def aprune(self) -> None:
+        podados = self._mensajes_a_resumir()
+        if podados and self.resumir:
+            try:
+                self.moving_summary_buffer = await self.apredict_new_summary(podados, self.moving_summary_buffer)
+            except Exception as e:
+                print(f"Error al resumir la conversación: {e}")
+
+    def cargar_historial(self, chat_history: list) -> None:
+        """
+        Carga un historial previo ([{'type': 'human'|'ai', 'content': ...}]).
+        Solo se conservan los mensajes más recientes que caben en el
+        presupuesto; no se llama al modelo para resumir el resto.
+        """
+        mensajes = []
+        tokens = 0
+        for message in reversed(chat_history or []):
+            tokens += estimar_tokens(message['content'])
+            if tokens > self.max_token_limit:
+                break
+            mensajes.append(message)
+        for message in reversed(mensajes):
+            if message['type'] == 'human':
+                self.chat_memory.add_user_message(message['content'])
+            else:
+                self.chat_memory.add_ai_message(message['content'])
+
+
+def crear_memoria(llm, chat_history: list = None, resumir: bool = True) -> MemoriaResumida:
+    """Crea una memoria nueva, con las mismas claves que espera el agente."""
+    memoria = MemoriaResumida(
+        llm=llm,
+        resumir=resumir,
+        prompt=PROMPT_RESUMEN,
+        max_token_limit=MEMORIA_MAX_TOKENS,
+        memory_key="chat_history",
+        input_key="input",
+        output_key="output",
+        return_messages=True,
+    )
+    memoria.cargar_historial(chat_history)
+    return memoria
+
+
+_sesiones = OrderedDict()
+_sesiones_lock = threading.Lock()
+
+
+def obtener_memoria(session_id: str, llm, chat_history: list = None) -> MemoriaResumida:
+    """
+    Devuelve la memoria de la sesión, creándola la primera vez. El historial
+    solo se usa al crearla; después la memoria se mantiene sola.
+    """
+    with _sesiones_lock:
+        memoria = _sesiones.get(session_id)
+        if memoria is None:
+            memoria = crear_memoria(llm, chat_history)
+            _sesiones[session_id] = memoria
+            while len(_sesiones) > MEMORIA_MAX_SESIONES:
+                _sesiones.popitem(last=False)
+        else:
+            _sesiones.move_to_end(session_id)
+        return memoria
+
+
+def reiniciar_memoria(session_id: str) -> None:
+    """Olvida la conversación de una sesión (por ejemplo, al limpiar el chat)."""
+    with _sesiones_lock:
+        _sesiones.pop(session_id, None)
@@ -0,0 +1,187 @@
+# router.py
+"""
+Atajo local para los pedidos más simples.
+
+Los comandos que se traducen uno a uno en una herramienta ("renombra a.txt a
+b.txt", "crea la carpeta vacaciones", "busca pdf") se reconocen con patrones y
+se ejecutan directamente, sin pasar por el LLM. Ante cualquier duda (nombres
+sin extensión, frases con más de un objetivo, etc.) no se hace nada y el
+pedido sigue hacia el agente.
+"""
+
+import os
+import re
+import threading
+
+from cambios import grabar_cambios, notificar
+from tracing import span
+from tools import rename_file, create_folder, search_files, sugerir_nombres_parecidos, WORKING_DIR
+
+# Un nombre es una palabra sin espacios o un texto entre comillas.
+_NOMBRE = r"""(?:["'“‘](?P<{0}_q>[^"'”’]+)["'”’]|(?P<{0}>[^\s"'“”‘’]+))"""
+# Nombre de archivo: además tiene que tener extensión, para no confundirlo con una carpeta.
+_ARCHIVO = r"""(?:["'“‘](?P<{0}_q>[^"'”’]+\.\w+)["'”’]|(?P<{0}>[^\s"'“”‘’]+\.\w+))"""
+
+# Fórmulas de cortesía que se quitan antes de interpretar el pedido.
+_CORTESIA = re.compile(
+    r"^(?:(?:por\s+favor|porfa|oye|hola|filemate)[\s,]+|(?:puedes|podr[ií]as|quiero\s+que|necesito\s+que)\s+)+",
+    re.IGNORECASE,
+)
+
+_PATRONES = [
+    (
+        "rename_file",
+        re.compile(
+            r"^(?:renombr[aáe]r?|cambi[aáe]r?\s+(?:el\s+)?nombre\s+(?:de(?:l)?\s+)?)\s*(?:el\s+archivo\s+|archivo\s+)?"
+            + _ARCHIVO.format("origen")
+            + r"\s+(?:a|por|como)\s+"
+            + _ARCHIVO.format("destino")
+            + r"$",
+            re.IGNORECASE,
+        ),
+    ),
+    (
+        "create_folder",
+        re.compile(
+            r"^(?:cre[aáe]r?|haz|hac[eé]r?)\s+(?:(?:una|la)\s+)?(?:nueva\s+)?carpeta\s+(?:nueva\s+)?"
+            r"(?:llamada\s+|con\s+(?:el\s+)?nombre\s+|de\s+nombre\s+)?"
+            + _NOMBRE.format("carpeta")
+            + r"$",
+            re.IGNORECASE,
+        ),
+    ),
+    (
+        "search_files",
+        re.compile(
+            r"^(?:busc[aáe]r?|encontr[aáe]r?|encuentr[aáe])\s+(?:(?:los|las|el|la|mis)\s+)?(?:archivos?\s+|ficheros?\s+)?"
+            r"(?:(?:llamados?|que\s+se\s+llamen?|con\s+el\s+nombre|de\s+tipo|que\s+contengan?\s+en\s+el\s+nombre)\s+)?"
+            + _NOMBRE.format("patron")
+            + r"$",
+            re.IGNORECASE,
+        ),
+    ),
+]
+
+# Palabras que, solas, indican que el pedido no es tan simple como parece.
+_PALABRAS_AMBIGUAS = {
+    "archivo", "archivos", "carpeta", "carpetas", "todo", "todos", "todas", "algo",
+    "eso", "esto", "aqui", "aquí", "nueva", "nuevo", "en", "de", "a",
+}
+
+# Archivos que se listan como máximo en la respuesta de una búsqueda.
+MAX_RESULTADOS_BUSQUEDA = 20
+
+
+def _valor(match, grupo):
+    return (match.group(f"{grupo}_q") or match.group(grupo) or "").strip()
+
+
+def interpretar_comando(command: str):
+    """
+    Devuelve (herramienta, argumentos) si el pedido es un caso simple y sin
+    ambigüedad, o None si debe resolverlo el agente.
+    """
+    texto = " ".join(command.split()).rstrip(".!?¡¿ ").lstrip("¡¿ ")
+    texto = _CORTESIA.sub("", texto)
+    for herramienta, patron in _PATRONES:
+        match = patron.match(texto)
+        if not match:
+            continue
+        if herramienta == "rename_file":
+            argumentos = (_valor(match, "origen"), _valor(match, "destino"))
+        elif herramienta == "create_folder":
+            argumentos = (_valor(match, "carpeta"),)
+        else:
+            argumentos = (_valor(match, "patron"),)
+        if any(not a or a.lower() in _PALABRAS_AMBIGUAS or ".." in a for a in argumentos):
+            return None
+        return herramienta, argumentos
+    return None
+
+
+def _formatear_busqueda(patron, resultados):
+    if not resultados:
+        return f"No encontré archivos que coincidan con '{patron}'.{sugerir_nombres_parecidos(patron)}"
+    rutas = [os.path.relpath(r, WORKING_DIR) for r in resultados]
+    lineas = [f"- {r}" for r in rutas[:MAX_RESULTADOS_BUSQUEDA]]
+    if len(rutas) > MAX_RESULTADOS_BUSQUEDA:
+        lineas.append(f"- … y {len(rutas) - MAX_RESULTADOS_BUSQUEDA} más.")
+    if len(rutas) == 1:
+        encabezado = f"Encontré 1 archivo que coincide con '{patron}':"
+    else:
+        encabezado = f"Encontré {len(rutas)} archivos que coinciden con '{patron}':"
+    return encabezado + "\n" + "\n".join(lineas)
+
+
+_EJECUTORES = {
+    "rename_file": lambda origen, destino: rename_file(origen, destino),
+    "create_folder": lambda carpeta: create_folder(carpeta),
+    "search_files": lambda patron: _formatear_busqueda(patron, search_files(patron)),
+}
+
+# Nombres de los argumentos de cada atajo, los mismos de los esquemas de las
+# herramientas del agente (schemas.py).
+_CAMPOS = {
+    "rename_file": ("current_name", "new_name"),
+    "create_folder": ("folder_name",),
+    "search_files": ("pattern",),
+}
+
+
+class _MetricasRouter:
+    """Cuenta cuántos pedidos resolvió el atajo y cuántos pasaron al agente."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+        self.por_herramienta = {}
+
+    def registrar(self, herramienta=None):
+        with self._lock:
+            if herramienta:
+                self.aciertos += 1
+                self.por_herramienta[herramienta] = self.por_herramienta.get(herramienta, 0) + 1
+            else:
+                self.fallos += 1
+
+    def estadisticas(self):
+        with self._lock:
+            total = self.aciertos + self.fallos
+            return {
+                "pedidos": total,
+                "aciertos": self.aciertos,
+                "fallos": self.fallos,
+                "tasa_aciertos": self.aciertos / total if total else 0.0,
+                "por_herramienta": dict(self.por_herramienta),
+            }
+
+
+metricas_router = _MetricasRouter()
+
+
+def resolver_comando(command: str):
+    """
+    Intenta resolver el pedido sin el LLM. Devuelve un diccionario con la
+    herramienta usada, su entrada (un diccionario con los mismos argumentos
+    que recibe la herramienta del agente, p. ej. {"folder_name": "fotos"}) y
+    el mensaje de respuesta, o None si el pedido debe ir al agente.
+    """
+    interpretado = interpretar_comando(command)
+    if interpretado is None:
+        metricas_router.registrar()
+        return None
+    herramienta, argumentos = interpretado
+    with grabar_cambios() as cambios, span(f"herramienta.{herramienta}", "herramienta", atajo=True):
+        try:
+            mensaje = _EJECUTORES[herramienta](*argumentos)
+        except Exception as e:
+            # Ante un fallo inesperado se deja que el agente lo intente.
+            print(f"Error en el atajo local ({herramienta}): {e}")
+            metricas_router.registrar()
+            return None
+        finally:
+            if cambios:
+                notificar(cambios)
+    metricas_router.registrar(herramienta)
+    return {"tool": herramienta, "input": dict(zip(_CAMPOS[herramienta], argumentos)), "message": mensaje}
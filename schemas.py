@@ -1,8 +1,147 @@
-from pydantic import BaseModel, Field
+from typing import Optional
+
+from pydantic import BaseModel, ConfigDict, Field
 
 class ContactoInput(BaseModel):
-    nombre: str = Field(..., description="Nombre del contacto")
-    rol: str = Field(..., description="Rol del contacto")
-    email: str = Field(..., description="Correo electrónico del contacto")
-    proyecto: str = Field(..., description="Proyecto asociado al contacto")
-    archivo_destino: str = Field(..., description="Archivo donde guardar el contacto, ej: contactos.txt")
+    model_config = ConfigDict(str_strip_whitespace=True)
+
+    nombre: str = Field(..., min_length=1, description="Nombre del contacto")
+    rol: str = Field(..., min_length=1, description="Rol del contacto")
+    email: str = Field(..., min_length=1, description="Correo electrónico del contacto")
+    proyecto: str = Field(..., min_length=1, description="Proyecto asociado al contacto")
+    archivo_destino: str = Field("contactos.txt", description="Archivo donde guardar el contacto, ej: contactos.txt")
+
+
+# ===== ARGUMENTOS DE LAS HERRAMIENTAS DEL AGENTE =====
+# Los nombres de los campos coinciden con los parámetros de las funciones de
+# tools.py, así las herramientas se llaman directamente con los valores ya
+# validados.
+
+class HerramientaInput(BaseModel):
+    """Base de los argumentos de herramientas: recorta espacios de los textos."""
+    model_config = ConfigDict(str_strip_whitespace=True)
+
+class SinArgumentosInput(HerramientaInput):
+    """Para herramientas que no necesitan datos."""
+
+class RenombrarInput(HerramientaInput):
+    current_name: str = Field(..., min_length=1, description="Nombre actual (ruta relativa al directorio de trabajo)")
+    new_name: str = Field(..., min_length=1, description="Nuevo nombre")
+
+class ArchivoPdfInput(HerramientaInput):
+    pdf_path: str = Field(..., min_length=1, description="Ruta al archivo PDF")
+
+class ConvertirImagenInput(HerramientaInput):
+    image_path: str = Field(..., min_length=1, description="Ruta de la imagen")
+    new_format: str = Field(..., min_length=1, description="Formato de destino, ej: png, jpg, webp")
+
+class BuscarArchivosInput(HerramientaInput):
+    pattern: str = Field(..., min_length=1, description="Texto que debe aparecer en el nombre del archivo")
+
+class BusquedaAproximadaInput(HerramientaInput):
+    nombre: str = Field(..., min_length=1, description="Nombre (quizás mal escrito) del archivo o carpeta, ej: 'prueva' o 'informe_fnal.pdf'")
+    limite: int = Field(5, ge=1, le=20, description="Cantidad máxima de nombres parecidos a devolver")
+
+class ArbolArchivosInput(HerramientaInput):
+    carpeta: str = Field("", description="Carpeta de la que se quiere el árbol; vacío para todo el espacio de trabajo")
+
+class CarpetaInput(HerramientaInput):
+    folder_name: str = Field(..., min_length=1, description="Nombre o ruta de la carpeta")
+
+class ArchivoInput(HerramientaInput):
+    file_name: str = Field(..., min_length=1, description="Nombre o ruta del archivo")
+
+class MoverArchivoInput(HerramientaInput):
+    file_name: str = Field(..., min_length=1, description="Ruta completa del archivo desde el directorio de trabajo, ej: borradores/informe.txt")
+    dest_folder: str = Field(..., min_length=1, description="Carpeta de destino")
+
+class MoverCarpetaInput(HerramientaInput):
+    folder_name: str = Field(..., min_length=1, description="Ruta completa de la carpeta desde el directorio de trabajo, ej: prueba/imagenes")
+    dest_folder: str = Field(..., min_length=1, description="Carpeta de destino")
+
+class BackupInput(HerramientaInput):
+    item_name: str = Field(..., min_length=1, description="Archivo o carpeta a respaldar")
+
+class ArchivoWordInput(HerramientaInput):
+    word_file: str = Field(..., min_length=1, description="Archivo de Word (.docx) a convertir")
+
+class LeerArchivoInput(HerramientaInput):
+    file_path: str = Field(..., min_length=1, description="Ruta del archivo a leer")
+    desde: Optional[int] = Field(None, ge=1, description="Primera línea, página o byte a leer (desde 1); vacío para empezar por el principio. Si una lectura anterior indicó desde dónde seguir, usa ese valor")
+    hasta: Optional[int] = Field(None, ge=1, description="Última línea, página o byte a leer (incluida); vacío para leer todo lo que se pueda de una vez")
+    unidad: str = Field("", pattern=r"^(lineas|paginas|bytes)?$", description="'lineas', 'paginas' (solo PDF) o 'bytes' (solo archivos de texto); vacío: páginas en los PDF y líneas en los demás")
+    desplazamiento: int = Field(0, ge=0, description="Carácter de la línea o página 'desde' donde seguir, cuando una lectura anterior la cortó e indicó este valor; si no, 0")
+
+class BuscarEnArchivoInput(HerramientaInput):
+    file_path: str = Field(..., min_length=1, description="Ruta del archivo donde buscar")
+    query: str = Field(..., min_length=1, description="Palabra o frase a buscar")
+
+class BuscarEnDocumentosInput(HerramientaInput):
+    query: str = Field(..., min_length=1, description="Palabras a buscar en el contenido de los documentos")
+    carpeta: str = Field("", description="Carpeta donde buscar; vacío para todo el espacio de trabajo")
+    limite: int = Field(20, ge=1, le=50, description="Cantidad máxima de líneas a devolver")
+
+class CrearZipInput(HerramientaInput):
+    source_list: str = Field(..., min_length=1, description="Rutas a comprimir separadas por coma, ej: 'pruebas/a.txt, pruebas/b.pdf'")
+    zip_path: str = Field(..., min_length=1, description="Nombre o ruta del ZIP a crear, ej: backups/mis_archivos.zip")
+
+class ExtraerZipInput(HerramientaInput):
+    zip_path: str = Field(..., min_length=1, description="Archivo ZIP a descomprimir")
+    destination_folder: str = Field(..., min_length=1, description="Carpeta donde extraer el contenido")
+
+class MoverLoteInput(HerramientaInput):
+    source_folder: str = Field(..., description="Carpeta de origen (vacío para la raíz)")
+    dest_folder: str = Field(..., min_length=1, description="Carpeta de destino")
+    pattern: str = Field("*", description="Patrón de los archivos a mover, ej: '*.pdf', 'IMG_*'")
+
+class RenombrarLoteInput(HerramientaInput):
+    folder: str = Field(..., description="Carpeta donde están los archivos (vacío para la raíz)")
+    pattern: str = Field(..., min_length=1, description="Patrón de los archivos a renombrar, ej: 'IMG_*'")
+    prefix: str = Field("", description="Texto a agregar al inicio del nombre")
+    suffix: str = Field("", description="Texto a agregar al final del nombre, antes de la extensión")
+
+class ConvertirImagenesLoteInput(HerramientaInput):
+    folder: str = Field(..., description="Carpeta donde están las imágenes (vacío para la raíz)")
+    source_ext: str = Field(".jpg", description="Extensión de origen, ej: .jpg")
+    target_ext: str = Field(".png", description="Extensión de destino, ej: .png")
+
+class ConsultaMangleInput(HerramientaInput):
+    query: str = Field(..., min_length=1, description="Consulta Mangle, ej: 'trabaja_en(Persona, \"Proyecto Alpha\").'")
+    desde: int = Field(0, ge=0, description="Fila desde la que mostrar resultados, para pedir la página siguiente")
+
+class ArchivoContactosInput(HerramientaInput):
+    file_path: str = Field("contactos.txt", description="Archivo CSV de contactos (nombre, puesto, email, proyecto)")
+
+class ArchivoConocimientoInput(HerramientaInput):
+    file_path: str = Field(..., min_length=1, description="Archivo de reglas y hechos Mangle, ej: conocimiento.mangle")
+
+class ProyectoInput(HerramientaInput):
+    proyecto: str = Field(..., min_length=1, description="Nombre del proyecto")
+
+class EstadoProyectoInput(HerramientaInput):
+    estado: str = Field(..., min_length=1, description="Estado del proyecto, ej: activo, completado, pausado")
+
+class FechaLimiteInput(HerramientaInput):
+    fecha_limite: str = Field("", pattern=r"^(\d{4}-\d{2}-\d{2})?$", description="Fecha límite AAAA-MM-DD; vacío para el fin del año actual")
+
+class MetricasProyectoInput(HerramientaInput):
+    proyecto: str = Field(..., min_length=1, description="Nombre del proyecto")
+    estado: str = Field(..., min_length=1, description="Estado, ej: activo, pausado, completado")
+    fecha_inicio: str = Field(..., pattern=r"^\d{4}-\d{2}-\d{2}$", description="Fecha de inicio AAAA-MM-DD")
+    fecha_fin: str = Field(..., pattern=r"^\d{4}-\d{2}-\d{2}$", description="Fecha de fin AAAA-MM-DD")
+    presupuesto: float = Field(..., ge=0, description="Presupuesto en dólares")
+    prioridad: str = Field(..., min_length=1, description="Prioridad, ej: alta, media, baja")
+    horas_estimadas: float = Field(..., ge=0, description="Horas estimadas del proyecto")
+
+class AsignacionProyectoInput(HerramientaInput):
+    persona: str = Field(..., min_length=1, description="Nombre de la persona")
+    proyecto: str = Field(..., min_length=1, description="Nombre del proyecto")
+    horas_semanales: float = Field(..., ge=0, le=168, description="Horas por semana dedicadas al proyecto")
+    porcentaje_dedicacion: float = Field(..., ge=0, le=100, description="Porcentaje de dedicación (0-100)")
+    rol_en_proyecto: str = Field(..., min_length=1, description="Rol en el proyecto, ej: desarrollador_senior")
+
+class ProgresoProyectoInput(HerramientaInput):
+    proyecto: str = Field(..., min_length=1, description="Nombre del proyecto")
+    porcentaje_completado: float = Field(..., ge=0, le=100, description="Porcentaje completado (0-100)")
+    horas_trabajadas: float = Field(..., ge=0, description="Horas trabajadas en total")
+    fecha_reporte: Optional[str] = Field(None, pattern=r"^\d{4}-\d{2}-\d{2}$", description="Fecha del reporte AAAA-MM-DD; por defecto hoy")
@@ -1,8 +1,6 @@
 # tools.py - Herramientas para manipulación de archivos
 import os
 import shutil
-from docx import Document
-import PyPDF2
 from PIL import Image
 import glob
 import csv
@@ -18,9 +16,23 @@ from pdf2docx import Converter
 from docx2pdf import convert
 from PIL import UnidentifiedImageError
 import grpc
-import mangle_pb2
-import mangle_pb2_grpc
+from mangle_client import cliente_mangle, Nombre
+from pydantic import TypeAdapter, ValidationError
+from schemas import ContactoInput
+from memoria import estimar_tokens
+from cache import memoizar, huella_archivo, dependencias_de_ruta
+from tracing import trazar
+from indice_archivos import indice_archivos
+from indice_contenido import indice_contenido
+from extraccion import (
+    contar_paginas, es_paginado, es_soportado, es_texto, iterar_lineas, iterar_paginas, leer_bytes,
+)
+from cambios import registrar_creado, registrar_modificado, registrar_eliminado, registrar_renombrado, rutas_afectadas, afecta_todo
 import re
+import time
+import hashlib
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor
 import zipfile
 from shutil import make_archive
 from PIL import Image
@@ -37,13 +49,14 @@ def rename_file(current_name, new_name):
         new_path = os.path.join('files', new_name)
 
         if not os.path.exists(current_path):
-            # Sugerencia: Podríamos buscar archivos similares si no se encuentra.
-            return f"No pude encontrar el archivo '{current_name}'. Por favor, verifica el nombre e inténtalo de nuevo."
+            sugerencia = sugerir_nombres_parecidos(current_name)
+            return f"No pude encontrar el archivo '{current_name}'.{sugerencia or ' Por favor, verifica el nombre e inténtalo de nuevo.'}"
         
         if os.path.isdir(current_path):
             return f"'{current_name}' es una carpeta, no un archivo. Por favor, usa la función para renombrar carpetas."
 
         os.rename(current_path, new_path)
+        registrar_renombrado(current_path, new_path)
         return f"¡Listo! El archivo '{current_name}' ha sido renombrado a '{new_name}'."
     except FileNotFoundError:
         return f"Error: El archivo '{current_name}' no fue encontrado. Revisa si el nombre es correcto."
@@ -65,6 +78,7 @@ def rename_folder(current_name, new_name):
             return f"'{current_name}' es un archivo, no una carpeta. Por favor, usa la función para renombrar archivos."
 
         os.rename(current_path, new_path)
+        registrar_renombrado(current_path, new_path)
         return f"¡Perfecto! La carpeta '{current_name}' ahora se llama '{new_name}'."
     except FileNotFoundError:
         return f"Error: La carpeta '{current_name}' no fue encontrada."
@@ -109,6 +123,7 @@ def convert_pdf_to_word_cloudconvert(pdf_path, docx_path=None):
 
         file_info = res.get("result").get("files")[0]
         cloudconvert.download(filename=docx_full_path, url=file_info['url'])
+        registrar_creado(docx_full_path)
 
         return f"El archivo '{pdf_path}' ha sido convertido a Word usando CloudConvert y guardado como '{docx_path}'."
     except cloudconvert.exceptions.APIError as e:
@@ -133,6 +148,7 @@ def convert_image_format(image_path, new_format, output_path=None):
             if new_format.lower() in ['jpeg', 'jpg']:
                 img = img.convert('RGB')
             img.save(output_full_path, format=new_format.upper())
+        registrar_creado(output_full_path)
         return f"La imagen '{image_path}' se ha convertido a {new_format.upper()} y guardado como '{output_path}'."
     except FileNotFoundError:
         return f"Error: No se encontró el archivo de imagen '{image_path}'."
@@ -165,8 +181,40 @@ def list_files(directory="files"):
     # Combinar, carpetas primero
     return folders + files
 
+def _es_directorio_indexado(directory):
+    return os.path.abspath(directory) == os.path.abspath(indice_archivos.directorio)
+
+def sugerir_nombres_parecidos(nombre, base_dir="files", carpetas=False):
+    """Sugerencia con los nombres parecidos a uno que no existe, o '' si no hay ninguno."""
+    if not _es_directorio_indexado(base_dir):
+        return ""
+    try:
+        parecidos = indice_archivos.similares(nombre, limite=3, carpetas=carpetas, archivos=not carpetas)
+    except Exception as e:
+        print(f"Error al buscar nombres parecidos a '{nombre}': {e}")
+        return ""
+    if not parecidos:
+        return ""
+    return " ¿Quisiste decir " + " o ".join(f"'{ruta}'" for ruta, _ in parecidos) + "?"
+
+def fuzzy_search_files(nombre, limite=5):
+    """Busca archivos y carpetas con un nombre parecido al indicado (tolera errores de tipeo)."""
+    try:
+        parecidos = indice_archivos.similares(nombre, limite=limite)
+        if not parecidos:
+            return f"No encontré archivos ni carpetas con un nombre parecido a '{nombre}'."
+        lineas = [f"- {ruta}{'/' if indice_archivos.es_carpeta(ruta) else ''} (similitud {puntaje:.0%})"
+                  for ruta, puntaje in parecidos]
+        return f"Nombres parecidos a '{nombre}':\n" + "\n".join(lineas)
+    except Exception as e:
+        return f"Ocurrió un error al buscar nombres parecidos a '{nombre}': {str(e)}"
+
+@memoizar("search_files")
 def search_files(pattern, directory="files"):
     """Busca archivos que coincidan con un patrón"""
+    # El directorio de trabajo se consulta en el índice de nombres, sin recorrerlo.
+    if _es_directorio_indexado(directory):
+        return [os.path.join(directory, *ruta.split("/")) for ruta in indice_archivos.buscar(pattern)]
     results = []
     for root, _, files in os.walk(directory):
         for file in files:
@@ -197,6 +245,7 @@ def convert_pdf_to_word_local(pdf_path, docx_path=None):
         cv = Converter(pdf_full_path)
         cv.convert(docx_full_path, start=0, end=None)
         cv.close()
+        registrar_creado(docx_full_path)
         return f"El archivo '{pdf_path}' se ha convertido a Word localmente como '{docx_path}'."
     except FileNotFoundError:
         return f"Error: No se encontró el archivo PDF '{pdf_path}'."
@@ -212,6 +261,7 @@ def create_folder(folder_name, base_dir="files"):
             return f"No se pudo crear: la carpeta '{folder_name}' ya existe."
         
         os.makedirs(folder_path)
+        registrar_creado(folder_path)
         return f"La carpeta '{folder_name}' ha sido creada con éxito."
     except PermissionError:
         return f"Error: No tengo permisos para crear la carpeta en '{base_dir}'."
@@ -226,12 +276,13 @@ def delete_file(file_name, base_dir="files"):
         file_path = os.path.join(base_dir, file_name)
         
         if not os.path.exists(file_path):
-            return f"No se pudo eliminar: el archivo '{file_name}' no existe."
+            return f"No se pudo eliminar: el archivo '{file_name}' no existe.{sugerir_nombres_parecidos(file_name, base_dir)}"
         
         if not os.path.isfile(file_path):
             return f"'{file_name}' es una carpeta, no un archivo. No se puede eliminar con esta función."
         
         os.remove(file_path)
+        registrar_eliminado(file_path)
         return f"El archivo '{file_name}' ha sido eliminado correctamente."
     except FileNotFoundError:
         return f"Error: El archivo '{file_name}' no fue encontrado al intentar eliminarlo."
@@ -252,6 +303,7 @@ def delete_folder(folder_name, base_dir="files"):
             return f"'{folder_name}' es un archivo, no una carpeta. No se puede eliminar con esta función."
         
         shutil.rmtree(folder_path)
+        registrar_eliminado(folder_path)
         return f"La carpeta '{folder_name}' y todo su contenido han sido eliminados."
     except FileNotFoundError:
         return f"Error: La carpeta '{folder_name}' no fue encontrada al intentar eliminarla."
@@ -276,13 +328,17 @@ def move_file(file_name, dest_folder, base_dir="files"):
             found_files = []
             # os.path.basename para buscar solo por el nombre del archivo
             target_filename = os.path.basename(file_name)
-            for root, _, files in os.walk(base_dir):
-                if target_filename in files:
-                    # Construir la ruta completa del archivo encontrado
-                    found_files.append(os.path.join(root, target_filename))
+            if _es_directorio_indexado(base_dir):
+                found_files = [os.path.join(base_dir, *ruta.split("/"))
+                               for ruta in indice_archivos.por_nombre(target_filename)]
+            else:
+                for root, _, files in os.walk(base_dir):
+                    if target_filename in files:
+                        # Construir la ruta completa del archivo encontrado
+                        found_files.append(os.path.join(root, target_filename))
             
             if len(found_files) == 0:
-                return f"No se pudo mover: el archivo '{target_filename}' no se encontró en ninguna carpeta."
+                return f"No se pudo mover: el archivo '{target_filename}' no se encontró en ninguna carpeta.{sugerir_nombres_parecidos(target_filename, base_dir)}"
             if len(found_files) > 1:
                 return f"Conflicto: Se encontraron varios archivos llamados '{target_filename}'. Por favor, especifica la ruta completa."
             
@@ -299,6 +355,7 @@ def move_file(file_name, dest_folder, base_dir="files"):
         final_dest_path = os.path.join(dest_dir, os.path.basename(source_path))
 
         shutil.move(source_path, final_dest_path)
+        registrar_renombrado(source_path, final_dest_path)
         
         # Obtener la ruta relativa para el mensaje de éxito
         relative_source = os.path.relpath(source_path, base_dir)
@@ -327,6 +384,7 @@ def move_folder(folder_name, dest_folder, base_dir="files"):
         os.makedirs(dest_dir, exist_ok=True)
 
         shutil.move(source_path, dest_dir)
+        registrar_renombrado(source_path, os.path.join(dest_dir, os.path.basename(os.path.normpath(source_path))))
         return f"La carpeta '{folder_name}' se ha movido correctamente a '{dest_folder}'."
     except FileNotFoundError:
         return f"Error: No se encontró la carpeta de origen o destino al intentar mover '{folder_name}'."
@@ -354,12 +412,14 @@ def create_backup(item_name, base_dir="files", backup_dir="backups"):
             backup_name = f"{name}_backup_{timestamp}{ext}"
             dest_path = os.path.join(dest_backup_dir, backup_name)
             shutil.copy2(source_path, dest_path)
+            registrar_creado(dest_path)
             return f"Backup del archivo '{item_name}' creado con éxito como '{backup_name}'."
 
         elif os.path.isdir(source_path):
             backup_name = f"{item_name}_backup_{timestamp}"
             dest_path = os.path.join(dest_backup_dir, backup_name)
             shutil.copytree(source_path, dest_path)
+            registrar_creado(dest_path)
             return f"Backup de la carpeta '{item_name}' creado con éxito como '{backup_name}'."
         else:
             return f"'{item_name}' no es un archivo ni una carpeta válida, así que no puedo crear un backup."
@@ -386,6 +446,7 @@ def convert_word_to_pdf(word_file, output_dir="files"):
         pdf_path = os.path.join(output_dir, pdf_file)
 
         convert(word_path, pdf_path)
+        registrar_creado(pdf_path)
         return f"El archivo '{word_file}' ha sido convertido a PDF exitosamente como '{pdf_file}'."
     except FileNotFoundError:
         return f"Error: No se encontró el archivo '{word_file}'."
@@ -397,44 +458,140 @@ def convert_word_to_pdf(word_file, output_dir="files"):
 
 
 
+# Máximo de caracteres que devuelve read_file_content por llamada. De un
+# archivo más grande devuelve una parte, su tamaño y desde dónde seguir.
+LECTURA_MAX_CARACTERES = 12000
+
+_NOMBRES_UNIDAD = {"lineas": "líneas", "paginas": "páginas", "bytes": "bytes"}
+
+def _tamano_legible(tamano):
+    if tamano >= 1024 * 1024:
+        return f"{tamano / (1024 * 1024):.1f} MB"
+    return f"{max(tamano, 1) / 1024:.0f} KB" if tamano >= 1024 else f"{tamano} bytes"
+
+def _leer_por_partes(full_path, unidad, inicio, hasta, desplazamiento=0):
+    """
+    Lee líneas o páginas desde inicio hasta donde alcance LECTURA_MAX_CARACTERES
+    (o hasta 'hasta'); la primera empieza en el carácter 'desplazamiento'. Una
+    parte que sola no entra se corta. Devuelve (partes [(número, texto)],
+    cursor): cursor es (número, desplazamiento) de donde seguir, o None.
+    """
+    elementos = iterar_paginas(full_path, inicio, hasta) if unidad == "paginas" else iterar_lineas(full_path, inicio)
+    partes, usados = [], 0
+    for numero, texto in elementos:
+        if hasta is not None and numero > hasta:
+            break
+        if numero == inicio and desplazamiento:
+            texto = texto[desplazamiento:]
+        else:
+            desplazamiento = 0
+        if partes and usados + len(texto) > LECTURA_MAX_CARACTERES:
+            return partes, (numero, 0)
+        if len(texto) > LECTURA_MAX_CARACTERES:
+            # El resto de la parte se lee en la próxima llamada, desde aquí.
+            partes.append((numero, texto[:LECTURA_MAX_CARACTERES]))
+            return partes, (numero, desplazamiento + LECTURA_MAX_CARACTERES)
+        partes.append((numero, texto))
+        usados += len(texto) + 1
+    return partes, None
+
 # nuevas funciones para leer, resumir y buscar en archivos de texto, PDF y DOCX
-def read_file_content(file_path):
-    """Lee el contenido de un archivo de texto o código (.txt, .md, .py)."""
+@memoizar("read_file_content",
+          huella=lambda file_path, *args, **kwargs: huella_archivo(os.path.join('files', file_path)),
+          dependencias=lambda file_path, *args, **kwargs: dependencias_de_ruta(file_path))
+def read_file_content(file_path, desde=None, hasta=None, unidad="", desplazamiento=0):
+    """
+    Lee el contenido de un archivo de texto, código, PDF o Word. Sin rango
+    devuelve todo si entra en LECTURA_MAX_CARACTERES; si no, o si se pide un
+    rango (desde/hasta en líneas, páginas de PDF o bytes), devuelve esa parte
+    con un encabezado y, si queda más, desde dónde seguir. Una línea o página
+    más larga que el presupuesto se corta y se sigue con 'desplazamiento' (el
+    carácter de esa línea o página donde continuar).
+    """
     full_path = os.path.join('files', file_path)
     if not os.path.exists(full_path):
         return f"No se encontró el archivo '{file_path}'."
-    
+    if not es_soportado(full_path):
+        return f"El formato de archivo '{file_path}' no es compatible para lectura."
+    unidad = unidad or ("paginas" if es_paginado(full_path) else "lineas")
+    if unidad == "paginas" and not es_paginado(full_path):
+        unidad = "lineas"
+    if unidad == "bytes" and not es_texto(full_path):
+        return f"La lectura por bytes solo funciona con archivos de texto; lee '{file_path}' por líneas o páginas."
+    desplazamiento = desplazamiento or 0
+    completo = desde is None and hasta is None and not desplazamiento
+    inicio = desde or 1
+    if hasta is not None and hasta < inicio:
+        return f"El rango pedido de '{file_path}' está vacío (desde {inicio} hasta {hasta})."
+
     try:
-        if full_path.lower().endswith(('.txt', '.md', '.py', '.csv')):
-            with open(full_path, 'r', encoding='utf-8') as f:
-                return f.read()
-        elif full_path.lower().endswith('.docx'):
-            doc = Document(full_path)
-            return "\n".join([p.text for p in doc.paragraphs])
-        elif full_path.lower().endswith('.pdf'):
-            content = []
-            with open(full_path, 'rb') as f:
-                reader = PyPDF2.PdfReader(f)
-                for page in reader.pages:
-                    content.append(page.extract_text() or "")
-            return "\n".join(content)
+        tamano = os.path.getsize(full_path)
+        nombre = _NOMBRES_UNIDAD[unidad]
+        if unidad == "bytes":
+            fin = min(tamano, inicio + LECTURA_MAX_CARACTERES - 1, hasta or tamano)
+            texto = leer_bytes(full_path, inicio, fin - inicio + 1)
+            cursor = (fin + 1, 0) if fin < tamano and (hasta is None or fin < hasta) else None
+            partes = [(inicio, texto)] if inicio <= tamano else []
+            rango = f"bytes {inicio}-{fin} de {tamano}"
+        else:
+            partes, cursor = _leer_por_partes(full_path, unidad, inicio, hasta, desplazamiento)
+            if completo and cursor is None:
+                # Todo el archivo entra en el presupuesto: se devuelve tal cual.
+                return "\n".join(texto for _, texto in partes)
+            if partes:
+                rango = f"{nombre} {partes[0][0]}-{partes[-1][0]}"
+                if unidad == "paginas":
+                    rango += f" de {contar_paginas(full_path)}"
+                if desplazamiento:
+                    rango += f" (la {nombre[:-1]} {inicio} desde el carácter {desplazamiento + 1})"
+        if not partes:
+            return f"'{file_path}' no tiene {nombre} desde {inicio}."
+
+        if completo:
+            encabezado = f"'{file_path}' es grande ({_tamano_legible(tamano)}); muestro {rango}."
+        else:
+            encabezado = f"'{file_path}', {rango}:"
+        if unidad == "paginas":
+            cuerpo = "\n".join(f"--- Página {numero} ---\n{texto}" for numero, texto in partes)
         else:
-            return f"El formato de archivo '{file_path}' no es compatible para lectura."
+            cuerpo = "\n".join(texto for _, texto in partes)
+        notas = []
+        if cursor is not None and cursor[1]:
+            notas.append(f"[La {nombre[:-1]} {cursor[0]} sigue: para leer el resto usa desde={cursor[0]}, "
+                         f"desplazamiento={cursor[1]} y unidad='{unidad}'.]")
+        elif cursor is not None:
+            notas.append(f"[Hay más: para seguir leyendo usa desde={cursor[0]} y unidad='{unidad}'.]")
+        return "\n".join([encabezado, cuerpo] + notas)
     except Exception as e:
         return f"Ocurrió un error al leer '{file_path}': {str(e)}"
 
+def search_text_in_files(query, carpeta="", limite=20):
+    """Busca palabras dentro del contenido de todos los documentos y devuelve las líneas más relevantes."""
+    try:
+        resultado = indice_contenido.buscar(query, limite=limite, carpeta=carpeta)
+    except Exception as e:
+        return f"Ocurrió un error al buscar '{query}' en los documentos: {str(e)}"
+    aviso = "" if resultado["completo"] else "\n(El índice de contenido todavía se está actualizando; puede faltar algún documento.)"
+    if not resultado["resultados"]:
+        return f"No encontré '{query}' en el contenido de los documentos." + aviso
+    lineas = []
+    for r in resultado["resultados"]:
+        ubicacion = f"pág. {r['pagina']}, línea {r['linea']}" if r["pagina"] else f"línea {r['linea']}"
+        lineas.append(f"- {r['ruta']} ({ubicacion}): {r['fragmento']}")
+    return f"Coincidencias de '{query}', de la más a la menos relevante:\n" + "\n".join(lineas) + aviso
+
 def search_in_file(file_path, query):
     """Busca una palabra o frase en un archivo y devuelve las líneas donde aparece."""
+    full_path = os.path.join('files', file_path)
+    if not os.path.exists(full_path):
+        return f"No se encontró el archivo '{file_path}'."
+    if not es_soportado(full_path):
+        return f"El formato de archivo '{file_path}' no es compatible para lectura."
     try:
-        content = read_file_content(file_path)
-        if content.startswith("No se encontró") or content.startswith("Ocurrió un error"):
-            return content
-
-        results = []
-        lines = content.splitlines()
-        for i, line in enumerate(lines, 1):
-            if query.lower() in line.lower():
-                results.append(f"Línea {i}: {line.strip()}")
+        # Se recorre línea a línea, sin cargar el archivo entero.
+        buscado = query.lower()
+        results = [f"Línea {i}: {line.strip()}"
+                   for i, line in iterar_lineas(full_path) if buscado in line.lower()]
 
         if not results:
             return f"No se encontró '{query}' en '{file_path}'."
@@ -472,7 +629,9 @@ def create_zip_archive(source_list: str, zip_path: str = None, base_dir=WORKING_
         # Asegurarse de que el directorio de destino exista.
         os.makedirs(os.path.dirname(zip_full_path), exist_ok=True)
 
-        # Crear el ZIP
+        # Crear el ZIP (se anota antes porque, si falta algún origen, el
+        # archivo queda creado aunque la herramienta devuelva un error)
+        registrar_creado(zip_full_path)
         with zipfile.ZipFile(zip_full_path, 'w', compression=zipfile.ZIP_DEFLATED) as zf:
             for item in items:
                 path = os.path.join(base_dir, item)
@@ -510,10 +669,12 @@ def extract_zip_archive(zip_path: str, destination_folder: str, base_dir=WORKING
         os.makedirs(dest, exist_ok=True)
         with zipfile.ZipFile(full_zip, 'r') as zf:
             zf.extractall(path=dest)
+        registrar_creado(dest)
         return f"Contenido de '{zip_path}' extraído correctamente en carpeta '{destination_folder}'."
     except Exception as e:
         return f"Ocurrió un error al extraer ZIP: {str(e)}"
 
+@trazar("estructura_archivos", "contexto")
 def get_file_structure(directory):
     """
     Genera un string que representa la estructura de archivos y carpetas
@@ -545,6 +706,233 @@ def get_file_structure(directory):
             
     return "\n".join(tree)
 
+# Presupuesto (tokens aproximados) del contexto de archivos que va en el prompt.
+CONTEXTO_ARCHIVOS_MAX_TOKENS = int(os.getenv("CONTEXTO_ARCHIVOS_MAX_TOKENS", "800"))
+# Máximo de caracteres que devuelve la herramienta del árbol completo.
+ARBOL_MAX_CARACTERES = 12000
+# Cuántos archivos relevantes y recientes se listan como máximo.
+ARCHIVOS_RELEVANTES_EN_CONTEXTO = 25
+ARCHIVOS_RECIENTES_EN_CONTEXTO = 10
+
+def _entrada_archivo(ruta, mtime):
+    """Entrada de scan_file_entries para un archivo (ruta relativa con '/')."""
+    carpeta, _, nombre = ruta.rpartition("/")
+    return {
+        "path": ruta,
+        "carpeta": carpeta,
+        "nombre": nombre,
+        "ext": os.path.splitext(nombre)[1].lower(),
+        "mtime": mtime,
+        # Versiones normalizadas para comparar con el pedido.
+        "clave_nombre": _normalizar_texto(nombre),
+        "clave_carpeta": _normalizar_texto(carpeta),
+    }
+
+@trazar("escaneo_archivos", "contexto")
+def scan_file_entries(directory, carpeta=""):
+    """
+    Recorre el directorio una sola vez y devuelve una lista de archivos
+    (sin las carpetas de backup) con lo necesario para armar el contexto:
+    ruta relativa (con '/'), carpeta, nombre, extensión y fecha de modificación.
+    Con carpeta (relativa a directory) se recorre solo esa parte.
+    """
+    entries = []
+    pendientes = [carpeta]
+    while pendientes:
+        relativa = pendientes.pop()
+        try:
+            with os.scandir(os.path.join(directory, relativa)) as it:
+                for entry in it:
+                    ruta = f"{relativa}/{entry.name}" if relativa else entry.name
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            if entry.name != "backups":
+                                pendientes.append(ruta)
+                        elif entry.is_file():
+                            entries.append(_entrada_archivo(ruta, entry.stat().st_mtime))
+                    except OSError:
+                        continue
+        except OSError:
+            continue
+    entries.sort(key=lambda e: e["path"])
+    return entries
+
+@trazar("aplicar_cambios", "contexto")
+def aplicar_cambios(entries, cambios, directory):
+    """
+    Actualiza una lista de scan_file_entries con los cambios anotados por las
+    herramientas (ver cambios.py): quita lo que había en cada ruta afectada y
+    vuelve a leer solo esas rutas del disco. Devuelve None si hace falta
+    recorrer todo de nuevo (un cambio en la raíz o fuera del directorio).
+    """
+    rutas = rutas_afectadas(cambios)
+    if any(afecta_todo(r) for r in rutas):
+        return None
+    if not rutas:
+        return entries
+
+    def afectada(ruta):
+        return any(ruta == r or ruta.startswith(r + "/") for r in rutas)
+
+    nuevas = {e["path"]: e for e in entries if not afectada(e["path"])}
+    for ruta in rutas:
+        # Igual que scan_file_entries, lo que está dentro de backups no se lista.
+        if "backups" in ruta.split("/")[:-1]:
+            continue
+        completa = os.path.join(directory, ruta)
+        try:
+            if os.path.isdir(completa):
+                if os.path.basename(ruta) == "backups":
+                    continue
+                for e in scan_file_entries(directory, ruta):
+                    nuevas[e["path"]] = e
+            elif os.path.isfile(completa):
+                nuevas[ruta] = _entrada_archivo(ruta, os.stat(completa).st_mtime)
+        except OSError:
+            continue
+    return sorted(nuevas.values(), key=lambda e: e["path"])
+
+def _arbol_desde_entradas(entries):
+    """Arma el mismo árbol que get_file_structure a partir de entradas ya escaneadas."""
+    tree = []
+    carpeta_actual = None
+    for e in sorted(entries, key=lambda e: (e["carpeta"], e["nombre"])):
+        if e["carpeta"] != carpeta_actual:
+            carpeta_actual = e["carpeta"]
+            if carpeta_actual:
+                partes = carpeta_actual.split("/")
+                tree.append(f"{'    ' * (len(partes) - 1)}📁 {partes[-1]}/")
+        nivel = carpeta_actual.count("/") + 1 if carpeta_actual else 0
+        tree.append(f"{'    ' * nivel}📄 {e['nombre']}")
+    return "\n".join(tree)
+
+def _normalizar_texto(texto):
+    """Minúsculas y sin tildes, para comparar nombres con lo que escribe el usuario."""
+    texto = unicodedata.normalize("NFKD", texto.lower())
+    return "".join(c for c in texto if not unicodedata.combining(c))
+
+# Palabras frecuentes en los pedidos que no ayudan a encontrar archivos.
+_PALABRAS_VACIAS = {
+    "archivo", "archivos", "carpeta", "carpetas", "los", "las", "del", "que", "con",
+    "para", "por", "una", "uno", "unos", "unas", "esta", "este", "donde", "como",
+    "quiero", "necesito", "puedes", "todos", "todas",
+}
+
+def _palabras_clave(command):
+    """Palabras del comando que sirven para buscar archivos (nombres citados y palabras de 3+ letras)."""
+    command = _normalizar_texto(command)
+    citados = [c.strip() for c in re.findall(r"['\"“”‘’]([^'\"“”‘’]+)['\"“”‘’]", command) if c.strip()]
+    palabras = [p for p in re.findall(r"[\w.-]{3,}", command) if p not in _PALABRAS_VACIAS]
+    return citados, palabras
+
+def _puntaje_relevancia(entry, citados, palabras):
+    nombre = entry["clave_nombre"]
+    carpeta = entry["clave_carpeta"]
+    puntaje = 0
+    for c in citados:
+        if c == nombre or entry["path"].lower().endswith(c):
+            puntaje += 10
+        elif c in nombre:
+            puntaje += 5
+    for p in palabras:
+        if p in nombre:
+            puntaje += 3
+        elif p in carpeta:
+            puntaje += 1
+    return puntaje
+
+def _resumen_carpeta(carpeta, archivos):
+    """Una línea por carpeta: cantidad, extensiones más comunes y algunos ejemplos recientes."""
+    por_ext = {}
+    for e in archivos:
+        por_ext[e["ext"] or "sin extensión"] = por_ext.get(e["ext"] or "sin extensión", 0) + 1
+    comunes = sorted(por_ext.items(), key=lambda kv: -kv[1])
+    detalle = ", ".join(f"{ext}: {n}" for ext, n in comunes[:4])
+    if len(comunes) > 4:
+        detalle += f", otros: {sum(n for _, n in comunes[4:])}"
+    ejemplos = [e["nombre"] for e in sorted(archivos, key=lambda e: -e["mtime"])[:3]]
+    if len(archivos) > len(ejemplos):
+        ejemplos.append("…")
+    nombre = f"{carpeta}/" if carpeta else "(raíz)"
+    cantidad = f"{len(archivos)} archivo" if len(archivos) == 1 else f"{len(archivos)} archivos"
+    return f"📁 {nombre}: {cantidad} ({detalle}) — p. ej. {', '.join(ejemplos)}"
+
+@trazar("contexto_archivos", "contexto")
+def build_file_context(entries, command="", max_tokens=CONTEXTO_ARCHIVOS_MAX_TOKENS):
+    """
+    Arma el contexto de archivos para el prompt sin pasarse de max_tokens.
+    Si el árbol completo entra en el presupuesto se usa tal cual; si no, se
+    envía un resumen por carpeta, los archivos relacionados con el comando
+    (por nombre) y los modificados más recientemente. El árbol completo queda
+    disponible con la herramienta get_file_tree.
+    """
+    # Cada línea del árbol ocupa al menos un par de tokens: si hay más archivos
+    # que tokens disponibles ni siquiera se arma.
+    if len(entries) <= max_tokens:
+        arbol = _arbol_desde_entradas(entries)
+        if estimar_tokens(arbol) <= max_tokens:
+            return arbol
+
+    carpetas = {}
+    for e in entries:
+        carpetas.setdefault(e["carpeta"], []).append(e)
+
+    citados, palabras = _palabras_clave(command)
+    relevantes = []
+    if citados or palabras:
+        puntajes = ((_puntaje_relevancia(e, citados, palabras), e) for e in entries)
+        relevantes = sorted(((p, e) for p, e in puntajes if p > 0), key=lambda pe: (-pe[0], -pe[1]["mtime"]))
+    recientes = sorted(entries, key=lambda e: -e["mtime"])[:ARCHIVOS_RECIENTES_EN_CONTEXTO]
+
+    # Las carpetas donde hay archivos relevantes van primero; luego las más grandes.
+    carpetas_relevantes = {e["carpeta"] for _, e in relevantes}
+    orden_carpetas = sorted(carpetas, key=lambda c: (c not in carpetas_relevantes, -len(carpetas[c]), c))
+
+    secciones = [
+        ("Archivos relacionados con el pedido:", [f"📄 {e['path']}" for _, e in relevantes[:ARCHIVOS_RELEVANTES_EN_CONTEXTO]]),
+        ("Carpetas:", [_resumen_carpeta(c, carpetas[c]) for c in orden_carpetas]),
+        ("Modificados recientemente:", [f"📄 {e['path']}" for e in recientes]),
+    ]
+    nota = "(Vista recortada: usa la herramienta get_file_tree para ver el árbol completo o el de una carpeta.)"
+
+    lineas = [f"Espacio de trabajo: {len(entries)} archivos en {len(carpetas)} carpetas (vista resumida)."]
+    usados = estimar_tokens(lineas[0]) + estimar_tokens(nota)
+    for titulo, items in secciones:
+        if not items:
+            continue
+        # Cada sección se corta donde se acaba el presupuesto; las siguientes
+        # todavía pueden aportar alguna línea corta.
+        costo_titulo = estimar_tokens(titulo)
+        if usados + costo_titulo + estimar_tokens(items[0]) > max_tokens:
+            continue
+        lineas.append(titulo)
+        usados += costo_titulo
+        for linea in items:
+            costo = estimar_tokens(linea)
+            if usados + costo > max_tokens:
+                break
+            lineas.append(linea)
+            usados += costo
+    lineas.append(nota)
+    return "\n".join(lineas)
+
+def get_file_tree(carpeta=""):
+    """
+    Devuelve el árbol de archivos del espacio de trabajo, o el de una carpeta
+    si se indica. Si es muy grande se corta y se sugiere pedir una subcarpeta.
+    """
+    carpeta = carpeta.strip().strip("/")
+    directorio = os.path.join(WORKING_DIR, carpeta) if carpeta else WORKING_DIR
+    if not os.path.isdir(directorio):
+        return f"No pude encontrar la carpeta '{carpeta}'. Por favor, verifica el nombre e inténtalo de nuevo."
+    arbol = get_file_structure(directorio)
+    if not arbol:
+        return f"La carpeta '{carpeta or WORKING_DIR}' está vacía."
+    if len(arbol) > ARBOL_MAX_CARACTERES:
+        arbol = arbol[:ARBOL_MAX_CARACTERES].rsplit("\n", 1)[0]
+        arbol += "\n… (árbol recortado; pide el de una subcarpeta para ver más)"
+    return arbol
+
 def move_files_batch(source_folder: str, dest_folder: str, pattern: str = "*"):
     """
     Mueve archivos de una carpeta a otra según un patrón.
@@ -564,6 +952,7 @@ def move_files_batch(source_folder: str, dest_folder: str, pattern: str = "*"):
 
     for f in files:
         shutil.move(f, dst_path)
+        registrar_renombrado(f, os.path.join(dst_path, os.path.basename(f)))
 
     return f"Movidos {len(files)} archivos de {source_folder} a {dest_folder}"
 
@@ -589,6 +978,7 @@ def rename_files_batch(folder: str, pattern: str, prefix: str = "", suffix: str
         new_name = f"{prefix}{name}{suffix}{ext}"
         new_path = os.path.join(dir_name, new_name)
         os.rename(f, new_path)
+        registrar_renombrado(f, new_path)
 
     return f"Renombrados {len(files)} archivos en {folder}"
 
@@ -612,6 +1002,7 @@ def convert_images_batch(folder: str, source_ext: str = ".jpg", target_ext: str
         img = Image.open(f)
         new_name = os.path.splitext(f)[0] + target_ext
         img.save(new_name)
+        registrar_creado(new_name)
 
     return f"Convertidas {len(files)} imágenes de {source_ext} a {target_ext} en {folder}"
 
@@ -619,83 +1010,176 @@ def convert_images_batch(folder: str, source_ext: str = ".jpg", target_ext: str
 
 # Funciones para interactuar con Mangle a través de gRPC
 
+# Pool compartido para lanzar varias consultas a Mangle a la vez. Todas viajan
+# por el mismo canal gRPC, que las multiplexa sobre una única conexión.
+_mangle_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="mangle")
 
-def consultar_base_de_conocimiento(query: str):
+def ejecutar_en_paralelo(tareas: dict):
     """
-    Se conecta al servicio de Mangle, envía una consulta y devuelve los resultados procesados.
+    Ejecuta en paralelo las tareas de un diccionario {nombre: función_sin_argumentos}.
+    Devuelve dos diccionarios, con los resultados y con el tiempo (en segundos) de
+    cada tarea, ambos en el mismo orden en que se recibieron las tareas.
     """
-    try:
-        with grpc.insecure_channel('localhost:8080') as channel:
-            stub = mangle_pb2_grpc.MangleStub(channel)
-            response = stub.Query(mangle_pb2.QueryRequest(query=query))
-            
-            resultados = []
-            
-            for result in response:
-                # result.answer contiene la respuesta completa, ej: 'horas_semanales("Lucas", "Proyecto_Gamma", 20)'
-                answer = result.answer.strip()
-                
-                # Intentar extraer información de diferentes tipos de respuestas
-                if "(" in answer and ")" in answer:
-                    # Extraer el contenido dentro de los paréntesis
-                    start = answer.find("(") + 1
-                    end = answer.rfind(")")
-                    contenido = answer[start:end]
-                    
-                    # Dividir por comas y limpiar cada parte
-                    partes = []
-                    for parte in contenido.split(","):
-                        parte = parte.strip()
-                        # Quitar comillas si las tiene
-                        if parte.startswith('"') and parte.endswith('"'):
-                            parte = parte[1:-1]
-                        partes.append(parte)
-                    
-                    # Formatear según el tipo de consulta
-                    if len(partes) >= 3 and any(keyword in query for keyword in ["horas_semanales", "progreso_proyecto", "presupuesto"]):
-                        # Para consultas con 3 parámetros como horas_semanales(Persona, Proyecto, Horas)
-                        if len(partes) == 3:
-                            resultados.append(f"{partes[0]} en {partes[1]}: {partes[2]}")
-                        else:
-                            resultados.append(" - ".join(partes))
-                    elif len(partes) == 2:
-                        # Para consultas con 2 parámetros como contacto(Persona, Email)
-                        resultados.append(f"{partes[0]} ({partes[1]})")
-                    elif len(partes) == 1:
-                        # Para consultas simples
-                        resultados.append(partes[0])
-                    else:
-                        # Formato genérico
-                        resultados.append(" - ".join(partes))
-                else:
-                    # Si no tiene paréntesis, usar el patrón original
-                    pattern = re.compile(r'\"(.*?)\"')
-                    matches = pattern.findall(answer)
-                    if matches:
-                        resultados.extend(matches)
-                    else:
-                        # Como último recurso, agregar la respuesta completa
-                        resultados.append(answer)
-            
-            if not resultados:
-                return "No se encontraron resultados para la consulta."
+    def medir(func):
+        inicio = time.perf_counter()
+        resultado = func()
+        return resultado, time.perf_counter() - inicio
+
+    futuros = {nombre: _mangle_executor.submit(medir, func) for nombre, func in tareas.items()}
+
+    resultados = {}
+    tiempos = {}
+    for nombre, futuro in futuros.items():
+        resultados[nombre], tiempos[nombre] = futuro.result()
+    return resultados, tiempos
+
+def formatear_tiempos(tiempos: dict, total: float) -> str:
+    """Formatea el desglose de tiempos por consulta de un reporte."""
+    detalle = ", ".join(f"{nombre}: {segundos * 1000:.0f} ms" for nombre, segundos in tiempos.items())
+    cache = cliente_mangle.cache.estadisticas()
+    return (f"⏱️ TIEMPOS: total {total * 1000:.0f} ms ({detalle}) | "
+            f"caché: {cache['aciertos']} aciertos, {cache['fallos']} fallos")
+
+
+def texto_valor(valor) -> str:
+    """Convierte un valor tipado de una Fila de Mangle en texto para mostrar."""
+    if isinstance(valor, float):
+        # Sin redondear: presupuestos como 1234567.5 no deben verse como 1.23457e+06.
+        return str(int(valor)) if valor.is_integer() else str(valor)
+    if isinstance(valor, (list, tuple)):
+        return "[" + ", ".join(texto_valor(v) for v in valor) + "]"
+    if isinstance(valor, dict):
+        return "{" + ", ".join(f"{texto_valor(k)}: {texto_valor(v)}" for k, v in valor.items()) + "}"
+    return str(valor)
+
+def formatear_filas(query: str, filas: list) -> str:
+    """
+    Convierte las filas de Mangle de una consulta en un texto legible.
+    Es solo la capa de presentación: los valores ya llegan tipados desde mangle_client.
+    """
+    resultados = []
+
+    for fila in filas:
+        # fila.valores contiene los argumentos, ej: ('Lucas', 'Proyecto_Gamma', 20)
+        partes = [texto_valor(v) for v in fila.valores]
+
+        if not partes:
+            # Átomo sin argumentos (o texto que no se pudo interpretar)
+            resultados.append(fila.predicado)
+        elif len(partes) >= 3 and any(keyword in query for keyword in ["horas_semanales", "progreso_proyecto", "presupuesto"]):
+            # Para consultas con 3 parámetros como horas_semanales(Persona, Proyecto, Horas)
+            if len(partes) == 3:
+                resultados.append(f"{partes[0]} en {partes[1]}: {partes[2]}")
+            else:
+                resultados.append(" - ".join(partes))
+        elif len(partes) == 2:
+            # Para consultas con 2 parámetros como contacto(Persona, Email)
+            resultados.append(f"{partes[0]} ({partes[1]})")
+        elif len(partes) == 1:
+            # Para consultas simples
+            resultados.append(partes[0])
+        else:
+            # Formato genérico
+            resultados.append(" - ".join(partes))
+    
+    if not resultados:
+        return "No se encontraron resultados para la consulta."
+
+    return f"Resultados de la consulta: {', '.join(resultados)}"
 
-            return f"Resultados de la consulta: {', '.join(resultados)}"
+def mensaje_error_grpc(e: grpc.RpcError) -> str:
+    """Traduce un error de gRPC del servicio Mangle a un mensaje para el usuario."""
+    if e.code() == grpc.StatusCode.UNAVAILABLE:
+        return "Error: No se pudo conectar al servicio de Mangle. ¿Está el servidor en funcionamiento?"
+    if e.code() == grpc.StatusCode.DEADLINE_EXCEEDED:
+        return "Error: El servicio de Mangle tardó demasiado en responder a la consulta."
+    return f"Ocurrió un error de gRPC: {e.details()}"
 
+def consultar_filas(query: str, program: str = ""):
+    """
+    Envía una consulta al servicio de Mangle y devuelve las filas tipadas (mangle_client.Fila).
+    Los errores de gRPC se propagan para que cada llamador decida cómo informarlos.
+    """
+    return cliente_mangle.query(query, program)
+
+# Filas que se muestran por defecto en una respuesta para el agente; el resto se pide por páginas.
+LIMITE_FILAS_CONSULTA = 50
+
+def consultar_base_de_conocimiento(query: str, limite: int = LIMITE_FILAS_CONSULTA, desde: int = 0):
+    """
+    Envía una consulta al servicio de Mangle (a través del cliente compartido)
+    y devuelve los resultados procesados. Solo se traen 'limite' filas a partir de
+    'desde', así que relaciones grandes no saturan la memoria ni el contexto del modelo;
+    si quedan más filas se indica cómo pedir la página siguiente.
+    """
+    try:
+        limite = int(limite)
+        desde = int(str(desde).strip() or 0)
+        pagina = cliente_mangle.query_page(query, limit=limite, offset=desde)
+        texto = formatear_filas(query, pagina.filas)
+        if pagina.hay_mas:
+            if pagina.total is not None:
+                restantes = pagina.total - pagina.siguiente
+                texto += (f"\n(Mostrando {desde + 1}-{pagina.siguiente} de {pagina.total}; "
+                          f"hay {restantes} más, usa desde={pagina.siguiente} para ver la siguiente página.)")
+            else:
+                texto += f"\n(Hay más resultados; usa desde={pagina.siguiente} para ver la siguiente página.)"
+        elif desde and not pagina.filas:
+            texto = f"No hay más resultados a partir de la fila {desde}."
+        return texto
     except grpc.RpcError as e:
-        if e.code() == grpc.StatusCode.UNAVAILABLE:
-            return "Error: No se pudo conectar al servicio de Mangle. ¿Está el servidor en funcionamiento?"
-        return f"Ocurrió un error de gRPC: {e.details()}"
+        return mensaje_error_grpc(e)
     except Exception as e:
         return f"Ocurrió un error inesperado al consultar la base de conocimiento: {str(e)}"
 
+def consultar_lote_filas(queries: dict, program: str = ""):
+    """
+    Envía varias consultas {nombre: consulta} en una sola llamada (BatchQuery), de modo
+    que todas se responden con el mismo estado de la base de conocimiento.
+    Devuelve ({nombre: lista de Fila}, {nombre: mensaje_de_error}). Los errores de gRPC
+    que afectan a todo el lote se propagan.
+    """
+    try:
+        return cliente_mangle.batch_query(queries, program)
+    except grpc.RpcError as e:
+        if e.code() != grpc.StatusCode.UNIMPLEMENTED:
+            raise
+    # Servidor sin BatchQuery: se hacen las consultas por separado, en paralelo.
+    futuros = {nombre: _mangle_executor.submit(consultar_filas, query, program)
+               for nombre, query in queries.items()}
+    filas = {}
+    errores = {}
+    for nombre, futuro in futuros.items():
+        try:
+            filas[nombre] = futuro.result()
+        except grpc.RpcError as e:
+            errores[nombre] = e.details()
+    return filas, errores
+
+def consultar_lote(queries: dict, program: str = ""):
+    """
+    Igual que consultar_lote_filas, pero devuelve {nombre: resultado_formateado}
+    en el mismo orden recibido.
+    """
+    try:
+        filas, errores = consultar_lote_filas(queries, program)
+    except grpc.RpcError as e:
+        return {nombre: mensaje_error_grpc(e) for nombre in queries}
+    except Exception as e:
+        mensaje = f"Ocurrió un error inesperado al consultar la base de conocimiento: {str(e)}"
+        return {nombre: mensaje for nombre in queries}
+
+    resultados = {}
+    for nombre, query in queries.items():
+        if nombre in errores:
+            resultados[nombre] = f"Error en la consulta: {errores[nombre]}"
+        else:
+            resultados[nombre] = formatear_filas(query, filas.get(nombre, []))
+    return resultados
+
 def actualizar_base_de_conocimiento_grpc(program: str):
     """Se comunica con el servidor gRPC de Mangle para actualizar la base de conocimiento."""
-    with grpc.insecure_channel("localhost:8080") as channel:
-        stub = mangle_pb2_grpc.MangleStub(channel)
-        req = mangle_pb2.UpdateRequest(program=program)
-        response = stub.Update(req)
-        return response.updated_predicates
+    return cliente_mangle.update(program)
 
 def limpiar_base_de_conocimiento():
     """
@@ -704,6 +1188,7 @@ def limpiar_base_de_conocimiento():
     try:
         print("Limpiando la base de conocimiento de Mangle...")
         respuesta = actualizar_base_de_conocimiento_grpc("")
+        cliente_mangle.invalidar_cache()
         return "La base de conocimiento de Mangle ha sido limpiada con éxito."
     except Exception as e:
         return f"Ocurrió un error al limpiar la base de conocimiento: {str(e)}"
@@ -738,45 +1223,157 @@ def normalizar_nombre_para_mangle(nombre: str) -> str:
     # Solo reemplazamos espacios por guiones bajos, mantenemos mayúsculas
     return nombre.replace(" ", "_")
 
-def cargar_todos_los_contactos_desde_archivo(file_path: str = "contactos.txt"):
+def escapar_cadena_mangle(texto: str) -> str:
+    """Escapa barras invertidas y comillas para usar el texto dentro de una cadena de Mangle."""
+    return texto.replace("\\", "\\\\").replace('"', '\\"')
+
+def hechos_contacto(contacto: ContactoInput) -> list:
+    """Devuelve los hechos de Mangle (esquema unificado) que representan a un contacto."""
+    nombre = escapar_cadena_mangle(normalizar_nombre_para_mangle(contacto.nombre))
+    return [
+        f'contacto("{nombre}", "{escapar_cadena_mangle(contacto.email)}").',
+        f'puesto("{nombre}", "{escapar_cadena_mangle(contacto.rol)}").',
+        f'trabaja_en("{nombre}", "{escapar_cadena_mangle(contacto.proyecto)}").'
+    ]
+
+# Filas que se validan juntas durante una importación masiva de contactos.
+FILAS_POR_VALIDACION = 1000
+# Contactos por cada Update enviado a Mangle (3 hechos por contacto).
+CONTACTOS_POR_LOTE = 2000
+# Lotes que pueden estar enviándose a la vez cuando la importación es en paralelo.
+LOTES_EN_PARALELO = 4
+
+_validador_contactos = TypeAdapter(list[ContactoInput])
+
+def validar_contactos(filas: list):
+    """
+    Valida un lote de filas (diccionarios) contra ContactoInput de una sola vez.
+    Devuelve (contactos_validos, {indice_en_el_lote: motivo}) para las filas rechazadas.
+    """
+    try:
+        return _validador_contactos.validate_python(filas), {}
+    except ValidationError as e:
+        motivos = {}
+        for error in e.errors():
+            indice, *campo = error["loc"]
+            motivos.setdefault(indice, f"{'.'.join(str(c) for c in campo)}: {error['msg']}")
+        validos = [ContactoInput.model_validate(fila) for i, fila in enumerate(filas) if i not in motivos]
+        return validos, motivos
+
+def _normalizar_clave_contacto(nombre: str) -> str:
+    """Clave para detectar contactos repetidos: sin mayúsculas ni espacios de más."""
+    return " ".join(nombre.split()).casefold()
+
+def cargar_todos_los_contactos_desde_archivo(file_path: str = "contactos.txt", paralelo: bool = True):
     """
     Carga TODOS los contactos desde el archivo usando el esquema unificado.
-    IMPORTANTE: Esto reemplaza todos los contactos en la base de conocimiento.
+    El archivo (CSV: nombre, puesto, email, proyecto) se lee en streaming, las filas se
+    validan por lotes con ContactoInput, los contactos repetidos (mismo nombre normalizado)
+    se descartan y los hechos se envían a Mangle en lotes acotados, opcionalmente en
+    paralelo, así que archivos muy grandes no generan un único programa gigante.
     """
     try:
+        file_path = file_path.strip() or "contactos.txt"
         full_path = os.path.join('files', file_path)
         if not os.path.exists(full_path):
             return f"Error: No se pudo encontrar el archivo '{file_path}'."
 
-        hechos = []
+        inicio = time.perf_counter()
+        vistos = set()
+        rechazadas = []          # (línea, motivo)
+        errores_envio = []
+        pendientes = []          # futuros de lotes enviados
+        lote_hechos = []
+        contactos_en_lote = 0
         contactos_cargados = 0
-        
-        with open(full_path, 'r', encoding='utf-8') as f:
-            for linea in f:
-                linea = linea.strip()
-                if linea and ',' in linea:
-                    partes = [p.strip() for p in linea.split(',')]
-                    if len(partes) >= 4:
-                        nombre, puesto, email, proyecto = partes[:4]
-                        nombre_mangle = normalizar_nombre_para_mangle(nombre)
-                        
-                        # Usar el esquema de tu archivo .mgl existente
-                        hechos.extend([
-                            f'contacto("{nombre_mangle}", "{email}").',
-                            f'puesto("{nombre_mangle}", "{puesto}").',
-                            f'trabaja_en("{nombre_mangle}", "{proyecto}").'
-                        ])
-                        contactos_cargados += 1
-
-        if not hechos:
+        lotes_enviados = 0
+
+        def enviar_lote():
+            nonlocal lote_hechos, contactos_en_lote, contactos_cargados, lotes_enviados
+            if not lote_hechos:
+                return
+            programa = "\n".join(lote_hechos)
+            cantidad = contactos_en_lote
+            lote_hechos, contactos_en_lote = [], 0
+            lotes_enviados += 1
+            if paralelo:
+                # Se limita la cantidad de lotes en vuelo para acotar la memoria.
+                while len(pendientes) >= LOTES_EN_PARALELO:
+                    esperar_lote(pendientes.pop(0))
+                pendientes.append((cantidad, _mangle_executor.submit(actualizar_base_de_conocimiento_grpc, programa)))
+            else:
+                esperar_lote((cantidad, None), programa)
+
+        def esperar_lote(pendiente, programa=None):
+            nonlocal contactos_cargados
+            cantidad, futuro = pendiente
+            try:
+                if futuro is not None:
+                    futuro.result()
+                else:
+                    actualizar_base_de_conocimiento_grpc(programa)
+                contactos_cargados += cantidad
+            except grpc.RpcError as e:
+                errores_envio.append(mensaje_error_grpc(e))
+            except Exception as e:
+                errores_envio.append(str(e))
+
+        def procesar_filas(filas, lineas):
+            nonlocal contactos_en_lote
+            validos, motivos = validar_contactos(filas)
+            for indice, motivo in motivos.items():
+                rechazadas.append((lineas[indice], motivo))
+            lineas_validas = [linea for i, linea in enumerate(lineas) if i not in motivos]
+            for contacto, linea in zip(validos, lineas_validas):
+                clave = _normalizar_clave_contacto(contacto.nombre)
+                if clave in vistos:
+                    rechazadas.append((linea, f"contacto repetido ({contacto.nombre})"))
+                    continue
+                vistos.add(clave)
+                lote_hechos.extend(hechos_contacto(contacto))
+                contactos_en_lote += 1
+                if contactos_en_lote >= CONTACTOS_POR_LOTE:
+                    enviar_lote()
+
+        campos = ("nombre", "rol", "email", "proyecto")
+        filas, lineas = [], []
+        with open(full_path, 'r', encoding='utf-8', newline='') as f:
+            lector = csv.reader(f, skipinitialspace=True)
+            for partes in lector:
+                if not any(p.strip() for p in partes):
+                    continue
+                if lector.line_num == 1 and partes[0].strip().lower() == "nombre":
+                    continue  # Encabezado
+                fila = dict(zip(campos, partes))
+                fila["archivo_destino"] = file_path
+                filas.append(fila)
+                lineas.append(lector.line_num)
+                if len(filas) >= FILAS_POR_VALIDACION:
+                    procesar_filas(filas, lineas)
+                    filas, lineas = [], []
+        if filas:
+            procesar_filas(filas, lineas)
+        enviar_lote()
+        for pendiente in pendientes:
+            esperar_lote(pendiente)
+
+        duracion = time.perf_counter() - inicio
+        if contactos_cargados == 0 and not rechazadas and not errores_envio:
             return "No se encontraron contactos válidos en el archivo."
 
-        # Cargar todo el programa
-        programa_mangle = "\n".join(hechos)
-        print(f"Cargando {contactos_cargados} contactos a Mangle...")
-        actualizar_base_de_conocimiento_grpc(programa_mangle)
-        
-        return f"Se cargaron {contactos_cargados} contactos desde '{file_path}' usando el esquema unificado."
+        velocidad = contactos_cargados / duracion if duracion > 0 else contactos_cargados
+        mensaje = (f"Se cargaron {contactos_cargados} contactos desde '{file_path}' usando el esquema unificado "
+                   f"en {duracion:.2f} s ({velocidad:.0f} contactos/s, {lotes_enviados} lotes).")
+        print(f"Importación de contactos: {mensaje}")
+        if rechazadas:
+            rechazadas.sort()
+            detalle = "; ".join(f"línea {linea}: {motivo}" for linea, motivo in rechazadas[:10])
+            if len(rechazadas) > 10:
+                detalle += f"; y {len(rechazadas) - 10} más"
+            mensaje += f"\nFilas rechazadas: {len(rechazadas)} ({detalle})."
+        if errores_envio:
+            mensaje += f"\nFallaron {len(errores_envio)} lotes al enviarse a Mangle: {errores_envio[0]}"
+        return mensaje
 
     except Exception as e:
         return f"Error al cargar contactos: {str(e)}"
@@ -795,30 +1392,37 @@ def agregar_contacto(input_data, archivo_default="contactos.txt"):
 
     nombre, puesto, email, proyecto = partes[:4]
     archivo = partes[4] if len(partes) > 4 else archivo_default
-    
+
     try:
-        # Paso 1: Agregar al archivo de texto
-        full_path = os.path.join("files", archivo)
+        contacto = ContactoInput(nombre=nombre, rol=puesto, email=email, proyecto=proyecto, archivo_destino=archivo)
+    except ValidationError as e:
+        campos = ", ".join(str(error["loc"][0]) for error in e.errors())
+        return f"Error: Datos de contacto inválidos ({campos})."
+
+    return registrar_contacto(contacto)
+
+def registrar_contacto(contacto: ContactoInput):
+    """Guarda un contacto ya validado en su archivo y en la base de conocimiento."""
+    try:
+        # Paso 1: Agregar al archivo de texto (como CSV, para que se pueda volver a importar)
+        full_path = os.path.join("files", contacto.archivo_destino)
+        existia = os.path.exists(full_path)
         os.makedirs(os.path.dirname(full_path), exist_ok=True)
-        with open(full_path, 'a', encoding='utf-8') as f:
-            f.write(f"{nombre},{puesto},{email},{proyecto}\n")
+        with open(full_path, 'a', encoding='utf-8', newline='') as f:
+            csv.writer(f).writerow([contacto.nombre, contacto.rol, contacto.email, contacto.proyecto])
+        if existia:
+            registrar_modificado(full_path)
+        else:
+            registrar_creado(full_path)
 
         # Paso 2: Agregar a la base de conocimiento usando el esquema unificado
-        nombre_mangle = normalizar_nombre_para_mangle(nombre)
-        
-        hechos = [
-            f'contacto("{nombre_mangle}", "{email}").',
-            f'puesto("{nombre_mangle}", "{puesto}").',
-            f'trabaja_en("{nombre_mangle}", "{proyecto}").'
-        ]
-        
-        programa_mangle = "\n".join(hechos)
+        programa_mangle = "\n".join(hechos_contacto(contacto))
         actualizar_base_de_conocimiento_grpc(programa_mangle)
         
-        return f"Contacto '{nombre}' agregado exitosamente al archivo y base de conocimiento."
+        return f"Contacto '{contacto.nombre}' agregado exitosamente al archivo y base de conocimiento."
 
     except Exception as e:
-        return f"Error al agregar contacto '{nombre}': {str(e)}"
+        return f"Error al agregar contacto '{contacto.nombre}': {str(e)}"
 
 def inicializar_base_conocimiento_completa():
     """
@@ -854,31 +1458,49 @@ def listar_todos_los_proyectos():
 
 # Funciones avanzadas para tu sistema Mangle
 
+def _numero_mangle(valor) -> str:
+    """Número como literal de Mangle; los valores enteros se escriben sin decimales."""
+    valor = float(valor)
+    return str(int(valor)) if valor.is_integer() else repr(valor)
+
+def _dia_mangle(fecha) -> str:
+    """Fecha AAAA-MM-DD como entero AAAAMMDD, que Mangle puede comparar con :lt; "" si no tiene ese formato."""
+    fecha = str(fecha).strip()
+    return fecha.replace("-", "") if re.fullmatch(r"\d{4}-\d{2}-\d{2}", fecha) else ""
+
+def _entero_mangle(valor, escala: int) -> str:
+    """Número multiplicado por escala y redondeado: las vistas suman y comparan enteros (minutos, centésimas)."""
+    return str(round(float(valor) * escala))
+
 def agregar_metricas_proyecto(input_data):
     """
     Agrega métricas y configuración a un proyecto.
     Formato: 'proyecto, estado, fecha_inicio, fecha_fin, presupuesto, prioridad, horas_estimadas'
     """
+    partes = [x.strip() for x in input_data.split(",")]
+    
+    if len(partes) < 7:
+        return "Error: Formato requerido: 'proyecto, estado, fecha_inicio, fecha_fin, presupuesto, prioridad, horas_estimadas'"
+    
+    return guardar_metricas_proyecto(*partes[:7])
+
+def guardar_metricas_proyecto(proyecto, estado, fecha_inicio, fecha_fin, presupuesto, prioridad, horas_estimadas):
+    """Guarda en la base de conocimiento la configuración y métricas de un proyecto."""
     try:
-        partes = [x.strip() for x in input_data.split(",")]
-        
-        if len(partes) < 7:
-            return "Error: Formato requerido: 'proyecto, estado, fecha_inicio, fecha_fin, presupuesto, prioridad, horas_estimadas'"
-        
-        proyecto, estado, fecha_inicio, fecha_fin, presupuesto, prioridad, horas_estimadas = partes
-        
         # Normalizar nombre del proyecto
-        proyecto_mangle = proyecto.replace(" ", "_")
+        proyecto_mangle = escapar_cadena_mangle(proyecto.replace(" ", "_"))
         
         hechos = [
             f'proyecto("{proyecto_mangle}").',
-            f'estado_proyecto("{proyecto_mangle}", "{estado}").',
-            f'fecha_inicio_proyecto("{proyecto_mangle}", "{fecha_inicio}").',
-            f'fecha_fin_proyecto("{proyecto_mangle}", "{fecha_fin}").',
-            f'presupuesto_proyecto("{proyecto_mangle}", {presupuesto}).',
-            f'prioridad_proyecto("{proyecto_mangle}", "{prioridad}").',
-            f'horas_estimadas_proyecto("{proyecto_mangle}", {horas_estimadas}).'
+            f'estado_proyecto("{proyecto_mangle}", "{escapar_cadena_mangle(estado)}").',
+            f'fecha_inicio_proyecto("{proyecto_mangle}", "{escapar_cadena_mangle(fecha_inicio)}").',
+            f'fecha_fin_proyecto("{proyecto_mangle}", "{escapar_cadena_mangle(fecha_fin)}").',
+            f'presupuesto_proyecto("{proyecto_mangle}", {_numero_mangle(presupuesto)}).',
+            f'prioridad_proyecto("{proyecto_mangle}", "{escapar_cadena_mangle(prioridad)}").',
+            f'horas_estimadas_proyecto("{proyecto_mangle}", {_numero_mangle(horas_estimadas)}).'
         ]
+        if _dia_mangle(fecha_fin):
+            hechos.append(f'fin_proyecto_dia("{proyecto_mangle}", {_dia_mangle(fecha_fin)}).')
         
         programa = "\n".join(hechos)
         actualizar_base_de_conocimiento_grpc(programa)
@@ -893,23 +1515,26 @@ def asignar_horas_persona_proyecto(input_data):
     Asigna horas trabajadas por una persona en un proyecto específico.
     Formato: 'persona, proyecto, horas_semanales, porcentaje_dedicacion, rol_en_proyecto'
     """
+    partes = [x.strip() for x in input_data.split(",")]
+    
+    if len(partes) < 5:
+        return "Error: Formato: 'persona, proyecto, horas_semanales, porcentaje_dedicacion, rol_en_proyecto'"
+    
+    return guardar_asignacion_proyecto(*partes[:5])
+
+def guardar_asignacion_proyecto(persona, proyecto, horas_semanales, porcentaje_dedicacion, rol_en_proyecto):
+    """Guarda en la base de conocimiento la asignación de una persona a un proyecto."""
     try:
-        partes = [x.strip() for x in input_data.split(",")]
-        
-        if len(partes) < 5:
-            return "Error: Formato: 'persona, proyecto, horas_semanales, porcentaje_dedicacion, rol_en_proyecto'"
-        
-        persona, proyecto, horas_semanales, porcentaje, rol = partes
-        
         # Normalizar nombres
-        persona_mangle = persona.replace(" ", "_")
-        proyecto_mangle = proyecto.replace(" ", "_")
+        persona_mangle = escapar_cadena_mangle(persona.replace(" ", "_"))
+        proyecto_mangle = escapar_cadena_mangle(proyecto.replace(" ", "_"))
         
         hechos = [
             f'asignacion("{persona_mangle}", "{proyecto_mangle}").',
-            f'horas_semanales("{persona_mangle}", "{proyecto_mangle}", {horas_semanales}).',
-            f'porcentaje_dedicacion("{persona_mangle}", "{proyecto_mangle}", {porcentaje}).',
-            f'rol_en_proyecto("{persona_mangle}", "{proyecto_mangle}", "{rol}").'
+            f'horas_semanales("{persona_mangle}", "{proyecto_mangle}", {_numero_mangle(horas_semanales)}).',
+            f'minutos_semanales("{persona_mangle}", "{proyecto_mangle}", {_entero_mangle(horas_semanales, 60)}).',
+            f'porcentaje_dedicacion("{persona_mangle}", "{proyecto_mangle}", {_numero_mangle(porcentaje_dedicacion)}).',
+            f'rol_en_proyecto("{persona_mangle}", "{proyecto_mangle}", "{escapar_cadena_mangle(rol_en_proyecto)}").'
         ]
         
         programa = "\n".join(hechos)
@@ -925,23 +1550,26 @@ def registrar_progreso_proyecto(input_data):
     Registra el progreso actual de un proyecto.
     Formato: 'proyecto, porcentaje_completado, horas_trabajadas, fecha_reporte'
     """
+    partes = [x.strip() for x in input_data.split(",")]
+    
+    if len(partes) < 3:
+        return "Error: Formato: 'proyecto, porcentaje_completado, horas_trabajadas[, fecha_reporte]'"
+    
+    return guardar_progreso_proyecto(*partes[:4])
+
+def guardar_progreso_proyecto(proyecto, porcentaje_completado, horas_trabajadas, fecha_reporte=None):
+    """Guarda en la base de conocimiento el progreso de un proyecto (por defecto, con fecha de hoy)."""
     try:
-        partes = [x.strip() for x in input_data.split(",")]
-        
-        if len(partes) < 3:
-            return "Error: Formato: 'proyecto, porcentaje_completado, horas_trabajadas[, fecha_reporte]'"
-        
-        proyecto = partes[0]
-        porcentaje = partes[1]
-        horas_trabajadas = partes[2]
-        fecha = partes[3] if len(partes) > 3 else datetime.now().strftime('%Y-%m-%d')
-        
-        proyecto_mangle = proyecto.replace(" ", "_")
+        fecha = fecha_reporte or datetime.now().strftime('%Y-%m-%d')
+        proyecto_mangle = escapar_cadena_mangle(proyecto.replace(" ", "_"))
+        porcentaje = _numero_mangle(porcentaje_completado)
         
         hechos = [
-            f'progreso_proyecto("{proyecto_mangle}", {porcentaje}, "{fecha}").',
-            f'horas_trabajadas_total("{proyecto_mangle}", {horas_trabajadas}, "{fecha}").'
+            f'progreso_proyecto("{proyecto_mangle}", {porcentaje}, "{escapar_cadena_mangle(fecha)}").',
+            f'horas_trabajadas_total("{proyecto_mangle}", {_numero_mangle(horas_trabajadas)}, "{escapar_cadena_mangle(fecha)}").'
         ]
+        if _dia_mangle(fecha):
+            hechos.append(f'avance_proyecto("{proyecto_mangle}", {_entero_mangle(porcentaje_completado, 100)}, {_dia_mangle(fecha)}).')
         
         programa = "\n".join(hechos)
         actualizar_base_de_conocimiento_grpc(programa)
@@ -951,11 +1579,14 @@ def registrar_progreso_proyecto(input_data):
     except Exception as e:
         return f"Error al registrar progreso: {str(e)}"
 
-def calcular_metricas_proyecto(proyecto):
+def calcular_metricas_proyecto(proyecto, incluir_tiempos: bool = False):
     """
-    Calcula métricas completas de un proyecto específico.
+    Calcula métricas completas de un proyecto específico. Todas las consultas viajan
+    en un solo lote, así que las métricas son consistentes entre sí; con
+    incluir_tiempos=True el reporte añade el tiempo que tardó el lote.
     """
     try:
+        inicio = time.perf_counter()
         proyecto_mangle = proyecto.replace(" ", "_")
         
         queries = {
@@ -967,69 +1598,249 @@ def calcular_metricas_proyecto(proyecto):
             'horas_por_persona': f'horas_semanales(Persona, "{proyecto_mangle}", Horas).'
         }
         
-        resultados = {}
-        for metrica, query in queries.items():
-            resultado = consultar_base_de_conocimiento(query)
-            resultados[metrica] = resultado
+        try:
+            filas, errores = consultar_lote_filas(queries)
+        except grpc.RpcError as e:
+            return mensaje_error_grpc(e)
+        duracion = time.perf_counter() - inicio
+        linea_tiempos = formatear_tiempos({f"lote de {len(queries)} consultas": duracion}, duracion)
+        print(f"Métricas de '{proyecto}' - {linea_tiempos}")
+
+        # Cada métrica se arma a partir de los valores tipados de sus filas
+        def valores(metrica, columna):
+            return [fila.valores[columna] for fila in filas.get(metrica, []) if len(fila.valores) > columna]
+
+        estado = valores('estado', 1)
+        presupuesto = valores('presupuesto', 1)
+        horas_estimadas = valores('horas_estimadas', 1)
+        progreso = [fila.valores[1:] for fila in filas.get('progreso', []) if len(fila.valores) >= 3]
+        equipo = valores('equipo', 0)
+        horas_por_persona = [fila.valores for fila in filas.get('horas_por_persona', []) if len(fila.valores) >= 3]
+
+        lineas = {
+            'estado': texto_valor(estado[0]) if estado else None,
+            'presupuesto': (f"${presupuesto[0]:,}" if isinstance(presupuesto[0], (int, float))
+                            else texto_valor(presupuesto[0])) if presupuesto else None,
+            'horas_estimadas': texto_valor(horas_estimadas[0]) if horas_estimadas else None,
+            'progreso': ", ".join(f"{texto_valor(p)}% ({texto_valor(f)})" for p, f in progreso) or None,
+            'equipo': ", ".join(texto_valor(p) for p in equipo) or None,
+            'horas_por_persona': ", ".join(f"{texto_valor(p)}: {texto_valor(h)}" for p, _, h in horas_por_persona) or None,
+        }
+        horas_asignadas = [h for _, _, h in horas_por_persona if isinstance(h, (int, float))]
+        if horas_asignadas:
+            lineas['horas_por_persona'] += f" (total {texto_valor(sum(horas_asignadas))} h/semana)"
         
         # Formatear respuesta
         reporte = f"📊 MÉTRICAS DEL PROYECTO: {proyecto}\n"
         reporte += "=" * 50 + "\n"
         
-        for metrica, valor in resultados.items():
+        for metrica, valor in lineas.items():
+            if metrica in errores:
+                valor = f"Error en la consulta: {errores[metrica]}"
+            elif valor is None:
+                valor = "Sin datos"
             reporte += f"{metrica.upper()}: {valor}\n"
+
+        if incluir_tiempos:
+            reporte += f"\n{linea_tiempos}\n"
         
         return reporte
     
     except Exception as e:
         return f"Error al calcular métricas: {str(e)}"
 
-def detectar_proyectos_en_riesgo():
+# Umbrales de las alertas de los reportes
+UMBRAL_PROGRESO_RIESGO = 50   # % de avance por debajo del cual un proyecto está en riesgo
+UMBRAL_SOBRECARGA = 40        # horas semanales por encima de las cuales alguien está sobrecargado
+UMBRAL_DISPONIBLE = 30        # horas semanales por debajo de las cuales alguien tiene disponibilidad
+
+# Vistas derivadas que se registran en el servidor de Mangle (ver consultar_vistas). El
+# servidor las mantiene materializadas y recalcula las agregaciones con cada update, así
+# que los reportes solo consultan el predicado y dan formato a las filas. Leen los hechos
+# enteros que agregan los escritores (minutos_semanales, avance_proyecto en centésimas y
+# fin_proyecto_dia como AAAAMMDD), porque fn:sum y :lt trabajan sobre enteros.
+# El servidor no retira reglas: si cambian los umbrales, las vistas viejas siguen ahí hasta
+# que se vacíe su base.
+_REGLAS_VISTAS = f"""
+carga_semanal(Persona, Minutos) :-
+    minutos_semanales(Persona, Proyecto, M)
+    |> do fn:group_by(Persona), let Minutos = fn:sum(M).
+
+persona_sobrecargada(Persona, Minutos) :-
+    carga_semanal(Persona, Minutos), :lt({UMBRAL_SOBRECARGA * 60}, Minutos).
+
+persona_disponible(Persona, Minutos) :-
+    carga_semanal(Persona, Minutos), :lt(Minutos, {UMBRAL_DISPONIBLE * 60}).
+
+ultimo_avance(Proyecto, Dia) :-
+    avance_proyecto(Proyecto, Centesimas, D)
+    |> do fn:group_by(Proyecto), let Dia = fn:max(D).
+
+avance_activo(Proyecto, Centesimas) :-
+    estado_proyecto(Proyecto, "activo"),
+    ultimo_avance(Proyecto, Dia),
+    avance_proyecto(Proyecto, C, Dia)
+    |> do fn:group_by(Proyecto), let Centesimas = fn:max(C).
+
+avance_promedio(Proyectos, Suma) :-
+    avance_activo(Proyecto, Centesimas)
+    |> do fn:group_by(), let Proyectos = fn:count(), let Suma = fn:sum(Centesimas).
+
+proyecto_en_riesgo(Proyecto, Centesimas, DiaFin) :-
+    avance_activo(Proyecto, Centesimas),
+    :lt(Centesimas, {UMBRAL_PROGRESO_RIESGO * 100}),
+    fin_proyecto_dia(Proyecto, DiaFin).
+"""
+
+# Marca que se registra junto con las vistas: si falta, el servidor perdió las reglas (o
+# tiene otra versión) y hay que registrarlas de nuevo.
+VERSION_VISTAS = hashlib.sha1(_REGLAS_VISTAS.encode("utf-8")).hexdigest()[:12]
+PROGRAMA_VISTAS = _REGLAS_VISTAS + f'\nvistas_metricas("{VERSION_VISTAS}").\n'
+
+def _texto_mangle(valor) -> str:
+    """Valor de una fila como constante de Mangle: los nombres tal cual y el resto como cadena."""
+    return str(valor) if isinstance(valor, Nombre) else f'"{escapar_cadena_mangle(str(valor))}"'
+
+def _hechos_para_vistas() -> list:
     """
-    Detecta proyectos que están en riesgo basado en métricas.
+    Hechos enteros que leen las vistas, calculados a partir de los datos guardados antes de
+    que los escritores los agregaran. Reenviar los que ya existen no tiene efecto.
     """
-    query = '''
-    proyecto_en_riesgo(Proyecto, Razon) :-
-        estado_proyecto(Proyecto, "activo"),
-        progreso_proyecto(Proyecto, Porcentaje, _),
-        fecha_fin_proyecto(Proyecto, FechaFin),
-        Porcentaje < 50,
-        FechaFin < "2025-12-31".
-    '''
-    return consultar_base_de_conocimiento(query)
+    filas, _ = consultar_lote_filas({
+        'horas': 'horas_semanales(Persona, Proyecto, Horas).',
+        'progreso': 'progreso_proyecto(Proyecto, Porcentaje, Fecha).',
+        'fin': 'fecha_fin_proyecto(Proyecto, Fecha).',
+    })
+    hechos = []
+    for persona, proyecto, horas in (f.valores for f in filas.get('horas', []) if len(f.valores) == 3):
+        if isinstance(horas, (int, float)):
+            hechos.append(f'minutos_semanales({_texto_mangle(persona)}, {_texto_mangle(proyecto)}, {_entero_mangle(horas, 60)}).')
+    for proyecto, porcentaje, fecha in (f.valores for f in filas.get('progreso', []) if len(f.valores) == 3):
+        if isinstance(porcentaje, (int, float)) and _dia_mangle(fecha):
+            hechos.append(f'avance_proyecto({_texto_mangle(proyecto)}, {_entero_mangle(porcentaje, 100)}, {_dia_mangle(fecha)}).')
+    for proyecto, fecha in (f.valores for f in filas.get('fin', []) if len(f.valores) == 2):
+        if _dia_mangle(fecha):
+            hechos.append(f'fin_proyecto_dia({_texto_mangle(proyecto)}, {_dia_mangle(fecha)}).')
+    return hechos
+
+def registrar_vistas():
+    """Registra PROGRAMA_VISTAS (con su marca) y los hechos enteros que faltan en los datos previos."""
+    programa = PROGRAMA_VISTAS + "\n".join(_hechos_para_vistas())
+    cliente_mangle.registrar_programa("vistas_metricas", programa, forzar=True)
+
+def consultar_vistas(consultas: dict, program: str = "") -> dict:
+    """
+    Consulta vistas de PROGRAMA_VISTAS en un solo lote junto con su marca, y las registra
+    de nuevo solo si la marca falta. Un resultado vacío es una respuesta válida: no
+    provoca ni un registro ni una segunda consulta. Devuelve {nombre: lista de Fila}.
+    """
+    marca = f'vistas_metricas("{VERSION_VISTAS}").'
+    lote = {'marca': marca, **consultas}
+    try:
+        filas, errores = consultar_lote_filas(lote, program)
+        falta_marca = not filas.get('marca')
+    except grpc.RpcError as e:
+        # Un program que lee vistas desconocidas no pasa el análisis del servidor:
+        # solo se reintenta si el motivo es que faltan las reglas.
+        if not program or e.code() in (grpc.StatusCode.UNAVAILABLE, grpc.StatusCode.DEADLINE_EXCEEDED):
+            raise
+        if consultar_filas(marca):
+            raise
+        falta_marca = True
+    if falta_marca:
+        registrar_vistas()
+        filas, errores = consultar_lote_filas(lote, program)
+    if errores:
+        raise RuntimeError("; ".join(f"{nombre}: {error}" for nombre, error in errores.items()))
+    return filas
+
+def _fecha_de_dia(dia) -> str:
+    """Entero AAAAMMDD de las vistas como fecha AAAA-MM-DD."""
+    dia = str(dia)
+    return f"{dia[:4]}-{dia[4:6]}-{dia[6:]}" if len(dia) == 8 else dia
+
+def detectar_proyectos_en_riesgo(fecha_limite: str = ""):
+    """
+    Detecta proyectos activos con poco avance (según su último registro de progreso)
+    cuya fecha de fin es anterior a fecha_limite (AAAA-MM-DD, por defecto el fin del año actual).
+    """
+    try:
+        fecha_limite = (fecha_limite or "").strip()
+        if not _dia_mangle(fecha_limite):
+            fecha_limite = f"{datetime.now().year}-12-31"
+
+        # La fecha límite viaja como regla de la consulta: el servidor filtra la vista.
+        filas = consultar_vistas(
+            {'riesgo': 'en_riesgo_antes_del_limite(Proyecto, Centesimas, DiaFin).'},
+            program=("en_riesgo_antes_del_limite(Proyecto, Centesimas, DiaFin) :- "
+                     "proyecto_en_riesgo(Proyecto, Centesimas, DiaFin), "
+                     f":lt(DiaFin, {_dia_mangle(fecha_limite)}).")
+        )['riesgo']
+        en_riesgo = [f"{texto_valor(proyecto)} ({texto_valor(centesimas / 100)}% completado, termina el {_fecha_de_dia(dia_fin)})"
+                     for proyecto, centesimas, dia_fin in sorted(fila.valores for fila in filas)]
+
+        criterio = f"progreso menor al {UMBRAL_PROGRESO_RIESGO}% y fecha de fin antes del {fecha_limite}"
+        if not en_riesgo:
+            return f"No hay proyectos en riesgo ({criterio})."
+        return f"Proyectos en riesgo ({criterio}): {', '.join(en_riesgo)}"
+    except grpc.RpcError as e:
+        return mensaje_error_grpc(e)
+    except Exception as e:
+        return f"Error al detectar proyectos en riesgo: {str(e)}"
+
+def _horas_por_persona(filas) -> list:
+    """Filas (Persona, Minutos) de las vistas de carga como [(persona, horas)], de mayor a menor carga."""
+    return sorted(((fila.valores[0], fila.valores[1] / 60) for fila in filas), key=lambda x: -x[1])
 
 def calcular_carga_trabajo_equipo():
     """
     Calcula la carga de trabajo total por persona.
     """
-    query = '''
-    carga_total(Persona, HorasTotal) :-
-        asignacion(Persona, _),
-        findall(H, horas_semanales(Persona, _, H), Lista),
-        sum_list(Lista, HorasTotal).
-    '''
-    return consultar_base_de_conocimiento(query)
+    try:
+        carga = _horas_por_persona(consultar_vistas({'carga': 'carga_semanal(Persona, Minutos).'})['carga'])
+        if not carga:
+            return "No hay horas asignadas en la base de conocimiento."
+        detalle = ", ".join(f"{texto_valor(persona)}: {texto_valor(horas)} h" for persona, horas in carga)
+        return f"Carga de trabajo semanal: {detalle}"
+    except grpc.RpcError as e:
+        return mensaje_error_grpc(e)
+    except Exception as e:
+        return f"Error al calcular la carga de trabajo: {str(e)}"
 
 def sugerir_redistribucion_carga():
     """
     Sugiere redistribución de carga basada en sobrecarga detectada.
     """
-    query = '''
-    persona_sobrecargada(Persona) :-
-        carga_total(Persona, Horas),
-        Horas > 40.
-    
-    persona_disponible(Persona) :-
-        carga_total(Persona, Horas),
-        Horas < 30.
-    '''
-    return consultar_base_de_conocimiento(query)
+    try:
+        filas = consultar_vistas({
+            'sobrecargadas': 'persona_sobrecargada(Persona, Minutos).',
+            'disponibles': 'persona_disponible(Persona, Minutos).',
+        })
+        sobrecargadas = _horas_por_persona(filas['sobrecargadas'])
+        disponibles = _horas_por_persona(filas['disponibles'])[::-1]
+        if not sobrecargadas:
+            return f"Nadie supera las {UMBRAL_SOBRECARGA} horas semanales."
+
+        texto = "Personas sobrecargadas: " + ", ".join(f"{texto_valor(p)} ({texto_valor(h)} h)" for p, h in sobrecargadas)
+        if disponibles:
+            texto += ". Con disponibilidad: " + ", ".join(f"{texto_valor(p)} ({texto_valor(h)} h)" for p, h in disponibles)
+            texto += f". Sugerencia: reasignar horas de {texto_valor(sobrecargadas[0][0])} a {texto_valor(disponibles[0][0])}."
+        else:
+            texto += f". Nadie tiene menos de {UMBRAL_DISPONIBLE} horas semanales para absorber la carga."
+        return texto
+    except grpc.RpcError as e:
+        return mensaje_error_grpc(e)
+    except Exception as e:
+        return f"Error al sugerir redistribución de carga: {str(e)}"
 
-def generar_dashboard_metricas():
+def generar_dashboard_metricas(incluir_tiempos: bool = False):
     """
-    Genera un dashboard completo con todas las métricas clave.
+    Genera un dashboard completo con todas las métricas clave. Las métricas se piden
+    en un solo lote y las alertas se calculan en paralelo con él, así que el dashboard
+    tarda lo que la consulta más lenta y no la suma de todas.
     """
     try:
+        inicio = time.perf_counter()
         queries = {
             'proyectos_activos': 'estado_proyecto(P, "activo").',
             'proyectos_completados': 'estado_proyecto(P, "completado").',
@@ -1039,17 +1850,28 @@ def generar_dashboard_metricas():
             'proyectos_prioritarios': 'prioridad_proyecto(P, "alta").'
         }
         
+        resultados, tiempos = ejecutar_en_paralelo({
+            'metricas': lambda: consultar_lote(queries),
+            # Métricas calculadas adicionales
+            'proyectos_en_riesgo': detectar_proyectos_en_riesgo,
+            'personas_sobrecargadas': sugerir_redistribucion_carga,
+        })
+        metricas = resultados['metricas']
+        linea_tiempos = formatear_tiempos(tiempos, time.perf_counter() - inicio)
+        print(f"Dashboard - {linea_tiempos}")
+
         dashboard = "\n🎯 DASHBOARD DE MÉTRICAS DEL EQUIPO\n"
         dashboard += "=" * 60 + "\n\n"
         
-        for metrica, query in queries.items():
-            resultado = consultar_base_de_conocimiento(query)
-            dashboard += f"📈 {metrica.upper().replace('_', ' ')}: {resultado}\n"
+        for metrica in queries:
+            dashboard += f"📈 {metrica.upper().replace('_', ' ')}: {metricas[metrica]}\n"
         
-        # Métricas calculadas adicionales
         dashboard += "\n🚨 ALERTAS:\n"
-        dashboard += f"Proyectos en riesgo: {detectar_proyectos_en_riesgo()}\n"
-        dashboard += f"Personas sobrecargadas: {sugerir_redistribucion_carga()}\n"
+        dashboard += f"{resultados['proyectos_en_riesgo']}\n"
+        dashboard += f"{resultados['personas_sobrecargadas']}\n"
+
+        if incluir_tiempos:
+            dashboard += f"\n{linea_tiempos}\n"
         
         return dashboard
     
@@ -1093,11 +1915,13 @@ def buscar_equipo_proyecto(proyecto):
 
 def calcular_progreso_promedio():
     """Calcula el progreso promedio de todos los proyectos activos"""
-    query = '''
-    progreso_promedio(PromedioTotal) :-
-        findall(P, progreso_proyecto(_, P, _), ListaProgresos),
-        length(ListaProgresos, Cantidad),
-        sum_list(ListaProgresos, SumaTotal),
-        PromedioTotal is SumaTotal / Cantidad.
-    '''
-    return consultar_base_de_conocimiento(query)
+    try:
+        filas = consultar_vistas({'promedio': 'avance_promedio(Proyectos, Suma).'})['promedio']
+        if not filas or not filas[0].valores[0]:
+            return "No hay proyectos activos con progreso registrado."
+        proyectos, suma = filas[0].valores
+        return f"Progreso promedio de {proyectos} proyectos activos: {suma / proyectos / 100:.1f}%"
+    except grpc.RpcError as e:
+        return mensaje_error_grpc(e)
+    except Exception as e:
+        return f"Error al calcular el progreso promedio: {str(e)}"
@@ -0,0 +1,8 @@
+from tools import texto_valor
+
+def test_texto_valor_no_redondea():
+    # Los valores tipados de Mangle se muestran sin perder dígitos.
+    assert texto_valor(1234567.5) == "1234567.5"
+    assert texto_valor(2500000.0) == "2500000"
+    assert texto_valor(0.125) == "0.125"
+    assert texto_valor([37.5, 40.0]) == "[37.5, 40]"
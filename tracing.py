@@ -0,0 +1,303 @@
+# tracing.py
+"""
+Trazas de tiempos por turno.
+
+Cada pedido del usuario es un turno (turno()): dentro de él se registran
+intervalos (span()) para armar el contexto de archivos, cada llamada al LLM
+(con sus tokens, vía ManejadorTrazas), cada herramienta, cada RPC a Mangle y
+la síntesis de audio. Al cerrar el turno sus intervalos se agregan, una línea
+por intervalo, a un archivo JSONL con los campos de un span de OpenTelemetry
+(traceId, spanId, parentSpanId, startTimeUnixNano, attributes, status...), y
+se guarda un resumen para el panel de la barra lateral.
+
+Fuera de un turno span() no registra nada, así que las funciones
+instrumentadas se pueden usar también desde scripts sin coste apreciable.
+"""
+
+import contextvars
+import functools
+import json
+import math
+import os
+import secrets
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+# Archivo donde se agregan los intervalos de cada turno ("" para no escribir).
+TRAZAS_ARCHIVO = os.getenv("TRAZAS_ARCHIVO", os.path.join("logs", "trazas.jsonl"))
+# Turnos recientes que se usan para el resumen (percentiles) del panel.
+TRAZAS_TURNOS_RESUMEN = 100
+
+# Categorías con las que se agrupan los tiempos en el resumen.
+CATEGORIAS = ("contexto", "llm", "herramienta", "mangle", "tts")
+
+_turno_actual = contextvars.ContextVar("turno_actual", default=None)
+_span_actual = contextvars.ContextVar("span_actual", default=None)
+
+_escritura_lock = threading.Lock()
+_resumenes = deque(maxlen=TRAZAS_TURNOS_RESUMEN)
+_resumenes_lock = threading.Lock()
+
+
+class _Turno:
+    """Intervalos de un turno; se pueden agregar desde varios hilos a la vez."""
+
+    def __init__(self):
+        self.trace_id = secrets.token_hex(16)
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def agregar(self, span: dict) -> None:
+        with self._lock:
+            self.spans.append(span)
+
+
+def _nuevo_span(nombre: str, categoria: str, padre, atributos: dict) -> dict:
+    return {
+        "name": nombre,
+        "spanId": secrets.token_hex(8),
+        "parentSpanId": padre or "",
+        "categoria": categoria,
+        "inicio": time.time_ns(),
+        "atributos": dict(atributos),
+        "error": None,
+    }
+
+
+def _cerrar_span(turno: _Turno, span: dict) -> None:
+    span["fin"] = time.time_ns()
+    turno.agregar(span)
+
+
+@contextmanager
+def span(nombre: str, categoria: str = "", **atributos):
+    """
+    Registra un intervalo dentro del turno actual. Devuelve un diccionario de
+    atributos que se puede completar mientras dura (p. ej. filas recibidas).
+    Fuera de un turno no registra nada y devuelve un diccionario descartable.
+    """
+    turno = _turno_actual.get()
+    if turno is None:
+        yield {}
+        return
+    actual = _nuevo_span(nombre, categoria, _span_actual.get(), atributos)
+    token = _span_actual.set(actual["spanId"])
+    try:
+        yield actual["atributos"]
+    except BaseException as e:
+        actual["error"] = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        try:
+            _span_actual.reset(token)
+        except ValueError:
+            # Un generador cerrado desde otro contexto: el intervalo vale igual.
+            pass
+        _cerrar_span(turno, actual)
+
+
+def trazar(nombre: str, categoria: str = ""):
+    """Decorador: registra cada llamada a la función como un intervalo."""
+    def decorador(func):
+        @functools.wraps(func)
+        def envoltura(*args, **kwargs):
+            with span(nombre, categoria):
+                return func(*args, **kwargs)
+        return envoltura
+    return decorador
+
+
+@contextmanager
+def turno(nombre: str, **atributos):
+    """
+    Abre un turno (una traza) y, al cerrarlo, lo exporta y lo resume. Si ya
+    hay un turno abierto se comporta como span(), para poder anidar llamadas.
+    """
+    if _turno_actual.get() is not None:
+        with span(nombre, **atributos) as atrs:
+            yield atrs
+        return
+    actual = _Turno()
+    token_turno = _turno_actual.set(actual)
+    try:
+        with span(nombre, "turno", **atributos) as atrs:
+            yield atrs
+    finally:
+        _turno_actual.reset(token_turno)
+        _exportar(actual)
+        _resumir(actual)
+
+
+def manejador_de_trazas():
+    """ManejadorTrazas para el turno actual, o None si no hay turno abierto."""
+    turno_abierto = _turno_actual.get()
+    if turno_abierto is None:
+        return None
+    return ManejadorTrazas(turno_abierto, _span_actual.get())
+
+
+class ManejadorTrazas(BaseCallbackHandler):
+    """Callback de LangChain que registra cada llamada al LLM con sus tokens."""
+
+    def __init__(self, turno_abierto: _Turno, padre: str = None):
+        self.turno = turno_abierto
+        self.padre = padre
+        self._abiertos = {}
+        self._lock = threading.Lock()
+
+    def _abrir(self, run_id, metadata) -> None:
+        modelo = (metadata or {}).get("ls_model_name", "")
+        with self._lock:
+            self._abiertos[run_id] = _nuevo_span("llm", "llm", self.padre, {"modelo": modelo})
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, metadata=None, **kwargs):
+        self._abrir(run_id, metadata)
+
+    def on_llm_start(self, serialized, prompts, *, run_id, metadata=None, **kwargs):
+        self._abrir(run_id, metadata)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        with self._lock:
+            actual = self._abiertos.pop(run_id, None)
+        if actual is None:
+            return
+        uso = {}
+        for generaciones in response.generations:
+            for generacion in generaciones:
+                mensaje = getattr(generacion, "message", None)
+                uso = getattr(mensaje, "usage_metadata", None) or uso
+                if getattr(mensaje, "tool_calls", None):
+                    actual["atributos"]["herramientas_pedidas"] = len(mensaje.tool_calls)
+        actual["atributos"]["tokens_entrada"] = uso.get("input_tokens", 0)
+        actual["atributos"]["tokens_salida"] = uso.get("output_tokens", 0)
+        _cerrar_span(self.turno, actual)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        with self._lock:
+            actual = self._abiertos.pop(run_id, None)
+        if actual is not None:
+            actual["error"] = f"{type(error).__name__}: {error}"
+            _cerrar_span(self.turno, actual)
+
+
+def _valor_otlp(valor) -> dict:
+    if isinstance(valor, bool):
+        return {"boolValue": valor}
+    if isinstance(valor, int):
+        return {"intValue": str(valor)}
+    if isinstance(valor, float):
+        return {"doubleValue": valor}
+    return {"stringValue": str(valor)}
+
+
+def _span_otlp(trace_id: str, span_registrado: dict) -> dict:
+    """Intervalo con los campos de un span de OpenTelemetry (formato JSON de OTLP)."""
+    atributos = dict(span_registrado["atributos"])
+    if span_registrado["categoria"]:
+        atributos["filemate.categoria"] = span_registrado["categoria"]
+    estado = {"code": 1}
+    if span_registrado["error"]:
+        estado = {"code": 2, "message": span_registrado["error"]}
+    return {
+        "traceId": trace_id,
+        "spanId": span_registrado["spanId"],
+        "parentSpanId": span_registrado["parentSpanId"],
+        "name": span_registrado["name"],
+        "kind": 1,
+        "startTimeUnixNano": str(span_registrado["inicio"]),
+        "endTimeUnixNano": str(span_registrado["fin"]),
+        "attributes": [{"key": k, "value": _valor_otlp(v)} for k, v in atributos.items()],
+        "status": estado,
+    }
+
+
+def _exportar(turno_cerrado: _Turno) -> None:
+    if not TRAZAS_ARCHIVO:
+        return
+    try:
+        lineas = [json.dumps(_span_otlp(turno_cerrado.trace_id, s), ensure_ascii=False)
+                  for s in turno_cerrado.spans]
+        carpeta = os.path.dirname(TRAZAS_ARCHIVO)
+        if carpeta:
+            os.makedirs(carpeta, exist_ok=True)
+        with _escritura_lock, open(TRAZAS_ARCHIVO, "a", encoding="utf-8") as f:
+            f.write("\n".join(lineas) + "\n")
+    except Exception as e:
+        print(f"Error al guardar las trazas: {e}")
+
+
+def _ms(span_registrado: dict) -> float:
+    return (span_registrado["fin"] - span_registrado["inicio"]) / 1e6
+
+
+def _resumir(turno_cerrado: _Turno) -> None:
+    raiz = next((s for s in turno_cerrado.spans if s["categoria"] == "turno"), None)
+    if raiz is None:
+        return
+    por_categoria = {categoria: 0.0 for categoria in CATEGORIAS}
+    tokens_entrada = tokens_salida = llamadas_llm = 0
+    for s in turno_cerrado.spans:
+        # Solo los intervalos de primer nivel de cada categoría, para no
+        # contar dos veces (p. ej. un escaneo dentro de aplicar cambios).
+        if s["categoria"] in por_categoria and not _anidado_en_misma_categoria(s, turno_cerrado.spans):
+            por_categoria[s["categoria"]] += _ms(s)
+        if s["categoria"] == "llm":
+            llamadas_llm += 1
+            tokens_entrada += s["atributos"].get("tokens_entrada", 0)
+            tokens_salida += s["atributos"].get("tokens_salida", 0)
+    with _resumenes_lock:
+        _resumenes.append({
+            "nombre": raiz["atributos"].get("comando", raiz["name"]),
+            "total_ms": _ms(raiz),
+            "por_categoria": por_categoria,
+            "llamadas_llm": llamadas_llm,
+            "tokens_entrada": tokens_entrada,
+            "tokens_salida": tokens_salida,
+            "error": raiz["error"],
+        })
+
+
+def _anidado_en_misma_categoria(span_registrado: dict, spans: list) -> bool:
+    padres = {s["spanId"]: s for s in spans}
+    padre = padres.get(span_registrado["parentSpanId"])
+    while padre is not None:
+        if padre["categoria"] == span_registrado["categoria"]:
+            return True
+        padre = padres.get(padre["parentSpanId"])
+    return False
+
+
+def _percentil(valores: list, p: float) -> float:
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    return ordenados[max(0, math.ceil(p * len(ordenados)) - 1)]
+
+
+def resumen() -> dict:
+    """
+    Resumen de los turnos recientes: percentiles del tiempo total, tiempo
+    medio por categoría (las herramientas en paralelo suman su tiempo),
+    tokens medios por turno y el último turno completo.
+    """
+    with _resumenes_lock:
+        turnos = list(_resumenes)
+    if not turnos:
+        return {"turnos": 0}
+    totales = [t["total_ms"] for t in turnos]
+    return {
+        "turnos": len(turnos),
+        "p50_ms": _percentil(totales, 0.5),
+        "p95_ms": _percentil(totales, 0.95),
+        "promedio_por_categoria_ms": {
+            categoria: sum(t["por_categoria"][categoria] for t in turnos) / len(turnos)
+            for categoria in CATEGORIAS
+        },
+        "tokens_entrada_promedio": sum(t["tokens_entrada"] for t in turnos) / len(turnos),
+        "tokens_salida_promedio": sum(t["tokens_salida"] for t in turnos) / len(turnos),
+        "ultimo": turnos[-1],
+    }
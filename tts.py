@@ -4,6 +4,7 @@ import os
 import requests
 import uuid
 from dotenv import load_dotenv
+from tracing import span
 
 class TTS():
     def __init__(self):
@@ -41,25 +42,28 @@ class TTS():
         # CAMBIO CLAVE: Usa un bloque try-except para la llamada a requests
         # y verifica el código de estado de la respuesta.
         # ---------------------------------------------------------------------
-        try:
-            response = requests.post(url, json=data, headers=headers, stream=True)
-            response.raise_for_status()  # Esto lanzará una excepción para códigos de error HTTP
+        with span("tts", "tts", caracteres=len(text)) as atributos:
+            try:
+                response = requests.post(url, json=data, headers=headers, stream=True)
+                response.raise_for_status()  # Esto lanzará una excepción para códigos de error HTTP
 
-            with open(file_path, 'wb') as f:
-                for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
-                    if chunk:
-                        f.write(chunk)
+                with open(file_path, 'wb') as f:
+                    for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                        if chunk:
+                            f.write(chunk)
             
-            # Devuelve la ruta completa del archivo si todo fue exitoso
-            return file_path
+                # Devuelve la ruta completa del archivo si todo fue exitoso
+                return file_path
 
-        except requests.exceptions.RequestException as e:
-            # Captura errores de conexión o de la API
-            error_message = f"Error al llamar a la API de Eleven Labs: {e}"
-            print(error_message)
-            return None  # Devuelve None si falla
+            except requests.exceptions.RequestException as e:
+                # Captura errores de conexión o de la API
+                error_message = f"Error al llamar a la API de Eleven Labs: {e}"
+                print(error_message)
+                atributos["error"] = str(e)
+                return None  # Devuelve None si falla
         
-        except Exception as e:
-            # Captura cualquier otro error
-            print(f"Ocurrió un error inesperado al procesar el audio: {e}")
-            return None
\ No newline at end of file
+            except Exception as e:
+                # Captura cualquier otro error
+                print(f"Ocurrió un error inesperado al procesar el audio: {e}")
+                atributos["error"] = str(e)
+                return None
\ No newline at end of file
@@ -1,13 +1,18 @@
 # voice_handler.py
 
+import contextvars
 import os
+import re
 import requests
 import uuid
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
+from tracing import trazar
 
 load_dotenv()
 ELEVENLABS_API_KEY = os.getenv("ELEVENLABS_API_KEY")
 
+@trazar("tts", "tts")
 def speak_response(text):
     CHUNK_SIZE = 1024
     url = "https://api.elevenlabs.io/v1/text-to-speech/EXAVITQu4vr4xnSDxMaL"
@@ -43,4 +48,98 @@ def speak_response(text):
                     f.write(chunk)
         return {"success": True, "file_path": file_path}
     else:
-        return {"success": False, "error": f"Error en la API: {response.text}"}
\ No newline at end of file
+        return {"success": False, "error": f"Error en la API: {response.text}"}
+
+# Fin de frase: signo de cierre seguido de espacio, o salto de línea.
+_FIN_DE_FRASE = re.compile(r"(?<=[.!?…])\s+|\n+")
+
+
+def _saltar_id3(datos: bytes) -> bytes:
+    """Quita la cabecera ID3v2 de un mp3 para poder unirlo a continuación de otro."""
+    if len(datos) >= 10 and datos[:3] == b"ID3":
+        tam = 10 + ((datos[6] & 0x7f) << 21 | (datos[7] & 0x7f) << 14 |
+                    (datos[8] & 0x7f) << 7 | (datos[9] & 0x7f))
+        return datos[tam:]
+    return datos
+
+
+def concatenar_mp3(rutas):
+    """
+    Une varios mp3 en uno solo (los tramos mp3 se pueden reproducir seguidos) y
+    borra los archivos parciales. Devuelve la ruta del archivo resultante.
+    """
+    if len(rutas) == 1:
+        return rutas[0]
+    file_path = os.path.join("static", f"response_{uuid.uuid4().hex}.mp3")
+    with open(file_path, "wb") as salida:
+        for i, ruta in enumerate(rutas):
+            with open(ruta, "rb") as f:
+                datos = f.read()
+            salida.write(datos if i == 0 else _saltar_id3(datos))
+    for ruta in rutas:
+        try:
+            os.remove(ruta)
+        except OSError:
+            pass
+    return file_path
+
+
+class LectorPorFrases:
+    """
+    Sintetiza una respuesta que llega por fragmentos: cada frase completa se
+    envía a ElevenLabs en segundo plano mientras el agente sigue escribiendo,
+    así el audio de la primera frase empieza a generarse sin esperar al resto.
+    """
+
+    def __init__(self, max_workers=2):
+        self._pendiente = ""
+        self._futuros = []
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="tts")
+
+    def agregar(self, fragmento):
+        """Añade texto y lanza la síntesis de las frases que quedaron completas."""
+        self._pendiente += fragmento
+        *frases, self._pendiente = _FIN_DE_FRASE.split(self._pendiente)
+        for frase in frases:
+            self._sintetizar(frase)
+
+    def _sintetizar(self, frase):
+        frase = frase.strip()
+        if frase:
+            # Con una copia del contexto, para que la síntesis quede en las trazas del turno.
+            contexto = contextvars.copy_context()
+            self._futuros.append(self._executor.submit(contexto.run, speak_response, frase))
+
+    def finalizar(self):
+        """
+        Sintetiza lo que quede pendiente, espera a todas las frases y devuelve
+        un único audio con el mismo formato que speak_response.
+        """
+        self._sintetizar(self._pendiente)
+        self._pendiente = ""
+        rutas, errores = [], []
+        try:
+            for futuro in self._futuros:
+                try:
+                    resultado = futuro.result()
+                except Exception as e:
+                    resultado = {"success": False, "error": str(e)}
+                if resultado["success"]:
+                    rutas.append(resultado["file_path"])
+                else:
+                    errores.append(resultado["error"])
+        finally:
+            self._executor.shutdown(wait=False)
+            self._futuros = []
+
+        if not rutas:
+            return {"success": False, "error": errores[0] if errores else "No hay texto para sintetizar"}
+        return {"success": True, "file_path": concatenar_mp3(rutas)}
+
+    def descartar(self):
+        """Cancela las frases que aún no empezaron a sintetizarse (p. ej. si la respuesta fue un error)."""
+        for futuro in self._futuros:
+            futuro.cancel()
+        self._executor.shutdown(wait=False)
+        self._futuros = []
+        self._pendiente = ""